@@ -4,15 +4,14 @@
 #
 from collections import OrderedDict
 from datetime import date, datetime
-import importlib
-import re
+import json
 
-from flask import abort
+from flask import abort, request, Response
 from flask_restplus import Resource
-from sqlalchemy.inspection import inspect
 from sqlalchemy.exc import IntegrityError
+from werkzeug.exceptions import HTTPException
 
-from rdr_server.dao.base_dao import BaseDao
+from rdr_server.dao.base_dao import BaseDao, BULK_BATCH_SIZE, COUNT_CACHE_TTL, DEFAULT_PAGE_SIZE
 from rdr_server.dao.exceptions import RecordNotFoundError
 from rdr_server.model.base_model import ModelMixin
 
@@ -26,6 +25,8 @@ def response_handler(func):
         try:
             return func(*args, **kwargs)
         # TODO: Log exceptions here, handle more exception types.
+        except HTTPException:
+            raise
         except IntegrityError:
             abort(409, 'duplicate')
         except RecordNotFoundError:
@@ -36,6 +37,13 @@ def response_handler(func):
     return f
 
 
+# Streaming response formats, selected with the 'stream' query parameter.
+STREAM_FORMATS = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+}
+
+
 def user_auth(f):
     """Checks whether user is logged in or raises error 401."""
 
@@ -80,8 +88,10 @@ class BaseDaoApi(Resource):
             # determine if this is a model object
             if isinstance(obj, ModelMixin):
 
+                # Use the same precompiled serializer for every record.
+                serializer = obj.get_serializer()
                 for rec in data:
-                    item = self.model_to_dict(rec)
+                    item = serializer.to_dict(rec)
                     results.append(item)
 
                 return results
@@ -119,6 +129,32 @@ class BaseDaoApi(Resource):
 
         return od
 
+    def stream_response(self, records, stream_format):
+        """
+        Return a response that writes the records to the client as they are read from the database,
+        either as a JSON array or as newline delimited JSON.
+        :param records: iterable of Result or Model records
+        :param stream_format: key in STREAM_FORMATS
+        :return: Response
+        """
+        if stream_format not in STREAM_FORMATS:
+            abort(400, 'invalid stream format')
+
+        def generate():
+            if stream_format == 'ndjson':
+                for rec in records:
+                    yield json.dumps(self.to_dict(rec), default=str) + '\n'
+                return
+
+            yield '['
+            sep = ''
+            for rec in records:
+                yield sep + json.dumps(self.to_dict(rec), default=str)
+                sep = ','
+            yield ']'
+
+        return Response(generate(), mimetype=STREAM_FORMATS[stream_format])
+
     def model_to_dict(self, model):
         """
         Converts a model to a dict
@@ -132,61 +168,109 @@ class BaseDaoApi(Resource):
 
     def dict_to_model(self, data):
         """
-        Take a dict from an API request and convert it into a model
+        Take a dict from an API request and convert it into model column values. The conversion
+        table is cached on the model class, so each field is a dict lookup.
         :param data: request payload data dict
-        :return: Model
+        :return: dict
         """
-        od = OrderedDict()
-        info = inspect(self.dao.model())
-        mod = None
-
-        for key, value in data.items():
-            # Find out what class types are associated with this column.
-            class_str = str(info.mapper.columns[key].base_columns)
-
-            # If ModelEnum is found, convert string value to Enum value.
-            if 'ModelEnum' in class_str:
-                match = re.match('.*?, ModelEnum\((.*?)\).*', class_str)
-                enum_name = match.groups()[0]
-
-                if mod is None:
-                    mod = importlib.import_module('rdr_server.common.enums')
+        return self.dao.model.get_serializer().from_dict(data)
 
-                # TODO: Create new Exception and raise it if this fails.
-                enum = eval('mod.{0}'.format(enum_name))
+    def item_to_model(self, item):
+        """
+        Convert a record from the request payload to model column values, dropping the fields managed by
+        the server.
+        :param item: request payload record
+        :return: dict
+        """
+        if not isinstance(item, dict):
+            abort(400, 'invalid payload')
 
-                od[key] = enum[value]
-            else:
-                # We don't worry about Date or DateTime values, the UTCDateTime decorator
-                # takes care of it.
-                od[key] = value
+        item = {key: value for key, value in item.items() if key not in ('pkId', 'created', 'modified')}
+        try:
+            return self.dict_to_model(item)
+        except (KeyError, ValueError) as e:
+            abort(400, 'invalid field or value: {0}'.format(e))
 
-        return od
+    def payload_to_model(self):
+        """
+        Convert the request payload to model column values, dropping the fields managed by the server.
+        :return: dict
+        """
+        return self.item_to_model(request.get_json())
 
 
 class BaseApiCount(BaseDaoApi):
+    """
+    Return the number of records in the model. The 'mode' query parameter selects how the records
+    are counted: 'exact', 'approximate' (table statistics) or 'cached' (exact count kept for
+    count_cache_ttl seconds).
+    """
+    # Count modes allowed for this endpoint, and the mode used if none is given in the request.
+    count_modes = ('exact', 'approximate', 'cached')
+    default_count_mode = 'exact'
+    count_cache_ttl = COUNT_CACHE_TTL
 
+    @response_handler
     def get(self):
         """
-        Return the count of all recors in the table
+        Return the count of all records in the table
         :return: integer
         """
-        return {'count': self.dao.count()}, 200
+        mode = request.args.get('mode', self.default_count_mode)
+        if mode not in self.count_modes:
+            abort(400, 'invalid count mode')
+
+        if mode == 'approximate':
+            count = self.dao.approximate_count()
+        elif mode == 'cached':
+            count = self.dao.cached_count(self.count_cache_ttl)
+        else:
+            count = self.dao.count()
+
+        return {'count': count, 'mode': mode}, 200
 
 
 class BaseApiList(BaseDaoApi):
     """
-    Return a all records in the model
+    Return the records in the model, one page at a time
     """
 
+    def get_page_args(self):
+        """
+        Return the paging arguments from the request query string
+        :return: tuple of (page token, page size)
+        """
+        page_token = request.args.get('pageToken', None)
+        page_size = request.args.get('pageSize', DEFAULT_PAGE_SIZE)
+        try:
+            page_size = int(page_size)
+        except ValueError:
+            abort(400, 'invalid page size')
+        return page_token, page_size
+
+    @response_handler
     def get(self):
         """
-        Return all the records from the table
-        :return: return list
+        Return a page of records from the table. Pass the returned 'nextPageToken' value as the
+        'pageToken' query parameter to fetch the next page. If the 'stream' query parameter is set,
+        all records are streamed instead in the requested format.
+        :return: dict with the page records and the next page token
         """
-        data = self.dao.list()
-        response = self.to_dict(data)
-        return response
+        stream_format = request.args.get('stream', None)
+        if stream_format:
+            return self.stream_response(self.dao.stream(), stream_format)
+
+        page_token, page_size = self.get_page_args()
+        try:
+            data, next_token = self.dao.list_page(page_token, page_size)
+        except ValueError as e:
+            abort(400, str(e))
+
+        response = {
+            'items': self.to_dict(data) if data else list(),
+            'nextPageToken': next_token
+        }
+        return response, 200
 
 
 class BaseApiSync(BaseDaoApi):
@@ -194,22 +278,100 @@ class BaseApiSync(BaseDaoApi):
     Return the base model fields
     """
 
+    def get_changes(self):
+        """
+        Return the records changed after the 'since' watermark, at most 'limit' records
+        :return: dict with the records, the watermark for the next request and a flag set when there
+                 are more changes
+        """
+        limit = request.args.get('limit', DEFAULT_PAGE_SIZE)
+        try:
+            limit = int(limit)
+        except ValueError:
+            abort(400, 'invalid limit')
+        try:
+            data, watermark, more = self.dao.changes_since(request.args.get('since', None), limit)
+        except ValueError as e:
+            abort(400, str(e))
+
+        response = {
+            'items': self.to_dict(data) if data else list(),
+            'nextWatermark': watermark,
+            'more': more
+        }
+        return response, 200
+
+    @response_handler
     def get(self):
         """
-        Return the basic record information for all records.
+        Return the basic record information for all records. If the 'stream' query parameter is
+        set, records are streamed in the requested format. If 'since' or 'limit' is set, only the
+        records changed after the 'since' watermark are returned.
         :return: return list
         """
+        if 'since' in request.args or 'limit' in request.args:
+            return self.get_changes()
+
+        stream_format = request.args.get('stream', None)
+        if stream_format:
+            return self.stream_response(self.dao.stream_base_fields(), stream_format)
+
         data = self.dao.base_fields()
         response = self.to_dict(data)
         return response
 
 
 class BaseApiPut(BaseDaoApi):
-    pass
+    """
+    Handle PUT operations using the primary key id
+    """
+
+    def put(self, pk_id):
+        """
+        Replace the record with the request payload
+        :param pk_id: primary key id
+        :return: the updated record
+        """
+        rec = self.dao.model(**self.payload_to_model())
+        rec.pkId = pk_id
+        rec = self.dao.update(rec)
+        return self.to_dict(rec), 200
 
 
 class BaseApiPost(BaseDaoApi):
-    pass
+    """
+    Handle POST operations creating a new record
+    """
+
+    def post(self):
+        """
+        Insert the request payload as a new record
+        :return: the new record
+        """
+        rec = self.dao.model(**self.payload_to_model())
+        rec = self.dao.insert(rec)
+        return self.to_dict(rec), 201
+
+
+class BaseApiBatchPost(BaseDaoApi):
+    """
+    Handle POST operations inserting a list of records
+    """
+    batch_size = BULK_BATCH_SIZE
+
+    def post(self):
+        """
+        Insert the list of records in the request payload. The primary key ids of the new records
+        are generated by the database in bulk and are not returned, see BaseDao.bulk_insert().
+        :return: dict with the number of records inserted
+        """
+        payload = request.get_json()
+        if not isinstance(payload, list):
+            abort(400, 'payload must be a list of records')
+
+        rows = [self.item_to_model(item) for item in payload]
+        self.dao.bulk_insert(rows, self.batch_size)
+        return {'count': len(rows)}, 201
 
 
 class BaseApiGetId(BaseDaoApi):
@@ -230,8 +392,6 @@ class BaseApiDeleteId(BaseDaoApi):
     """
 
     def delete(self, pk_id):
-        rec = self.dao.get_by_id(pk_id)
-        if not rec:
-            raise RecordNotFoundError()
+        # delete_by_id() raises RecordNotFoundError if there was no record to delete.
         self.dao.delete_by_id(pk_id)
         return {'pkId': pk_id}, 200
@@ -5,7 +5,7 @@
 from flask_restplus import Namespace
 
 from rdr_server.api.base_api import BaseApiCount, BaseApiList, BaseApiSync, BaseApiGetId, BaseApiDeleteId, \
-    BaseApiPost, BaseApiPut, response_handler
+    BaseApiPost, BaseApiPut, BaseApiBatchPost, response_handler
 from rdr_server.dao.base_dao import BaseDao
 from rdr_server.model.calendar import Calendar, CalendarApiSchema
 
@@ -14,18 +14,25 @@ api.models[CalendarApiSchema.name] = CalendarApiSchema
 
 
 @api.route('/count')
+@api.doc(params={'mode': 'Count mode: exact (default), approximate or cached'})
 class CalendarApiCount(BaseApiCount):
 
     dao = BaseDao(Calendar)
 
 
 @api.route('/sync')
+@api.doc(params={'stream': 'Stream all records as a JSON array (json) or newline delimited JSON (ndjson)',
+                 'since': 'Watermark returned as nextWatermark by the previous request, or an ISO 8601 timestamp',
+                 'limit': 'Number of changed records to return, defaults to 100'})
 class CalendarApiSync(BaseApiSync):
 
     dao = BaseDao(Calendar)
 
 
 @api.route('/')
+@api.doc(params={'pageToken': 'Token returned as nextPageToken by the previous page',
+                 'pageSize': 'Number of records to return, defaults to 100',
+                 'stream': 'Stream all records as a JSON array (json) or newline delimited JSON (ndjson)'})
 class CalendarApiList(BaseApiList):
 
     dao = BaseDao(Calendar)
@@ -55,17 +62,19 @@ class CalendarApiPost(BaseApiPost):
     @api.marshal_with(CalendarApiSchema, skip_none=True)
     @response_handler
     def post(self):
-        calendar = Calendar(**api.payload)
+        return super(CalendarApiPost, self).post()
 
-        with self.dao.session() as session:
-            session.add(calendar)
-            session.commit()
 
-            # reload calendar record
-            calendar = self.dao.get_by_id(calendar.pkId)
+@api.route('/batch')
+class CalendarApiBatchPost(BaseApiBatchPost):
 
-            data = self.to_dict(calendar)
-            return data, 201
+    dao = BaseDao(Calendar)
+
+    @api.doc('create_calendar_batch')
+    @api.expect([CalendarApiSchema])
+    @response_handler
+    def post(self):
+        return super(CalendarApiBatchPost, self).post()
 
 
 @api.route('/<int:pkId>/update')
@@ -79,18 +88,7 @@ class CalendarApiPut(BaseApiPut):
     @api.marshal_with(CalendarApiSchema, skip_none=True)
     @response_handler
     def put(self, pkId):
-
-        calendar = Calendar(**api.payload)
-        calendar.pkId = pkId
-
-        with self.dao.session() as session:
-            session.add(calendar)
-            session.commit()
-
-            # reload calendar record
-            calendar = self.dao.get_by_id(calendar.pkId)
-
-            return self.to_dict(calendar), 200
+        return super(CalendarApiPut, self).put(pkId)
 
 
 @api.route('/<int:pkId>/delete')
@@ -2,13 +2,16 @@
 # This file is subject to the terms and conditions defined in the
 # file 'LICENSE', which is part of this source code package.
 #
-import json
-import requests
+from flask import abort, request
 from flask_restplus import Namespace, Resource
 
-_CODEBOOK_URL_BASE = 'https://raw.githubusercontent.com/all-of-us-terminology/codebook-to-fhir/'
-_CODEBOOK_ERRORS_URL = _CODEBOOK_URL_BASE + 'gh-pages/CodeSystem/ppi.issues.json'
-_CODEBOOK_URL = _CODEBOOK_URL_BASE + 'gh-pages/CodeSystem/ppi.json'
+from rdr_server.dao.base_dao import DEFAULT_PAGE_SIZE
+from rdr_server.dao.cache import cache_stats
+from rdr_server.dao.codebook_import import CodeBookConflictError, CodeBookImporter
+from rdr_server.dao.codebook_source import CodeBookSourceError, get_codebook_source
+from rdr_server.dao.log_position import ChangeLogService
+from rdr_server.dao.metrics_cache import MetricsCacheBuilder
+from rdr_server.dao.participant_summary_queue import ParticipantSummaryQueueWorker, REQUEST_MAX_BATCHES
 
 api = Namespace('internal', description='Internal related operations')
 
@@ -18,17 +21,83 @@ api = Namespace('internal', description='Internal related operations')
 class CodeBook(Resource):
     def post(self):
 
-        resp = {}
+        # The source is set with the CODEBOOK_SOURCE environment variable, it may be a URL, a local
+        # file or a fixture directory. Defaults to the published code book.
+        importer = CodeBookImporter()
+        try:
+            source = get_codebook_source()
+            content_hash = source.fingerprint()
+
+            # Skip the download and import if the code book has not changed since the last import.
+            latest = importer.get_latest()
+            if latest and latest.contentHash == content_hash:
+                return {'published_version': latest.version, 'active_version': latest.version,
+                        'imported': False}
+
+            cb = source.read()
+        except CodeBookSourceError as e:
+            return {'error_messages': [{'error': str(e)}]}
+
+        try:
+            result = importer.run(cb, content_hash)
+        except (KeyError, TypeError, ValueError) as e:
+            abort(400, 'invalid code book: {0}'.format(e))
+        except CodeBookConflictError as e:
+            abort(409, str(e))
+
+        resp = {
+            'published_version': result['version'],
+            'active_version': result['version'],
+        }
+        resp.update(result)
+        return resp
+
+
+@api.route('/CacheStats')
+@api.hide
+class CacheStats(Resource):
+    def get(self):
+        return cache_stats()
+
 
+@api.route('/ProcessSummaryQueue')
+@api.hide
+class ProcessSummaryQueue(Resource):
+    def post(self):
+        # Recompute the summaries of participants queued by writes to the summary source tables. Stops
+        # after REQUEST_MAX_BATCHES batches, the rest of the queue is left for the next request.
+        return ParticipantSummaryQueueWorker().drain(REQUEST_MAX_BATCHES)
+
+
+@api.route('/RefreshMetricsCache')
+@api.hide
+@api.doc(params={'full': 'Rebuild every HPO instead of only the HPOs with changes'})
+class RefreshMetricsCache(Resource):
+    def post(self):
+        # Write a new metrics cache generation and remove the generations before the previous one.
+        builder = MetricsCacheBuilder()
+        full = request.args.get('full', 'false').lower() == 'true'
+        counts = builder.build() if full else builder.refresh()
+        builder.delete_old_generations()
+        return counts
+
+
+@api.route('/ChangeLog')
+@api.hide
+@api.doc(params={'since': 'Last log position already read, defaults to 0',
+                 'limit': 'Number of changes to return, defaults to 100'})
+class ChangeLog(Resource):
+    def get(self):
+        # Return the participant data records written after the 'since' log position, in log position
+        # order. Pass 'nextPosition' as 'since' to read the following changes.
         try:
-            req = requests.get(_CODEBOOK_URL)
-        except Exception as e:
-            return {'error_messages': [{'error': e}]}
-
-        if req.status_code == 200:
-            cb = req.json()
-            resp['published_version'] = cb['version']
-            resp['active_version'] = 'unknown'
-            return resp
-        else:
-            return {'error_messages': [{'error': 'failed to retrieve current codebook.'}]}
+            position = int(request.args.get('since', 0))
+            limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+            changes, next_position = ChangeLogService().changes_since(position, limit)
+        except ValueError as e:
+            abort(400, str(e))
+
+        return {
+            'items': [change._asdict() for change in changes],
+            'nextPosition': next_position
+        }
@@ -0,0 +1,45 @@
+#
+# This file is subject to the terms and conditions defined in the
+# file 'LICENSE', which is part of this source code package.
+#
+from datetime import date
+
+from flask import abort, request
+from flask_restplus import Namespace, Resource
+
+from rdr_server.api.base_api import response_handler
+from rdr_server.dao.metrics_cache_reader import get_metrics_cache_reader
+
+api = Namespace('metrics', description='Metrics related operations')
+
+
+@api.route('/cache/<string:metric>')
+@api.doc(params={'metric': 'enrollment, race, gender or age',
+                 'hpoIds': 'Comma separated list of HPO ids, defaults to all HPOs',
+                 'startDate': 'First day, YYYY-MM-DD',
+                 'endDate': 'Last day, YYYY-MM-DD',
+                 'period': 'day, week or month, defaults to day'})
+class MetricsCacheApi(Resource):
+
+    @response_handler
+    def get(self, metric):
+        """
+        Return the daily counts of a metric from the latest metrics cache generation. Week and month
+        periods return the counts on the last day of each period.
+        :param metric: metric name
+        :return: dict with the counts of each HPO
+        """
+        try:
+            hpo_ids = request.args.get('hpoIds', None)
+            start_date = request.args.get('startDate', None)
+            end_date = request.args.get('endDate', None)
+            response = get_metrics_cache_reader().get_metrics(
+                metric,
+                hpo_ids=hpo_ids.split(',') if hpo_ids else None,
+                start_date=date.fromisoformat(start_date) if start_date else None,
+                end_date=date.fromisoformat(end_date) if end_date else None,
+                period=request.args.get('period', 'day'))
+        except ValueError as e:
+            abort(400, str(e))
+
+        return response, 200
@@ -0,0 +1,44 @@
+#
+# This file is subject to the terms and conditions defined in the
+# file 'LICENSE', which is part of this source code package.
+#
+from flask import abort, request
+from flask_restplus import Namespace
+
+from rdr_server.api.base_api import BaseApiList, response_handler
+from rdr_server.dao.participant_summary import ParticipantSummaryDao
+from rdr_server.dao.participant_summary_search import ParticipantSummarySearch
+
+api = Namespace('participant_summary', description='Participant summary related operations')
+
+
+@api.route('/search')
+@api.doc(params={'awardee': 'HPO name, filters on hpoId',
+                 '_sort': 'Sort field, prefix with - for descending order',
+                 '_fields': 'Comma separated list of fields to return',
+                 'pageToken': 'Token returned as nextPageToken by the previous page',
+                 'pageSize': 'Number of records to return, defaults to 100'})
+class ParticipantSummaryApiSearch(BaseApiList):
+
+    dao = ParticipantSummaryDao()
+
+    @response_handler
+    def get(self):
+        """
+        Search participant summaries. Other query parameters are filters on indexed fields, integer and
+        date fields accept a lt, le, gt or ge prefix on the value. Only filter and sort combinations
+        backed by an index are accepted.
+        :return: dict with the page records and the next page token
+        """
+        page_token, page_size = self.get_page_args()
+        try:
+            search = ParticipantSummarySearch.from_args(request.args)
+            items, next_token = search.execute(page_token, page_size)
+        except ValueError as e:
+            abort(400, str(e))
+
+        response = {
+            'items': items,
+            'nextPageToken': next_token
+        }
+        return response, 200
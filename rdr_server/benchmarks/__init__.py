@@ -0,0 +1,8 @@
+#
+# This file is subject to the terms and conditions defined in the
+# file 'LICENSE', which is part of this source code package.
+#
+
+#
+# Benchmark scripts. These do not need a database, run them with "python -m rdr_server.benchmarks.<name>".
+#
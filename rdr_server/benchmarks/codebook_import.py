@@ -0,0 +1,109 @@
+#
+# This file is subject to the terms and conditions defined in the
+# file 'LICENSE', which is part of this source code package.
+#
+
+#
+# Time parsing and diffing a synthetic code book against the existing codes, and report the number
+# of write statements the import would run.
+#
+#   python -m rdr_server.benchmarks.codebook_import --codes 50000 --changed 0.05
+#
+import argparse
+import random
+import time
+
+from rdr_server.common.code_constants import PPI_SYSTEM
+from rdr_server.dao.base_dao import BULK_BATCH_SIZE
+from rdr_server.dao.code_cache import CodeInfo
+from rdr_server.dao.codebook_import import iter_codebook_concepts, plan_codebook_import
+
+
+def _concept(value, concept_type, children=None):
+    concept = {
+        'code': value,
+        'display': 'Display text for {0}'.format(value),
+        'property': [
+            {'code': 'concept-type', 'valueCode': concept_type},
+            {'code': 'concept-topic', 'valueCode': 'Topic'},
+        ]
+    }
+    if children:
+        concept['concept'] = children
+    return concept
+
+
+def make_codebook(codes, version):
+    """
+    Create a FHIR CodeSystem with about the given number of codes, 10 answers per question and 100
+    questions per module.
+    """
+    modules = list()
+    count = 0
+    module_index = 0
+
+    while count < codes:
+        questions = list()
+        for q in range(100):
+            answers = [_concept('M{0}_Q{1}_A{2}'.format(module_index, q, a), 'Answer') for a in range(10)]
+            questions.append(_concept('M{0}_Q{1}'.format(module_index, q), 'Question', answers))
+            count += 11
+        modules.append(_concept('M{0}'.format(module_index), 'Module Name', questions))
+        count += 1
+        module_index += 1
+
+    return {'resourceType': 'CodeSystem', 'url': PPI_SYSTEM, 'name': 'PPI', 'version': version, 'concept': modules}
+
+
+def make_existing(codebook, changed, rnd):
+    """
+    Build the existing code index from a code book, with a fraction of the codes changed and 5% of
+    them missing so they will be inserted.
+    """
+    plan = plan_codebook_import(iter_codebook_concepts(codebook), dict(), 1, 1)
+    existing = dict()
+
+    for row in plan.inserts:
+        roll = rnd.random()
+        if roll < 0.05:
+            continue
+        display = row['display'] + ' (old)' if roll < 0.05 + changed else row['display']
+        code = CodeInfo(row['codeId'], row['system'], row['value'], row['shortValue'], display, row['topic'],
+                        row['codeType'], True, 1, row['parentId'])
+        existing[(code.system, code.value.lower())] = code
+
+    return existing
+
+
+def run(codes, changed, batch_size):
+    rnd = random.Random(1)
+    codebook = make_codebook(codes, 'v2')
+    existing = make_existing(codebook, changed, rnd)
+    next_code_id = max(code.codeId for code in existing.values()) + 1
+
+    start = time.perf_counter()
+    plan = plan_codebook_import(iter_codebook_concepts(codebook), existing, 2, next_code_id)
+    elapsed = time.perf_counter() - start
+
+    summary = plan.summary()
+    total = sum(summary.values())
+    statements = sum((count + batch_size - 1) // batch_size for count in (
+        len(plan.inserts), len(plan.updates), len(plan.unchanged), len(plan.inserts) + len(plan.updates)))
+
+    print('code book: {0} codes, {1} existing'.format(total, len(existing)))
+    print('  parse + diff     : {0:.3f} sec ({1:,.0f} codes/sec)'.format(elapsed, total / elapsed))
+    print('  inserted         : {0}'.format(summary['inserted']))
+    print('  updated          : {0}'.format(summary['updated']))
+    print('  unchanged        : {0}'.format(summary['unchanged']))
+    print('  write statements : {0} (batch size {1}), vs {2} for row at a time writes'.format(
+        statements, batch_size, total + summary['inserted'] + summary['updated']))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Code book import benchmark')
+    parser.add_argument('--codes', help='number of codes in the code book', type=int, default=50000)
+    parser.add_argument('--changed', help='fraction of existing codes that changed', type=float, default=0.05)
+    parser.add_argument('--batch-size', help='rows per write statement', type=int, default=BULK_BATCH_SIZE)
+    args = parser.parse_args()
+
+    run(args.codes, args.changed, args.batch_size)
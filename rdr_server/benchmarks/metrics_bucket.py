@@ -0,0 +1,73 @@
+#
+# This file is subject to the terms and conditions defined in the
+# file 'LICENSE', which is part of this source code package.
+#
+
+#
+# Compare the size, encode time and aggregation time of JSON and binary MetricsBucket payloads, for
+# a year of daily buckets across all HPOs.
+#
+#   python -m rdr_server.benchmarks.metrics_bucket --days 365 --hpos 50
+#
+import argparse
+import json
+import random
+import timeit
+
+from rdr_server.common.metrics_bucket import aggregate_buckets, encode_bucket, METRIC_NAMES
+
+
+def make_buckets(days, hpos, seed=1):
+    """
+    Create the metrics of every HPO and day. About a third of the metrics are zero, as in HPOs without
+    participants in some age ranges or races.
+    """
+    rnd = random.Random(seed)
+    buckets = list()
+    for _ in range(days * hpos):
+        buckets.append({name: rnd.randint(1, 50000) for name in METRIC_NAMES if rnd.random() < 0.66})
+    return buckets
+
+
+def json_aggregate(payloads):
+    totals = dict()
+    for payload in payloads:
+        for name, count in json.loads(payload).items():
+            totals[name] = totals.get(name, 0) + count
+    return totals
+
+
+def run(days, hpos, repeat):
+    buckets = make_buckets(days, hpos)
+    formats = [
+        ('JSON', lambda b: json.dumps(b).encode('utf-8'), json_aggregate),
+        ('binary', encode_bucket, aggregate_buckets),
+        ('binary + zlib', lambda b: encode_bucket(b, compress=True), aggregate_buckets),
+    ]
+
+    print('{0} buckets ({1} days x {2} HPOs), {3} metric names'.format(len(buckets), days, hpos, len(METRIC_NAMES)))
+    expected = None
+    for name, encode, aggregate in formats:
+        payloads = [encode(b) for b in buckets]
+        totals = aggregate(payloads)
+        # Every format must sum to the same totals before timing them.
+        assert expected is None or totals == expected
+        expected = totals
+
+        encode_time = min(timeit.repeat(lambda: [encode(b) for b in buckets], number=1, repeat=repeat))
+        aggregate_time = min(timeit.repeat(lambda: aggregate(payloads), number=1, repeat=repeat))
+        size = sum(len(p) for p in payloads)
+        print('  {0:<14}: {1:>10,} bytes ({2:>5.0f} per bucket), encode {3:>10,.0f} buckets/sec, '
+              'aggregate {4:>10,.0f} buckets/sec'.format(name, size, size / len(payloads),
+                                                         len(buckets) / encode_time,
+                                                         len(buckets) / aggregate_time))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Metrics bucket payload benchmark')
+    parser.add_argument('--days', help='number of days', type=int, default=365)
+    parser.add_argument('--hpos', help='number of HPOs', type=int, default=50)
+    parser.add_argument('--repeat', help='number of timing runs', type=int, default=3)
+    args = parser.parse_args()
+
+    run(args.days, args.hpos, args.repeat)
@@ -0,0 +1,117 @@
+#
+# This file is subject to the terms and conditions defined in the
+# file 'LICENSE', which is part of this source code package.
+#
+
+#
+# Time accumulating the metrics cache counts of a synthetic participant population in one pass, and
+# compare it with counting every day separately, which is what a GROUP BY query per day does.
+#
+#   python -m rdr_server.benchmarks.metrics_cache --participants 1000000 --days 730
+#
+import argparse
+import random
+import time
+from datetime import date, datetime, timedelta
+
+from rdr_server.common.enums import Race
+from rdr_server.dao.metrics_cache import MetricsCacheAccumulator, ParticipantMetrics, RACE_FIELDS, \
+    _age_bucket, AGE_BUCKETS
+
+GENDERS = ['Man', 'Woman', 'Non-Binary', 'Transgender', 'Other', 'PMI_Skip', 'UNSET']
+
+
+def make_participants(count, days, hpos=20, seed=1):
+    """
+    Create participants signing up over the given number of days, with about 80% reaching member
+    status and 50% reaching core status.
+    """
+    rnd = random.Random(seed)
+    start = datetime(2018, 1, 1)
+    races = list(Race)
+    participants = list()
+
+    for _ in range(count):
+        sign_up = start + timedelta(seconds=rnd.randint(0, days * 86400 - 1))
+        member = sign_up + timedelta(days=rnd.randint(0, 30)) if rnd.random() < 0.8 else None
+        core = member + timedelta(days=rnd.randint(0, 60)) if member and rnd.random() < 0.6 else None
+        participants.append((ParticipantMetrics(
+            hpoId=rnd.randint(1, hpos),
+            signUpTime=sign_up,
+            enrollmentStatusMemberTime=member,
+            enrollmentStatusCoreStoredSampleTime=core,
+            race=rnd.choice(races),
+            genderIdentityId=None,
+            dateOfBirth=date(1930, 1, 1) + timedelta(days=rnd.randint(0, 30000)) if rnd.random() < 0.95 else None
+        ), rnd.choice(GENDERS)))
+
+    return start.date(), participants
+
+
+def one_pass(start, days, participants):
+    accumulator = MetricsCacheAccumulator(start, start + timedelta(days=days - 1))
+    for participant, gender in participants:
+        accumulator.add(participant, gender)
+    return accumulator.get_counts()
+
+
+def per_day(start, days, participants):
+    """
+    Count each day with a separate scan of every participant.
+    """
+    counts = dict()
+    for index in range(days):
+        day = start + timedelta(days=index)
+        for p, gender in participants:
+            if p.signUpTime.date() > day:
+                continue
+            series = counts.setdefault(p.hpoId, dict())
+            if p.enrollmentStatusCoreStoredSampleTime and p.enrollmentStatusCoreStoredSampleTime.date() <= day:
+                state = 'coreCount'
+            elif p.enrollmentStatusMemberTime and p.enrollmentStatusMemberTime.date() <= day:
+                state = 'consentedCount'
+            else:
+                state = 'registeredCount'
+            age = AGE_BUCKETS[_age_bucket(p.dateOfBirth, day)] if p.dateOfBirth else 'UNSET'
+            for key in (('enrollment', state), ('race', RACE_FIELDS[p.race]), ('gender', gender), ('age', age)):
+                series.setdefault(key, [0] * days)[index] += 1
+    return counts
+
+
+def run(participants, days, per_day_participants):
+    start, population = make_participants(participants, days)
+
+    # Make sure both implementations count the same values before timing them.
+    sample = population[:per_day_participants]
+    expected = per_day(start, days, sample)
+    counts = one_pass(start, days, sample)
+    for hpo_id, series in expected.items():
+        for key, values in series.items():
+            assert counts[hpo_id][key] == values, key
+    begin = time.perf_counter()
+    per_day(start, days, sample)
+    per_day_time = time.perf_counter() - begin
+
+    begin = time.perf_counter()
+    counts = one_pass(start, days, population)
+    one_pass_time = time.perf_counter() - begin
+    series = sum(len(s) for s in counts.values())
+
+    print('{0} participants, {1} days, {2} HPO series'.format(participants, days, series))
+    print('  one pass         : {0:>8.2f} sec, {1:>12,.0f} participants/sec'.format(
+        one_pass_time, participants / one_pass_time))
+    print('  scan per day     : {0:>8.2f} sec, {1:>12,.0f} participants/sec ({2} participant sample)'.format(
+        per_day_time, per_day_participants / per_day_time, per_day_participants))
+    speedup = (per_day_time / per_day_participants) / (one_pass_time / participants)
+    print('  speedup          : {0:.0f}x'.format(speedup))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Metrics cache builder benchmark')
+    parser.add_argument('--participants', help='number of participants', type=int, default=1000000)
+    parser.add_argument('--days', help='number of days of sign ups', type=int, default=730)
+    parser.add_argument('--per-day-participants', help='number of participants for the per day scan',
+                        type=int, default=2000)
+    args = parser.parse_args()
+
+    run(args.participants, args.days, args.per_day_participants)
@@ -0,0 +1,114 @@
+#
+# This file is subject to the terms and conditions defined in the
+# file 'LICENSE', which is part of this source code package.
+#
+
+#
+# Compare rows/sec of the precompiled ModelSerializer against the previous inspect() per row
+# ModelMixin.to_dict() implementation, using ParticipantSummary records.
+#
+#   python -m rdr_server.benchmarks.model_serializer --rows 20000
+#
+import argparse
+import random
+import timeit
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import inspect
+from sqlalchemy.types import Boolean, Date, DateTime, Float, Integer, String, TypeDecorator
+
+# Importing the database module makes sure every model is mapped.
+import rdr_server.model.base_database  # noqa: F401
+from rdr_server.model.base_model import ModelEnum
+from rdr_server.model.participant_summary import ParticipantSummary
+
+
+def legacy_to_dict(obj):
+    """
+    The previous ModelMixin.to_dict() implementation, inspecting the object for every row.
+    """
+    data = OrderedDict()
+    mapper = inspect(obj)
+
+    for column in mapper.attrs:
+        key = str(column.key)
+        value = getattr(obj, key)
+
+        if isinstance(value, (datetime, date)):
+            data[key] = value.isoformat()
+        elif hasattr(value, 'name') and hasattr(value, 'value'):
+            data[key] = value.name
+        else:
+            data[key] = value
+
+    return data
+
+
+def make_value(col_type, rnd):
+    """
+    Return a random value suitable for the column type
+    """
+    if isinstance(col_type, ModelEnum):
+        return rnd.choice(list(col_type.enum_type))
+    if isinstance(col_type, TypeDecorator):
+        col_type = col_type.impl
+    if isinstance(col_type, DateTime):
+        return datetime(2018, 1, 1) + timedelta(seconds=rnd.randint(0, 30000000))
+    if isinstance(col_type, Date):
+        return date(1950, 1, 1) + timedelta(days=rnd.randint(0, 20000))
+    if isinstance(col_type, Boolean):
+        return rnd.choice([True, False])
+    if isinstance(col_type, Integer):
+        return rnd.randint(0, 100000)
+    if isinstance(col_type, Float):
+        return rnd.random()
+    if isinstance(col_type, String):
+        return 'value{0}'.format(rnd.randint(0, 100000))
+    return None
+
+
+def make_records(count, seed=1):
+    """
+    Create transient ParticipantSummary objects with every column populated
+    """
+    rnd = random.Random(seed)
+    props = inspect(ParticipantSummary).column_attrs
+    records = list()
+
+    for x in range(count):
+        values = {prop.key: make_value(prop.columns[0].type, rnd) for prop in props}
+        values['pkId'] = x + 1
+        records.append(ParticipantSummary(**values))
+
+    return records
+
+
+def run(rows, repeat):
+    records = make_records(rows)
+    columns = len(inspect(ParticipantSummary).column_attrs)
+
+    # Make sure both implementations produce the same column values before timing them. The legacy
+    # version also returns relationship attributes, which the serializer skips.
+    legacy_data = legacy_to_dict(records[0])
+    for key, value in records[0].to_dict().items():
+        assert legacy_data[key] == value
+
+    legacy = min(timeit.repeat(lambda: [legacy_to_dict(r) for r in records], number=1, repeat=repeat))
+    serializer = ParticipantSummary.get_serializer()
+    compiled = min(timeit.repeat(lambda: [serializer.to_dict(r) for r in records], number=1,
+                                 repeat=repeat))
+
+    print('ParticipantSummary: {0} rows, {1} columns'.format(rows, columns))
+    print('  inspect() per row      : {0:>10,.0f} rows/sec'.format(rows / legacy))
+    print('  precompiled serializer : {0:>10,.0f} rows/sec'.format(rows / compiled))
+    print('  speedup                : {0:.1f}x'.format(legacy / compiled))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Model serializer benchmark')
+    parser.add_argument('--rows', help='number of rows to serialize', type=int, default=10000)
+    parser.add_argument('--repeat', help='number of timing runs', type=int, default=3)
+    args = parser.parse_args()
+
+    run(args.rows, args.repeat)
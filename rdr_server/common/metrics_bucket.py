@@ -0,0 +1,241 @@
+#
+# This file is subject to the terms and conditions defined in the
+# file 'LICENSE', which is part of this source code package.
+#
+
+#
+# Binary format of the MetricsBucket.metrics payload. All values are little endian.
+#
+#   magic    2 bytes  b'MB'
+#   version  uint8    FORMAT_VERSION
+#   flags    uint8    FLAG_ZLIB: the body is zlib compressed
+#                     FLAG_DENSE: the body has no ids, counter n is the value of metric id n + 1
+#   count    uint32   number of counters
+#   body     sparse:  uint16 metric ids [count], padded to a multiple of 4 bytes, uint32 counters [count]
+#            dense:   uint32 counters [count]
+#
+# Metric ids are positions in METRIC_NAMES plus one. Readers take memoryview slices of the body, so
+# buckets can be summed without building a dict per bucket. Payloads that don't start with the magic
+# bytes are read as the older JSON dict format.
+#
+import json
+import struct
+import sys
+import zlib
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+MAGIC = b'MB'
+FORMAT_VERSION = 1
+FLAG_ZLIB = 0x01
+FLAG_DENSE = 0x02
+
+_HEADER = struct.Struct('<2sBBI')
+
+# Metric names by id. Ids are stored in the payloads, so new names may only be appended.
+METRIC_NAMES = (
+    'Participant',
+    'Participant.enrollmentStatus.INTERESTED',
+    'Participant.enrollmentStatus.MEMBER',
+    'Participant.enrollmentStatus.FULL_PARTICIPANT',
+    'Participant.race.UNSET',
+    'Participant.race.PMI_Skip',
+    'Participant.race.AMERICAN_INDIAN_OR_ALASKA_NATIVE',
+    'Participant.race.BLACK_OR_AFRICAN_AMERICAN',
+    'Participant.race.ASIAN',
+    'Participant.race.NATIVE_HAWAIIAN_OR_OTHER_PACIFIC_ISLANDER',
+    'Participant.race.WHITE',
+    'Participant.race.HISPANIC_LATINO_OR_SPANISH',
+    'Participant.race.MIDDLE_EASTERN_OR_NORTH_AFRICAN',
+    'Participant.race.HLS_AND_WHITE',
+    'Participant.race.HLS_AND_BLACK',
+    'Participant.race.HLS_AND_ONE_OTHER_RACE',
+    'Participant.race.HLS_AND_MORE_THAN_ONE_OTHER_RACE',
+    'Participant.race.MORE_THAN_ONE_RACE',
+    'Participant.race.OTHER_RACE',
+    'Participant.race.PREFER_NOT_TO_SAY',
+    'Participant.ageRange.0-17',
+    'Participant.ageRange.18-25',
+    'Participant.ageRange.26-35',
+    'Participant.ageRange.36-45',
+    'Participant.ageRange.46-55',
+    'Participant.ageRange.56-65',
+    'Participant.ageRange.66-75',
+    'Participant.ageRange.76-85',
+    'Participant.ageRange.86-',
+    'Participant.ageRange.UNSET',
+    'Participant.genderIdentity.GenderIdentity_Man',
+    'Participant.genderIdentity.GenderIdentity_Woman',
+    'Participant.genderIdentity.GenderIdentity_NonBinary',
+    'Participant.genderIdentity.GenderIdentity_Transgender',
+    'Participant.genderIdentity.GenderIdentity_AdditionalOptions',
+    'Participant.genderIdentity.PMI_PreferNotToAnswer',
+    'Participant.genderIdentity.PMI_Skip',
+    'Participant.genderIdentity.UNSET',
+    'Participant.physicalMeasurementsStatus.UNSET',
+    'Participant.physicalMeasurementsStatus.COMPLETED',
+    'Participant.physicalMeasurementsStatus.CANCELLED',
+    'Participant.samplesToIsolateDNA.UNSET',
+    'Participant.samplesToIsolateDNA.RECEIVED',
+    'Participant.numCompletedBaselinePPIModules.0',
+    'Participant.numCompletedBaselinePPIModules.1',
+    'Participant.numCompletedBaselinePPIModules.2',
+    'Participant.numCompletedBaselinePPIModules.3',
+    'Participant.consentForElectronicHealthRecords.UNSET',
+    'Participant.consentForElectronicHealthRecords.SUBMITTED',
+    'Participant.consentForElectronicHealthRecords.SUBMITTED_NO_CONSENT',
+    'Participant.consentForElectronicHealthRecords.SUBMITTED_NOT_SURE',
+    'Participant.consentForElectronicHealthRecords.SUBMITTED_INVALID',
+)
+METRIC_IDS = {name: index + 1 for index, name in enumerate(METRIC_NAMES)}
+
+# Largest counter value the format can store.
+MAX_COUNT = 0xFFFFFFFF
+
+
+def encode_bucket(metrics: dict, compress: bool = False) -> bytes:
+    """
+    Encode a dict of metric counts, zero counts are left out. Uses the dense layout when it is smaller.
+    :param metrics: dict of metric name to count
+    :param compress: zlib compress the body if that makes it smaller
+    :return: payload bytes
+    """
+    try:
+        counts = sorted((METRIC_IDS[name], count) for name, count in metrics.items() if count)
+    except KeyError as e:
+        raise ValueError('unknown metric: {0}'.format(e.args[0]))
+    if any(count < 0 or count > MAX_COUNT for _, count in counts):
+        raise ValueError('metric count out of range.')
+
+    ids = array('H', [metric_id for metric_id, _ in counts])
+    values = array('I', [count for _, count in counts])
+    flags = 0
+
+    size = counts[-1][0] if counts else 0
+    if size * 4 <= len(counts) * 6:
+        dense = array('I', [0]) * size
+        for metric_id, count in counts:
+            dense[metric_id - 1] = count
+        flags |= FLAG_DENSE
+        parts = [dense]
+    else:
+        if len(ids) % 2:
+            ids.append(0)
+        parts = [ids, values]
+        size = len(counts)
+
+    if sys.byteorder != 'little':
+        for part in parts:
+            part.byteswap()
+    body = b''.join(part.tobytes() for part in parts)
+
+    if compress:
+        compressed = zlib.compress(body)
+        if len(compressed) < len(body):
+            body = compressed
+            flags |= FLAG_ZLIB
+
+    return _HEADER.pack(MAGIC, FORMAT_VERSION, flags, size) + body
+
+
+class BucketView(object):
+    """
+    Read only view of an encoded bucket. The ids and counts are memoryviews over the payload, or over
+    the decompressed body for compressed payloads.
+    """
+
+    def __init__(self, payload: bytes):
+        magic, version, flags, count = _HEADER.unpack_from(payload)
+        if magic != MAGIC:
+            raise ValueError('not a binary metrics bucket.')
+        if version != FORMAT_VERSION:
+            raise ValueError('unsupported metrics bucket version: {0}'.format(version))
+
+        body = memoryview(payload)[_HEADER.size:]
+        if flags & FLAG_ZLIB:
+            body = memoryview(zlib.decompress(body))
+
+        self.dense = bool(flags & FLAG_DENSE)
+        if self.dense:
+            self.ids = None
+            self.counts = body[:count * 4]
+        else:
+            ids_size = (count + count % 2) * 2
+            self.ids = body[:count * 2]
+            self.counts = body[ids_size:ids_size + count * 4]
+        if len(self.counts) != count * 4:
+            raise ValueError('truncated metrics bucket.')
+        self.size = count
+
+    def _ints(self, view, typecode):
+        if sys.byteorder == 'little':
+            return view.cast(typecode)
+        values = array(typecode, view.tobytes())
+        values.byteswap()
+        return values
+
+    def items(self):
+        """
+        Generator returning the (metric id, count) pairs with a count
+        :return: generator of tuples
+        """
+        counts = self._ints(self.counts, 'I')
+        if self.dense:
+            return ((index + 1, count) for index, count in enumerate(counts) if count)
+        return zip(self._ints(self.ids, 'H'), counts)
+
+    def to_dict(self):
+        """
+        Return the bucket as a dict of metric name to count
+        :return: dict
+        """
+        return {METRIC_NAMES[metric_id - 1]: count for metric_id, count in self.items()}
+
+    def add_to(self, totals):
+        """
+        Add the counts to a list or array of totals indexed by metric id
+        :param totals: list, array or numpy array with len(METRIC_NAMES) + 1 items
+        """
+        if numpy is not None and isinstance(totals, numpy.ndarray):
+            values = numpy.frombuffer(self.counts, dtype='<u4')
+            if self.dense:
+                totals[1:1 + self.size] += values
+            else:
+                numpy.add.at(totals, numpy.frombuffer(self.ids, dtype='<u2'), values)
+        elif self.dense:
+            for index, count in enumerate(self._ints(self.counts, 'I')):
+                totals[index + 1] += count
+        else:
+            for metric_id, count in zip(self._ints(self.ids, 'H'), self._ints(self.counts, 'I')):
+                totals[metric_id] += count
+
+
+def decode_bucket(payload: bytes) -> dict:
+    """
+    Decode a bucket payload in the binary or the older JSON format
+    :param payload: payload bytes
+    :return: dict of metric name to count
+    """
+    if payload[:len(MAGIC)] != MAGIC:
+        return json.loads(payload)
+    return BucketView(payload).to_dict()
+
+
+def aggregate_buckets(payloads) -> dict:
+    """
+    Sum the counts of many buckets in the binary format
+    :param payloads: iterable of payload bytes
+    :return: dict of metric name to total count, metrics with no counts are left out
+    """
+    if numpy is not None:
+        totals = numpy.zeros(len(METRIC_NAMES) + 1, dtype=numpy.int64)
+    else:
+        totals = array('q', [0]) * (len(METRIC_NAMES) + 1)
+
+    for payload in payloads:
+        BucketView(payload).add_to(totals)
+    return {name: int(totals[index + 1]) for index, name in enumerate(METRIC_NAMES) if totals[index + 1]}
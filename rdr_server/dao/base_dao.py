@@ -2,14 +2,26 @@
 # This file is subject to the terms and conditions defined in the
 # file 'LICENSE', which is part of this source code package.
 #
+import base64
+import binascii
+import itertools
 import os
+import time
+from collections import OrderedDict
+from datetime import datetime
 
 from marshmallow_sqlalchemy import ModelConversionError, ModelSchema
-from sqlalchemy import event
+from sqlalchemy import and_, event, func, or_, text
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm import mapper
 from sqlalchemy.orm.query import Query
 from sqlalchemy.orm.session import Session
+from sqlalchemy.sql.expression import FunctionElement
+from sqlalchemy.types import DateTime
 
+from rdr_server.dao.cache import CacheBackend
+from rdr_server.dao.exceptions import RecordNotFoundError
 from rdr_server.model.base_database import Database
 from rdr_server.model.base_model import BaseModel, BaseMetricsModel
 
@@ -20,6 +32,110 @@ else:
 
 _database = Database(_conn_url)
 
+# Default and maximum number of records returned in a single page of a list request.
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+# Number of rows fetched from the server side cursor at a time when streaming records.
+STREAM_BATCH_SIZE = 500
+# Number of rows written with a single executemany() statement by the bulk write methods.
+BULK_BATCH_SIZE = 500
+# Number of seconds a cached record count is used before it is counted again.
+COUNT_CACHE_TTL = 300
+# Records modified less than this many seconds ago are left for the next sync request, to give
+# transactions still in flight with an earlier modified time a chance to commit.
+SYNC_SETTLE_TIME = 2
+
+# Cached record counts, fully qualified table name -> (expire time, count). Shared by every DAO
+# instance for the same table.
+_count_cache = dict()
+
+
+def encode_page_token(pk_id: int) -> str:
+    """
+    Create an opaque cursor token from the last primary key id returned in a page
+    :param pk_id: primary key id
+    :return: url safe token string
+    """
+    return base64.urlsafe_b64encode(str(pk_id).encode('utf-8')).decode('utf-8')
+
+
+def decode_page_token(token: str) -> int:
+    """
+    Return the primary key id stored in a cursor token
+    :param token: token string created by encode_page_token()
+    :return: primary key id
+    """
+    try:
+        return int(base64.urlsafe_b64decode(token.encode('utf-8')).decode('utf-8'))
+    except (binascii.Error, UnicodeError, ValueError):
+        raise ValueError('invalid page token.')
+
+
+def encode_watermark(modified: datetime, pk_id: int) -> str:
+    """
+    Create an opaque sync watermark from the last record returned by a sync request
+    :param modified: modified time of the record
+    :param pk_id: primary key id of the record
+    :return: url safe token string
+    """
+    data = '{0}|{1}'.format(modified.isoformat(), pk_id)
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('utf-8')
+
+
+def decode_watermark(watermark: str):
+    """
+    Return the modified time and primary key id stored in a sync watermark. A plain ISO 8601 timestamp
+    is also accepted, to start syncing from a point in time.
+    :param watermark: token string created by encode_watermark() or timestamp
+    :return: tuple of (modified time, primary key id)
+    """
+    try:
+        return datetime.fromisoformat(watermark), 0
+    except ValueError:
+        pass
+    try:
+        modified, pk_id = base64.urlsafe_b64decode(watermark.encode('utf-8')).decode('utf-8').rsplit('|', 1)
+        return datetime.fromisoformat(modified), int(pk_id)
+    except (binascii.Error, UnicodeError, ValueError):
+        raise ValueError('invalid watermark.')
+
+
+class server_time_ago(FunctionElement):
+    """
+    The database server time a number of seconds ago. Cutoffs compared against times set by the
+    server, or by other processes, use the server clock so they don't depend on the local clock.
+    """
+    type = DateTime()
+    name = 'server_time_ago'
+
+
+@compiles(server_time_ago)
+def _compile_server_time_ago(element, compiler, **kw):
+    return 'TIMESTAMPADD(SECOND, -({0}), NOW(6))'.format(compiler.process(element.clauses, **kw))
+
+
+def batches(iterable, batch_size: int):
+    """
+    Generator splitting an iterable into lists of at most batch_size items
+    :param iterable: iterable
+    :param batch_size: maximum number of items in each list
+    :return: generator of lists
+    """
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def dispose_connections():
+    """
+    Close the pooled database connections. Called in forked worker processes, which must not use
+    the connections inherited from the parent process.
+    """
+    _database.get_engine().dispose()
+
 
 def setup_schema(BaseDao, session):
     """
@@ -69,11 +185,17 @@ class BaseDao(object):
 
     model: object = None
     _database = None
+    _cache: CacheBackend = None
 
-    def __init__(self, model: object):
-
+    def __init__(self, model: object, cache: CacheBackend = None):
+        """
+        :param model: model class
+        :param cache: optional cache for get_by_id() results, can be shared by DAOs of the same model.
+                      Cached records are shared between requests and must not be modified.
+        """
         self.model = model
         self._database = _database
+        self._cache = cache
 
     def session(self) -> Session:
         return self._database.session()
@@ -94,17 +216,58 @@ class BaseDao(object):
 
     def count(self):
         """
-        Return the number of records in the model
+        Return the exact number of records in the model. Counts the primary key directly instead of
+        wrapping a select of every column in a subquery.
         :return: record count
         """
         if not self.model:
             raise NameError('database model has not been set.')
 
         with self.session() as session:
-            query = self.get_query(session)
-            data = query.count()
+            query = self.get_query(session, func.count(self.model.pkId))
+            data = query.scalar()
             return data
 
+    def approximate_count(self):
+        """
+        Return the approximate number of records in the model from the table statistics in
+        information_schema. This is instant for any table size, but for InnoDB can be off by up to
+        half the real count. Falls back to an exact count if there are no statistics for the table.
+        :return: record count
+        """
+        if not self.model:
+            raise NameError('database model has not been set.')
+
+        table = self.model.__table__
+        sql = text('SELECT TABLE_ROWS FROM information_schema.TABLES '
+                   'WHERE TABLE_SCHEMA = COALESCE(:schema, DATABASE()) AND TABLE_NAME = :table')
+
+        with self.session() as session:
+            data = session.execute(sql, {'schema': table.schema, 'table': table.name}).scalar()
+
+        if data is None:
+            return self.count()
+        return int(data)
+
+    def cached_count(self, ttl: int = COUNT_CACHE_TTL):
+        """
+        Return the exact number of records in the model, counting at most once every ttl seconds.
+        :param ttl: number of seconds to keep the count
+        :return: record count
+        """
+        if not self.model:
+            raise NameError('database model has not been set.')
+
+        key = self.model.__table__.fullname
+        entry = _count_cache.get(key, None)
+        now = time.monotonic()
+        if entry and entry[0] > now:
+            return entry[1]
+
+        data = self.count()
+        _count_cache[key] = (now + ttl, data)
+        return data
+
     def list(self):
         """
         Return a list of all records
@@ -118,6 +281,52 @@ class BaseDao(object):
             data = query.all()
             return data
 
+    def list_page(self, page_token: str = None, page_size: int = DEFAULT_PAGE_SIZE):
+        """
+        Return a page of records ordered by primary key id. Pages are keyed on the last primary key
+        id of the previous page, so every page is a range scan of the primary key no matter how deep.
+        :param page_token: cursor token returned with the previous page, None for the first page
+        :param page_size: number of records to return
+        :return: tuple of (list of records, cursor token for the next page or None)
+        """
+        if not self.model:
+            raise NameError('database model has not been set.')
+        if not page_size or page_size < 1 or page_size > MAX_PAGE_SIZE:
+            raise ValueError('invalid page size.')
+
+        with self.session() as session:
+            query = self.get_query(session)
+            if page_token:
+                query = query.filter(self.model.pkId > decode_page_token(page_token))
+            # Fetch one extra record to find out if there is another page.
+            data = query.order_by(self.model.pkId).limit(page_size + 1).all()
+
+        if len(data) > page_size:
+            data = data[:page_size]
+            return data, encode_page_token(data[-1].pkId)
+        return data, None
+
+    def stream(self, fields: list = None, batch_size: int = STREAM_BATCH_SIZE):
+        """
+        Generator returning all records ordered by primary key id. Rows are read from a server side
+        cursor in batches, so memory use is constant regardless of the table size.
+        :param fields: list of model columns to return, returns model objects if not set
+        :param batch_size: number of rows to fetch from the cursor at a time
+        :return: generator of records
+        """
+        if not self.model:
+            raise NameError('database model has not been set.')
+
+        with self.session() as session:
+            if fields:
+                query = self.get_query(session, fields)
+            else:
+                query = self.get_query(session)
+            query = query.order_by(self.model.pkId).execution_options(stream_results=True)
+
+            for rec in query.yield_per(batch_size):
+                yield rec
+
     def get_by_id(self, pkId: int):
         """
         Return a record identified by the primary key id
@@ -129,15 +338,52 @@ class BaseDao(object):
         if not pkId:
             raise ValueError('invalid primary key value.')
 
+        if self._cache is not None:
+            return self._get_cached_by_id(pkId)
+
         with self.session() as session:
             query = self.get_query(session)
             rec = query.get(pkId)
             return rec
 
+    def _cache_key(self, pkId: int):
+        return self.model.__tablename__, pkId
+
+    def _get_cached_by_id(self, pkId: int):
+        """
+        Return a record from the cache, loading it on a miss. An expired record is kept if its
+        modified timestamp has not changed, which only needs a single column lookup.
+        :param pkId: primary key id
+        :return: a single record
+        """
+        key = self._cache_key(pkId)
+        rec = self._cache.get(key)
+        if rec is not None:
+            return rec
+
+        expired = self._cache.get_expired(key)
+        with self.session() as session:
+            if expired is not None:
+                query = self.get_query(session, self.model.modified)
+                modified = query.filter(self.model.pkId == pkId).scalar()
+                if modified is not None and modified == expired.modified:
+                    self._cache.renew(key)
+                    return expired
+
+            query = self.get_query(session)
+            rec = query.get(pkId)
+
+        if rec is None:
+            self._cache.delete(key)
+        else:
+            self._cache.set(key, rec)
+        return rec
+
     def delete_by_id(self, pkId: int):
         """
-        Delete a record using the primary key value
+        Delete a record using the primary key value with a single DELETE statement
         :param pk_id: primary key id
+        :return: number of records deleted
         """
         if not self.model:
             raise NameError('database model has not been set.')
@@ -146,7 +392,14 @@ class BaseDao(object):
 
         with self.session() as session:
             query = self.get_query(session)
-            query.filter(self.model.pkId == pkId).delete()
+            count = query.filter(self.model.pkId == pkId).delete(synchronize_session=False)
+
+        if self._cache is not None:
+            self._cache.delete(self._cache_key(pkId))
+
+        if not count:
+            raise RecordNotFoundError()
+        return count
 
     def base_fields(self):
         """
@@ -161,14 +414,175 @@ class BaseDao(object):
             data = query.order_by(self.model.pkId).all()
             return data
 
-    def insert(self, data):
+    def stream_base_fields(self, batch_size: int = STREAM_BATCH_SIZE):
+        """
+        Generator returning the base model fields for all records
+        :param batch_size: number of rows to fetch from the cursor at a time
+        :return: generator of records
+        """
+        if not self.model:
+            raise NameError('database model has not been set.')
+
+        return self.stream([self.model.pkId, self.model.created, self.model.modified], batch_size)
+
+    def changes_since(self, since: str = None, limit: int = DEFAULT_PAGE_SIZE):
+        """
+        Return the base model fields of the records modified after a sync watermark, ordered by
+        modified time and primary key id. The model needs an index on modified for this to be a
+        range scan.
+        :param since: watermark returned by the previous call, or an ISO 8601 timestamp. Returns
+                      records from the beginning if not set.
+        :param limit: maximum number of records to return
+        :return: tuple of (list of records, watermark for the next call, True if there are more records)
+        """
+        if not self.model:
+            raise NameError('database model has not been set.')
+        if not limit or limit < 1 or limit > MAX_PAGE_SIZE:
+            raise ValueError('invalid limit.')
+
+        model = self.model
+        with self.session() as session:
+            query = self.get_query(session, [model.pkId, model.created, model.modified])
+            if since:
+                modified, pk_id = decode_watermark(since)
+                query = query.filter(or_(model.modified > modified,
+                                         and_(model.modified == modified, model.pkId > pk_id)))
+            # modified is set from the database server clock in the session time zone, so the cutoff is
+            # worked out by the server too.
+            query = query.filter(model.modified < server_time_ago(SYNC_SETTLE_TIME))
+            # Fetch one extra record to find out if there are more changes.
+            data = query.order_by(model.modified, model.pkId).limit(limit + 1).all()
+
+        more = len(data) > limit
+        data = data[:limit]
+        watermark = encode_watermark(data[-1].modified, data[-1].pkId) if data else since
+        return data, watermark, more
+
+    def _group_rows(self, batch):
+        """
+        Convert a batch of models or dicts to table rows and group them by the set of columns they
+        contain, executemany() needs every row in a statement to have the same columns.
+        :param batch: list of model objects or dicts
+        :return: OrderedDict of column key tuple to list of (batch index, row) tuples
+        """
+        serializer = self.model.get_serializer()
+        groups = OrderedDict()
+
+        for index, item in enumerate(batch):
+            row = serializer.to_row(item)
+            groups.setdefault(tuple(sorted(row.keys())), list()).append((index, row))
+
+        return groups
+
+    def bulk_insert(self, items, batch_size: int = BULK_BATCH_SIZE):
+        """
+        Insert records in batches, each batch is written with a single executemany() statement.
+        Ids generated by the database are not returned: the driver may split a large executemany()
+        into several statements, and InnoDB only allocates consecutive ids to a multi-row insert
+        with innodb_autoinc_lock_mode 0 or 1, so they can't be worked out from the last insert id.
+        Callers that need the ids of new records should set pkId or use insert().
+        :param items: iterable of model objects or dicts keyed by model attribute key
+        :param batch_size: number of records to write per statement
+        :return: list of the pkId set on each item, or None for generated ids, in item order
+        """
+        if not self.model:
+            raise NameError('database model has not been set.')
+
+        table = self.model.__table__
+        pk_key = self.model.get_serializer().column_keys['pkId']
+        pk_ids = list()
+
+        with self.session() as session:
+            for batch in batches(items, batch_size):
+                batch_ids = [None] * len(batch)
+
+                for keys, group in self._group_rows(batch).items():
+                    session.execute(table.insert(), [row for index, row in group])
+                    if pk_key in keys:
+                        for index, row in group:
+                            batch_ids[index] = row[pk_key]
+
+                pk_ids.extend(batch_ids)
+
+        return pk_ids
+
+    def bulk_upsert(self, items, batch_size: int = BULK_BATCH_SIZE):
         """
-        Insert a new record into the model
-        :param data: json data
+        Insert or update records in batches using MySQL INSERT ... ON DUPLICATE KEY UPDATE. Rows
+        matching an existing primary key or unique key are updated with the given column values.
+        :param items: iterable of model objects or dicts keyed by model attribute key
+        :param batch_size: number of records to write per statement
+        :return: number of affected rows as reported by MySQL, 1 per insert and 2 per update
         """
+        if not self.model:
+            raise NameError('database model has not been set.')
 
-        if not data:
+        table = self.model.__table__
+        # Never overwrite the primary key or the created timestamp of an existing row.
+        skip_keys = (self.model.get_serializer().column_keys['pkId'],
+                     self.model.get_serializer().column_keys['created'])
+        count = 0
+
+        with self.session() as session:
+            for batch in batches(items, batch_size):
+                for keys, group in self._group_rows(batch).items():
+                    stmt = mysql_insert(table)
+                    updates = {key: stmt.inserted[key] for key in keys if key not in skip_keys}
+                    if updates:
+                        stmt = stmt.on_duplicate_key_update(**updates)
+                    else:
+                        stmt = stmt.prefix_with('IGNORE')
+                    result = session.execute(stmt, [row for index, row in group])
+                    count += result.rowcount
+
+        # Rows may have been matched on a unique key, so we don't know which records changed.
+        if self._cache is not None:
+            self._cache.clear()
+        return count
+
+    def insert(self, obj):
+        """
+        Insert a new record. The stored column values, including the generated pkId and the server
+        default created and modified values, are loaded back into obj in the same transaction.
+        :param obj: model object
+        :return: model object
+        """
+        if not self.model:
+            raise NameError('database model has not been set.')
+        if not obj:
             raise ValueError('invalid data')
 
-        # TODO: validate and insert data into model
+        with self.session() as session:
+            session.add(obj)
+            session.flush()
+            session.refresh(obj)
+
+        return obj
+
+    def update(self, obj):
+        """
+        Replace all the column values of an existing record with the values in obj. The stored
+        record, including the server managed created and modified values, is read back in the same
+        transaction.
+        :param obj: model object with pkId set
+        :return: model object loaded from the database
+        """
+        if not self.model:
+            raise NameError('database model has not been set.')
+        if not obj or not obj.pkId:
+            raise ValueError('invalid primary key value.')
+
+        skip_keys = ('pkId', 'created', 'modified')
+        values = {key: getattr(obj, key) for key in self.model.get_serializer().column_keys
+                  if key not in skip_keys}
+
+        with self.session() as session:
+            query = self.get_query(session).filter(self.model.pkId == obj.pkId)
+            if not query.update(values, synchronize_session=False):
+                raise RecordNotFoundError()
+
+            rec = self.get_query(session).filter(self.model.pkId == obj.pkId).one()
 
+        if self._cache is not None:
+            self._cache.delete(self._cache_key(rec.pkId))
+        return rec
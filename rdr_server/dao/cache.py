@@ -0,0 +1,135 @@
+#
+# This file is subject to the terms and conditions defined in the
+# file 'LICENSE', which is part of this source code package.
+#
+import threading
+import time
+from collections import OrderedDict
+
+# All cache instances, by name. Used to report cache statistics.
+_caches = OrderedDict()
+
+
+def cache_stats():
+    """
+    Return the hit/miss counters for all caches
+    :return: dict of cache name to stats dict
+    """
+    return {name: cache.stats() for name, cache in list(_caches.items())}
+
+
+class CacheBackend(object):
+    """
+    Base class for DAO record caches. Subclasses must be safe to use from multiple threads.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        _caches[name] = self
+
+    def get(self, key):
+        """
+        Return the cached value, or None if the key is not cached or has expired
+        """
+        raise NotImplementedError()
+
+    def get_expired(self, key):
+        """
+        Return a value that has expired but is still held by the cache, so the caller can check if
+        it is still current and renew() it instead of loading it again.
+        """
+        return None
+
+    def renew(self, key):
+        """
+        Restart the time to live of an expired value
+        """
+        pass
+
+    def set(self, key, value):
+        raise NotImplementedError()
+
+    def delete(self, key):
+        raise NotImplementedError()
+
+    def clear(self):
+        raise NotImplementedError()
+
+    def stats(self):
+        """
+        Return the cache counters
+        :return: dict
+        """
+        return dict()
+
+
+class LRUCache(CacheBackend):
+    """
+    In process cache holding at most max_size values, each for ttl seconds. When the cache is full
+    the least recently used value is dropped.
+    """
+
+    def __init__(self, name: str, max_size: int = 1000, ttl: int = 300):
+        super(LRUCache, self).__init__(name)
+        self.max_size = max_size
+        self.ttl = ttl
+
+        # key -> (expire time, value), ordered from least to most recently used.
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.renewals = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key, None)
+            if entry is None or entry[0] <= time.monotonic():
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def get_expired(self, key):
+        with self._lock:
+            entry = self._data.get(key, None)
+            return entry[1] if entry else None
+
+    def renew(self, key):
+        with self._lock:
+            entry = self._data.get(key, None)
+            if entry:
+                self._data[key] = (time.monotonic() + self.ttl, entry[1])
+                self._data.move_to_end(key)
+                self.renewals += 1
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._data),
+                'maxSize': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'renewals': self.renewals,
+                'evictions': self.evictions,
+            }
@@ -0,0 +1,161 @@
+#
+# This file is subject to the terms and conditions defined in the
+# file 'LICENSE', which is part of this source code package.
+#
+import logging
+import threading
+import time
+from collections import namedtuple
+
+from rdr_server.dao.codebook import CodeBookDao, CodeDao
+
+# Number of seconds between checks for a new latest code book.
+CHECK_INTERVAL = 60
+
+CodeInfo = namedtuple('CodeInfo', ['codeId', 'system', 'value', 'shortValue', 'display', 'topic',
+                                   'codeType', 'mapped', 'codeBookId', 'parentId'])
+
+
+class CodeSnapshot(object):
+    """
+    A read only copy of the code table, indexed by code id and by (system, value), with the parent/child
+    tree resolved. Snapshots are never changed after they are created, so they can be used from any
+    thread without locking.
+    """
+
+    def __init__(self, code_book_id, codes: list):
+        """
+        :param code_book_id: code book id of the latest code book when the codes were loaded
+        :param codes: list of CodeInfo records
+        """
+        self.code_book_id = code_book_id
+        self.codes_by_id = {code.codeId: code for code in codes}
+        # Values are matched case insensitively, the same as the MySQL unique key on (system, value).
+        self.codes_by_system_value = {(code.system, code.value.lower()): code for code in codes}
+
+        children = dict()
+        for code in codes:
+            if code.parentId is not None:
+                children.setdefault(code.parentId, list()).append(code)
+        self.children_by_parent_id = {k: tuple(v) for k, v in children.items()}
+
+    def __len__(self):
+        return len(self.codes_by_id)
+
+    def get(self, code_id):
+        return self.codes_by_id.get(code_id, None)
+
+    def find(self, system, value):
+        """
+        Return the code with the given system and value
+        :return: CodeInfo or None
+        """
+        if value is None:
+            return None
+        return self.codes_by_system_value.get((system, value.lower()), None)
+
+    def get_parent(self, code: CodeInfo):
+        return self.codes_by_id.get(code.parentId, None) if code.parentId is not None else None
+
+    def get_children(self, code: CodeInfo):
+        return self.children_by_parent_id.get(code.codeId, tuple())
+
+    def get_ancestors(self, code: CodeInfo):
+        """
+        Generator returning the parent, grandparent, etc. of a code
+        """
+        parent = self.get_parent(code)
+        seen = set()
+        while parent is not None and parent.codeId not in seen:
+            seen.add(parent.codeId)
+            yield parent
+            parent = self.get_parent(parent)
+
+
+class CodeCacheService(object):
+    """
+    Keeps a CodeSnapshot matching the latest code book. Every check interval a single row query looks up
+    the latest code book id, and the codes are only reloaded when it has changed.
+    """
+
+    def __init__(self, check_interval: int = CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self._code_dao = CodeDao()
+        self._code_book_dao = CodeBookDao()
+        self._snapshot = None
+        self._next_check = 0
+        self._force_reload = False
+        self._lock = threading.Lock()
+
+    def get(self) -> CodeSnapshot:
+        """
+        Return the current snapshot, reloading it if a new code book has been imported. While one
+        thread reloads, other threads keep using the previous snapshot.
+        :return: CodeSnapshot
+        """
+        if self._snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    self.reload()
+        elif self._next_check <= time.monotonic() and self._lock.acquire(blocking=False):
+            try:
+                if self._force_reload or self.get_latest_code_book_id() != self._snapshot.code_book_id:
+                    self.reload()
+                else:
+                    self._next_check = time.monotonic() + self.check_interval
+            finally:
+                self._lock.release()
+
+        return self._snapshot
+
+    def get_latest_code_book_id(self):
+        """
+        Return the code book id of the latest code book
+        :return: int or None
+        """
+        dao = self._code_book_dao
+        with dao.session() as session:
+            query = dao.get_query(session, dao.model.codeBookId)
+            return query.filter(dao.model.latest.is_(True)).order_by(dao.model.codeBookId.desc()).limit(1).scalar()
+
+    def reload(self):
+        """
+        Load all codes and replace the current snapshot
+        """
+        dao = self._code_dao
+        code_book_id = self.get_latest_code_book_id()
+        columns = [getattr(dao.model, field) for field in CodeInfo._fields]
+
+        with dao.session() as session:
+            codes = [CodeInfo(*row) for row in dao.get_query(session, columns).all()]
+
+        self._snapshot = CodeSnapshot(code_book_id, codes)
+        self._next_check = time.monotonic() + self.check_interval
+        self._force_reload = False
+        logging.info('loaded {0} codes for code book {1}.'.format(len(codes), code_book_id))
+
+    def invalidate(self):
+        """
+        Force a reload on the next call to get(), used after importing a code book.
+        """
+        self._force_reload = True
+        self._next_check = 0
+
+
+# The shared code cache for the process.
+_service = CodeCacheService()
+
+
+def get_code_cache() -> CodeSnapshot:
+    """
+    Return the current code snapshot
+    :return: CodeSnapshot
+    """
+    return _service.get()
+
+
+def invalidate_code_cache():
+    """
+    Reload the code snapshot on next use, called after importing a code book.
+    """
+    _service.invalidate()
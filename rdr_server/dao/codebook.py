@@ -4,12 +4,34 @@
 #
 
 from rdr_server.dao.base_dao import BaseDao
+from rdr_server.dao.cache import LRUCache
 from rdr_server.model.code import Code, CodeBook
 
+# Shared by all DAO instances so writes through any of them invalidate the cached records.
+_code_book_cache = LRUCache('code_book', max_size=100, ttl=3600)
+_code_cache = LRUCache('code', max_size=50000, ttl=3600)
+
+
+def clear_code_caches():
+    """
+    Clear the cached code and code book records. Call after writing codes with Core statements,
+    which bypass the DAOs.
+    """
+    _code_book_cache.clear()
+    _code_cache.clear()
+
 
 class CodeBookDao(BaseDao):
 
     model = None  # type: CodeBook
 
     def __init__(self):
-        super(CodeBookDao, self).__init__(CodeBook)
+        super(CodeBookDao, self).__init__(CodeBook, cache=_code_book_cache)
+
+
+class CodeDao(BaseDao):
+
+    model = None  # type: Code
+
+    def __init__(self):
+        super(CodeDao, self).__init__(Code, cache=_code_cache)
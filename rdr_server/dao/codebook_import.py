@@ -0,0 +1,267 @@
+#
+# This file is subject to the terms and conditions defined in the
+# file 'LICENSE', which is part of this source code package.
+#
+
+#
+# Incremental code book import. The FHIR CodeSystem concept tree is walked as a stream of codes,
+# compared against the existing codes by (system, value), and only new or changed codes are written,
+# in batched executemany() statements inside a single transaction.
+#
+import logging
+from collections import namedtuple
+
+from sqlalchemy import bindparam, func
+
+from rdr_server.common.enums import CodeType
+from rdr_server.dao.base_dao import BULK_BATCH_SIZE, batches
+from rdr_server.dao.code_cache import CodeInfo, invalidate_code_cache
+from rdr_server.dao.codebook import CodeBookDao, clear_code_caches
+from rdr_server.model.code import Code, CodeBook, CodeHistory
+
+_CODE_TYPE_MAP = {
+    'Module Name': CodeType.MODULE,
+    'Topic': CodeType.TOPIC,
+    'Question': CodeType.QUESTION,
+    'Answer': CodeType.ANSWER,
+}
+_CONCEPT_TYPE_PROPERTY = 'concept-type'
+_CONCEPT_TOPIC_PROPERTY = 'concept-topic'
+
+# OMOP code values are limited to 50 characters, see Code.shortValue.
+SHORT_VALUE_MAXLEN = 50
+
+# The code columns compared to find changed codes.
+_COMPARE_FIELDS = ('shortValue', 'display', 'topic', 'codeType', 'parentId')
+
+ParsedCode = namedtuple('ParsedCode', ['system', 'value', 'shortValue', 'display', 'topic', 'codeType',
+                                       'parentValue'])
+
+
+class CodeBookConflictError(Exception):
+    """ A code book version was already imported with different content """
+    pass
+
+
+class CodeBookImportPlan(object):
+    """
+    The writes needed to bring the code table up to date with a code book. Rows are dicts keyed by
+    model attribute key.
+    """
+
+    def __init__(self):
+        self.inserts = list()
+        self.updates = list()
+        # Code ids of codes that did not change, these only need the new code book id.
+        self.unchanged = list()
+        self.duplicates = 0
+
+    def summary(self):
+        return {
+            'inserted': len(self.inserts),
+            'updated': len(self.updates),
+            'unchanged': len(self.unchanged),
+            'duplicates': self.duplicates,
+        }
+
+
+def iter_codebook_concepts(codebook: dict):
+    """
+    Generator walking the code book concept tree depth first, returning parents before their children.
+    :param codebook: FHIR CodeSystem dict
+    :return: generator of ParsedCode
+    """
+    system = codebook['url']
+    stack = [(concept, None) for concept in reversed(codebook.get('concept', list()))]
+
+    while stack:
+        concept, parent_value = stack.pop()
+        value = concept['code']
+        code_type = None
+        topic = None
+
+        for prop in concept.get('property', list()):
+            if prop['code'] == _CONCEPT_TYPE_PROPERTY:
+                code_type = _CODE_TYPE_MAP.get(prop['valueCode'], None)
+            elif prop['code'] == _CONCEPT_TOPIC_PROPERTY:
+                topic = prop['valueCode']
+
+        if code_type is None:
+            logging.warning('unknown concept type for code {0}, skipping.'.format(value))
+            continue
+
+        yield ParsedCode(system, value, value[:SHORT_VALUE_MAXLEN], concept.get('display', None), topic,
+                         code_type, parent_value)
+
+        for child in reversed(concept.get('concept', list())):
+            stack.append((child, value))
+
+
+def plan_codebook_import(concepts, existing: dict, code_book_id: int, next_code_id: int):
+    """
+    Compare the code book concepts with the existing codes and work out the inserts and updates.
+    :param concepts: iterable of ParsedCode, parents before children
+    :param existing: dict of (system, lower case value) to CodeInfo for the existing codes
+    :param code_book_id: code book id of the code book being imported
+    :param next_code_id: first code id to assign to new codes
+    :return: CodeBookImportPlan
+    """
+    plan = CodeBookImportPlan()
+    # (system, lower case value) -> code id, for every code in this code book.
+    seen = dict()
+
+    for concept in concepts:
+        key = (concept.system, concept.value.lower())
+        if key in seen:
+            plan.duplicates += 1
+            continue
+
+        parent_id = seen.get((concept.system, concept.parentValue.lower()), None) \
+            if concept.parentValue is not None else None
+        row = {
+            'system': concept.system,
+            'value': concept.value,
+            'shortValue': concept.shortValue,
+            'display': concept.display,
+            'topic': concept.topic,
+            'codeType': concept.codeType,
+            'mapped': True,
+            'codeBookId': code_book_id,
+            'parentId': parent_id,
+        }
+
+        current = existing.get(key, None)
+        if current is None:
+            row['codeId'] = next_code_id
+            next_code_id += 1
+            plan.inserts.append(row)
+        else:
+            row['codeId'] = current.codeId
+            if current.mapped and all(getattr(current, field) == row[field] for field in _COMPARE_FIELDS):
+                plan.unchanged.append(current.codeId)
+            else:
+                plan.updates.append(row)
+
+        seen[key] = row['codeId']
+
+    return plan
+
+
+class CodeBookImporter(object):
+    """
+    Imports a FHIR CodeSystem code book into the Code and CodeHistory tables.
+    """
+
+    def __init__(self, batch_size: int = BULK_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.dao = CodeBookDao()
+
+    def load_existing_codes(self, session):
+        """
+        Return the existing codes indexed by (system, lower case value)
+        :return: dict
+        """
+        columns = [getattr(Code, field) for field in CodeInfo._fields]
+        codes = (CodeInfo(*row) for row in self.dao.get_query(session, columns).all())
+        return {(code.system, code.value.lower()): code for code in codes}
+
+    def _max(self, session, column):
+        return self.dao.get_query(session, func.max(column)).scalar() or 0
+
+    def get_latest(self):
+        """
+        Return the version and content hash of the latest code book
+        :return: tuple of (version, content hash), or None if no code book has been imported
+        """
+        with self.dao.session() as session:
+            query = self.dao.get_query(session, [CodeBook.version, CodeBook.contentHash])
+            return query.filter(CodeBook.latest.is_(True)).order_by(CodeBook.codeBookId.desc()).first()
+
+    def run(self, codebook: dict, content_hash: str = None):
+        """
+        Import the code book, writing only new and changed codes
+        :param codebook: FHIR CodeSystem dict
+        :param content_hash: fingerprint of the code book source content
+        :return: dict with the import counts
+        :raises CodeBookConflictError: if the version was imported with a different fingerprint
+        """
+        system = codebook['url']
+        version = codebook['version']
+
+        with self.dao.session() as session:
+            existing = self.dao.get_query(session, [CodeBook.codeBookId, CodeBook.contentHash]) \
+                .filter(CodeBook.system == system, CodeBook.version == version).first()
+            if existing and (not content_hash or existing.contentHash == content_hash):
+                return {'version': version, 'imported': False}
+
+        if existing and existing.contentHash is not None:
+            # The content changed without a new version, importing it would make the version ambiguous.
+            logging.error('code book {0} changed since it was imported: {1} != {2}.'.format(
+                version, content_hash, existing.contentHash))
+            raise CodeBookConflictError('code book {0} was already imported with different content.'.format(
+                version))
+
+        if existing:
+            # The version was imported from a source without this fingerprint. Store it, so the next
+            # import of the same content skips the download.
+            with self.dao.session() as session:
+                self.dao.get_query(session).filter(CodeBook.codeBookId == existing.codeBookId).update(
+                    {'contentHash': content_hash}, synchronize_session=False)
+            clear_code_caches()
+            return {'version': version, 'imported': False}
+
+        with self.dao.session() as session:
+            code_book_id = self._max(session, CodeBook.codeBookId) + 1
+            self.dao.get_query(session).filter(CodeBook.latest.is_(True)).update(
+                {'latest': False}, synchronize_session=False)
+            session.add(CodeBook(codeBookId=code_book_id, latest=True, name=codebook.get('name', system),
+                                 system=system, version=version, contentHash=content_hash))
+            session.flush()
+
+            plan = plan_codebook_import(iter_codebook_concepts(codebook), self.load_existing_codes(session),
+                                        code_book_id, self._max(session, Code.codeId) + 1)
+            self.apply(session, plan, code_book_id)
+
+        clear_code_caches()
+        invalidate_code_cache()
+
+        result = plan.summary()
+        result.update({'version': version, 'imported': True, 'codeBookId': code_book_id})
+        logging.info('imported code book {0}: {1}'.format(version, result))
+        return result
+
+    def apply(self, session, plan: CodeBookImportPlan, code_book_id: int):
+        """
+        Write the planned inserts and updates with batched statements, plus a history row for every
+        new or changed code.
+        """
+        code_table = Code.__table__
+        code_serializer = Code.get_serializer()
+
+        for batch in batches(plan.inserts, self.batch_size):
+            session.execute(code_table.insert(), [code_serializer.to_row(row) for row in batch])
+
+        stmt = code_table.update().where(code_table.c.code_id == bindparam('_code_id'))
+        for batch in batches(plan.updates, self.batch_size):
+            rows = list()
+            for row in batch:
+                row = code_serializer.to_row(row)
+                row['_code_id'] = row.pop('code_id')
+                rows.append(row)
+            session.execute(stmt, rows)
+
+        for batch in batches(plan.unchanged, self.batch_size):
+            session.execute(code_table.update().where(code_table.c.code_id.in_(batch)).values(
+                code_book_id=code_book_id))
+
+        history_table = CodeHistory.__table__
+        history_serializer = CodeHistory.get_serializer()
+        history_id = self._max(session, CodeHistory.codeHistoryId) + 1
+
+        for batch in batches(plan.inserts + plan.updates, self.batch_size):
+            rows = list()
+            for row in batch:
+                row = dict(row, codeHistoryId=history_id)
+                history_id += 1
+                rows.append(history_serializer.to_row(row))
+            session.execute(history_table.insert(), rows)
@@ -0,0 +1,146 @@
+#
+# This file is subject to the terms and conditions defined in the
+# file 'LICENSE', which is part of this source code package.
+#
+
+#
+# Code book sources. Each source can report a fingerprint of its current content without the code
+# book being downloaded or parsed, which is stored with the imported code book so an unchanged
+# code book can be skipped.
+#
+import hashlib
+import json
+import os
+
+import requests
+
+_CODEBOOK_URL_BASE = 'https://raw.githubusercontent.com/all-of-us-terminology/codebook-to-fhir/'
+CODEBOOK_ERRORS_URL = _CODEBOOK_URL_BASE + 'gh-pages/CodeSystem/ppi.issues.json'
+CODEBOOK_URL = _CODEBOOK_URL_BASE + 'gh-pages/CodeSystem/ppi.json'
+
+# Seconds to wait for the code book server.
+HTTP_TIMEOUT = 30
+
+
+class CodeBookSourceError(Exception):
+    """ The code book could not be read from the source """
+    pass
+
+
+def _sha256(data: bytes):
+    return 'sha256:' + hashlib.sha256(data).hexdigest()
+
+
+class CodeBookSource(object):
+    """
+    Base class for code book sources.
+    """
+
+    def fingerprint(self):
+        """
+        Return a string identifying the current content of the code book
+        :return: str
+        """
+        raise NotImplementedError()
+
+    def read(self):
+        """
+        Return the code book
+        :return: FHIR CodeSystem dict
+        """
+        raise NotImplementedError()
+
+
+class HttpCodeBookSource(CodeBookSource):
+    """
+    Code book published on a web server. The fingerprint is the ETag from a HEAD request, if the server
+    does not send one the code book has to be downloaded and hashed.
+    """
+
+    def __init__(self, url: str = CODEBOOK_URL):
+        self.url = url
+        self._content = None
+
+    def _get(self):
+        if self._content is None:
+            try:
+                resp = requests.get(self.url, timeout=HTTP_TIMEOUT)
+            except requests.RequestException as e:
+                raise CodeBookSourceError(str(e))
+            if resp.status_code != 200:
+                raise CodeBookSourceError('failed to retrieve current codebook.')
+            self._content = resp.content
+        return self._content
+
+    def fingerprint(self):
+        try:
+            resp = requests.head(self.url, timeout=HTTP_TIMEOUT, allow_redirects=True)
+        except requests.RequestException as e:
+            raise CodeBookSourceError(str(e))
+
+        etag = resp.headers.get('ETag', None) if resp.status_code == 200 else None
+        if etag:
+            return 'etag:' + etag.strip('"')
+        return _sha256(self._get())
+
+    def read(self):
+        try:
+            return json.loads(self._get().decode('utf-8'))
+        except ValueError as e:
+            raise CodeBookSourceError(str(e))
+
+
+class FileCodeBookSource(CodeBookSource):
+    """
+    Code book in a local file, the fingerprint is a hash of the file content.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def _read_bytes(self):
+        try:
+            with open(self.path, 'rb') as handle:
+                return handle.read()
+        except IOError as e:
+            raise CodeBookSourceError(str(e))
+
+    def fingerprint(self):
+        return _sha256(self._read_bytes())
+
+    def read(self):
+        try:
+            return json.loads(self._read_bytes().decode('utf-8'))
+        except ValueError as e:
+            raise CodeBookSourceError(str(e))
+
+
+class FixtureDirCodeBookSource(FileCodeBookSource):
+    """
+    Directory of code book fixture files, the last json file by name is used. Name files by version,
+    for example 'ppi-0.4.21.json', and drop in a new file to test an import.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        files = sorted(name for name in os.listdir(directory) if name.endswith('.json')) \
+            if os.path.isdir(directory) else list()
+        if not files:
+            raise CodeBookSourceError('no code book files found in {0}.'.format(directory))
+        super(FixtureDirCodeBookSource, self).__init__(os.path.join(directory, files[-1]))
+
+
+def get_codebook_source(location: str = None) -> CodeBookSource:
+    """
+    Return the code book source for a URL, file or fixture directory. Defaults to the CODEBOOK_SOURCE
+    environment variable, or the published code book if that is not set.
+    :param location: URL, file path or directory path
+    :return: CodeBookSource
+    """
+    location = location or os.environ.get('CODEBOOK_SOURCE', None) or CODEBOOK_URL
+
+    if location.startswith('http://') or location.startswith('https://'):
+        return HttpCodeBookSource(location)
+    if os.path.isdir(location):
+        return FixtureDirCodeBookSource(location)
+    return FileCodeBookSource(location)
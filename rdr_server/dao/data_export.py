@@ -0,0 +1,339 @@
+#
+# This file is subject to the terms and conditions defined in the
+# file 'LICENSE', which is part of this source code package.
+#
+
+#
+# Bulk export of participant data to CSV or Parquet files. Each table is split into chunks of primary
+# key ids, and the chunks are exported by a pool of worker processes. A chunk's rows are read from a
+# server side cursor in primary key order and written to one file per HPO, laid out as
+#
+#   <output dir>/<table>/hpo_id=<hpo id>/part-<first pk id>.<format>
+#
+# Completed chunks are recorded in <output dir>/<table>/_chunks, so an interrupted export resumes
+# with the chunks that were not finished. A chunk's existing part files are removed before it is
+# exported, the last chunk of a table is exported again by later runs as records are added. Parquet
+# output needs the optional pyarrow package.
+#
+#   python -m rdr_server.dao.data_export --output /data/export --format parquet --processes 8
+#
+import argparse
+import csv
+import enum
+import glob
+import json
+import logging
+import multiprocessing
+import os
+from collections import namedtuple
+
+from sqlalchemy import Boolean, Date, DateTime, Float, Integer, select, func
+
+from rdr_server.dao.base_dao import BaseDao, dispose_connections, STREAM_BATCH_SIZE
+from rdr_server.model.base_model import ModelEnum
+from rdr_server.model.biobank_stored_sample import BiobankStoredSample
+from rdr_server.model.participant import Participant
+from rdr_server.model.participant_summary import ParticipantSummary
+from rdr_server.model.questionnaire_response import QuestionnaireResponse, QuestionnaireResponseAnswer
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+EXPORT_FORMATS = ('csv', 'parquet')
+# Number of primary key ids in each export chunk.
+CHUNK_SIZE = 100000
+# Number of rows buffered for each Parquet row group.
+ROW_GROUP_SIZE = 10000
+# Partition name for rows without an HPO.
+NULL_PARTITION = '__HIVE_DEFAULT_PARTITION__'
+
+# A table to export. hpo_column is the HPO id to partition by, joined from the tables in joins if
+# the table has no HPO id of its own.
+ExportTable = namedtuple('ExportTable', ['model', 'hpo_column', 'joins'])
+
+EXPORT_TABLES = {
+    'participant_summary': ExportTable(ParticipantSummary, ParticipantSummary.hpoId, []),
+    'biobank_stored_sample': ExportTable(
+        BiobankStoredSample, Participant.hpoId,
+        [(Participant, Participant.biobankId == BiobankStoredSample.biobankId)]),
+    'questionnaire_response_answer': ExportTable(
+        QuestionnaireResponseAnswer, Participant.hpoId,
+        [(QuestionnaireResponse,
+          QuestionnaireResponse.questionnaireResponseId == QuestionnaireResponseAnswer.questionnaireResponseId),
+         (Participant, Participant.participantId == QuestionnaireResponse.participantId)]),
+}
+
+ExportChunk = namedtuple('ExportChunk', ['table', 'start', 'end'])
+
+
+def _export_value(value):
+    """ Convert a column value to a type both CSV and Parquet writers accept. """
+    if isinstance(value, enum.Enum):
+        return value.name
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return value
+
+
+def _parquet_type(col_type):
+    if isinstance(col_type, ModelEnum):
+        return pyarrow.string()
+    col_type = getattr(col_type, 'impl', col_type)
+    if isinstance(col_type, Boolean):
+        return pyarrow.bool_()
+    if isinstance(col_type, Integer):
+        return pyarrow.int64()
+    if isinstance(col_type, Float):
+        return pyarrow.float64()
+    if isinstance(col_type, DateTime):
+        return pyarrow.timestamp('us')
+    if isinstance(col_type, Date):
+        return pyarrow.date32()
+    return pyarrow.string()
+
+
+class CsvPartWriter(object):
+    """
+    Writes rows to a CSV file. The file is written under a temporary name and renamed when closed,
+    so only complete files have the final name. abort() removes the temporary file instead.
+    """
+
+    def __init__(self, path: str, columns: list):
+        self.path = path
+        self._file = open(path + '.tmp', 'w', newline='')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow([column.name for column in columns])
+
+    def write(self, row):
+        self._writer.writerow(row)
+
+    def close(self):
+        self._file.close()
+        os.replace(self.path + '.tmp', self.path)
+
+    def abort(self):
+        self._file.close()
+        os.remove(self.path + '.tmp')
+
+
+class ParquetPartWriter(object):
+    """
+    Writes rows to a Parquet file, one row group every ROW_GROUP_SIZE rows. The schema comes from the
+    column types so every row group has the same schema. Like CsvPartWriter, the file only gets its
+    final name when closed.
+    """
+
+    def __init__(self, path: str, columns: list):
+        if pyarrow is None:
+            raise RuntimeError('the pyarrow package is required for parquet exports.')
+        self.path = path
+        self._schema = pyarrow.schema([pyarrow.field(column.name, _parquet_type(column.type))
+                                       for column in columns])
+        self._writer = pyarrow.parquet.ParquetWriter(path + '.tmp', self._schema)
+        self._rows = list()
+
+    def _flush(self):
+        if self._rows:
+            columns = [list(values) for values in zip(*self._rows)]
+            arrays = [pyarrow.array(values, type=field.type) for values, field in zip(columns, self._schema)]
+            self._writer.write_table(pyarrow.Table.from_arrays(arrays, schema=self._schema))
+            self._rows = list()
+
+    def write(self, row):
+        self._rows.append(row)
+        if len(self._rows) >= ROW_GROUP_SIZE:
+            self._flush()
+
+    def close(self):
+        self._flush()
+        self._writer.close()
+        os.replace(self.path + '.tmp', self.path)
+
+    def abort(self):
+        self._writer.close()
+        os.remove(self.path + '.tmp')
+
+
+def _abort_writers(writers):
+    """ Abort every writer, a writer that fails to abort doesn't stop the others. """
+    for writer in writers:
+        try:
+            writer.abort()
+        except Exception:
+            logging.warning('failed to remove {0}.tmp.'.format(writer.path), exc_info=True)
+
+
+_WRITERS = {
+    'csv': CsvPartWriter,
+    'parquet': ParquetPartWriter,
+}
+
+
+class DataExporter(object):
+    """
+    Exports participant data tables to partitioned files.
+    """
+
+    def __init__(self, output_dir: str, export_format: str = 'csv', chunk_size: int = CHUNK_SIZE,
+                 batch_size: int = STREAM_BATCH_SIZE):
+        """
+        :param output_dir: directory to write the files to
+        :param export_format: 'csv' or 'parquet'
+        :param chunk_size: number of primary key ids in each chunk
+        :param batch_size: number of rows to fetch from the cursor at a time
+        """
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError('invalid export format: {0}'.format(export_format))
+        self.output_dir = output_dir
+        self.export_format = export_format
+        self.chunk_size = chunk_size
+        self.batch_size = batch_size
+
+    def _chunk_marker(self, chunk: ExportChunk):
+        return os.path.join(self.output_dir, chunk.table, '_chunks', '{0:012d}-{1:012d}'.format(chunk.start, chunk.end))
+
+    def get_chunks(self, table: str, since_pk_id: int = 0):
+        """
+        Return the chunks of a table that have not been exported yet. Chunk boundaries are multiples
+        of the chunk size, so they are the same between runs, except that the last chunk ends after
+        the current last primary key id.
+        :param table: table name
+        :param since_pk_id: only export records with a larger primary key id
+        :return: list of ExportChunk
+        """
+        model = EXPORT_TABLES[table].model
+        dao = BaseDao(model)
+        with dao.session() as session:
+            max_id = dao.get_query(session, func.max(model.pkId)).scalar() or 0
+
+        chunks = list()
+        start = since_pk_id + 1
+        while start <= max_id:
+            end = min((start // self.chunk_size + 1) * self.chunk_size, max_id + 1)
+            chunk = ExportChunk(table, start, end)
+            if not os.path.exists(self._chunk_marker(chunk)):
+                chunks.append(chunk)
+            start = end
+        return chunks
+
+    def export_chunk(self, chunk: ExportChunk):
+        """
+        Export the records of a chunk, from chunk.start up to but not including chunk.end
+        :param chunk: ExportChunk
+        :return: number of records exported
+        """
+        export_table = EXPORT_TABLES[chunk.table]
+        model = export_table.model
+        table = model.__table__
+        columns = list(table.columns)
+
+        from_clause = table
+        for join_model, condition in export_table.joins:
+            from_clause = from_clause.outerjoin(join_model.__table__, condition)
+        query = select(columns + [export_table.hpo_column.label('_export_hpo_id')]).select_from(from_clause)
+        query = query.where(table.c.id >= chunk.start).where(table.c.id < chunk.end).order_by(table.c.id)
+
+        self._remove_parts(chunk)
+        writers = dict()
+        count = 0
+        dao = BaseDao(model)
+        try:
+            with dao.session() as session:
+                result = session.execute(query.execution_options(stream_results=True))
+                while True:
+                    rows = result.fetchmany(self.batch_size)
+                    if not rows:
+                        break
+                    for row in rows:
+                        hpo_id = row[-1]
+                        writer = writers.get(hpo_id)
+                        if writer is None:
+                            writer = writers[hpo_id] = self._open_writer(chunk, hpo_id, columns)
+                        writer.write([_export_value(value) for value in row[:-1]])
+                    count += len(rows)
+
+            for hpo_id in list(writers):
+                writers[hpo_id].close()
+                del writers[hpo_id]
+        except Exception:
+            # Remove the partial files, the chunk is exported again by the next run.
+            _abort_writers(writers.values())
+            raise
+
+        marker = self._chunk_marker(chunk)
+        os.makedirs(os.path.dirname(marker), exist_ok=True)
+        with open(marker, 'w') as handle:
+            handle.write(str(count))
+        return count
+
+    def _part_name(self, chunk: ExportChunk, export_format: str):
+        return 'part-{0:012d}.{1}'.format(chunk.start, export_format)
+
+    def _remove_parts(self, chunk: ExportChunk):
+        """
+        Remove the files of an earlier export of the chunk's start id from every HPO partition. The last
+        chunk of a table is exported again with a later end once records are added, and a record that
+        moved to another HPO would otherwise stay in its old partition's file too.
+        """
+        pattern = os.path.join(glob.escape(os.path.join(self.output_dir, chunk.table)), 'hpo_id=*',
+                               self._part_name(chunk, '*'))
+        for path in glob.glob(pattern):
+            os.remove(path)
+
+    def _open_writer(self, chunk: ExportChunk, hpo_id, columns: list):
+        partition = 'hpo_id={0}'.format(hpo_id if hpo_id is not None else NULL_PARTITION)
+        directory = os.path.join(self.output_dir, chunk.table, partition)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, self._part_name(chunk, self.export_format))
+        return _WRITERS[self.export_format](path, columns)
+
+    def run(self, tables: list = None, processes: int = None, since_pk_id: int = 0):
+        """
+        Export the tables, skipping chunks finished by a previous run
+        :param tables: list of table names, all export tables if not given
+        :param processes: number of worker processes, defaults to the number of CPUs
+        :param since_pk_id: only export records with a larger primary key id
+        :return: dict of table name to number of records exported
+        """
+        tables = tables or sorted(EXPORT_TABLES)
+        chunks = [chunk for table in tables for chunk in self.get_chunks(table, since_pk_id)]
+        result = dict.fromkeys(tables, 0)
+        if not chunks:
+            return result
+
+        with multiprocessing.Pool(processes, initializer=dispose_connections) as pool:
+            args = [(self.output_dir, self.export_format, self.chunk_size, self.batch_size, chunk) for chunk in chunks]
+            for chunk, count in pool.imap_unordered(_export_chunk, args):
+                result[chunk.table] += count
+
+        logging.info('exported {0} chunks to {1}: {2}'.format(len(chunks), self.output_dir, result))
+        return result
+
+
+def _export_chunk(args):
+    output_dir, export_format, chunk_size, batch_size, chunk = args
+    exporter = DataExporter(output_dir, export_format, chunk_size, batch_size)
+    return chunk, exporter.export_chunk(chunk)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export participant data to partitioned files.')
+    parser.add_argument('--output', required=True, help='output directory')
+    parser.add_argument('--format', choices=EXPORT_FORMATS, default='csv')
+    parser.add_argument('--tables', nargs='+', choices=sorted(EXPORT_TABLES), default=None)
+    parser.add_argument('--processes', type=int, default=None, help='number of worker processes')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--since-pk-id', type=int, default=0, help='only export records after this pk id')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    exporter = DataExporter(args.output, args.format, args.chunk_size)
+    for table, count in sorted(exporter.run(args.tables, args.processes, args.since_pk_id).items()):
+        print('{0}: {1} records'.format(table, count))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,19 @@
+#
+# This file is subject to the terms and conditions defined in the
+# file 'LICENSE', which is part of this source code package.
+#
+
+from rdr_server.dao.base_dao import BaseDao
+from rdr_server.dao.cache import LRUCache
+from rdr_server.model.hpo import HPO
+
+# Shared by all DAO instances so writes through any of them invalidate the cached records.
+_cache = LRUCache('hpo', max_size=100, ttl=3600)
+
+
+class HPODao(BaseDao):
+
+    model = None  # type: HPO
+
+    def __init__(self):
+        super(HPODao, self).__init__(HPO, cache=_cache)
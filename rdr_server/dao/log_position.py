@@ -0,0 +1,187 @@
+#
+# This file is subject to the terms and conditions defined in the
+# file 'LICENSE', which is part of this source code package.
+#
+
+#
+# Ordered change log for participant data. Log positions are reserved in blocks with one INSERT per
+# block and handed out to writes of the change log models by a before_flush hook. Positions from
+# different processes' blocks are not used in commit order, so a block may only be used for a short
+# time after it is reserved, and the change feed only returns positions from blocks that can no longer
+# be used. Block reservation times and the change feed cutoff both come from the database server clock,
+# so they don't depend on the clocks of the processes agreeing. Deleted records do not appear in the
+# change log.
+#
+import heapq
+import threading
+import time
+from collections import namedtuple
+
+from sqlalchemy import event, func, literal_column
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from rdr_server.dao.base_dao import BaseDao, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, server_time_ago
+from rdr_server.model.biobank_order import BiobankOrder
+from rdr_server.model.log_position import LogPosition
+from rdr_server.model.measurements import PhysicalMeasurements
+
+# Models stamped with a log position whenever they are created or updated.
+CHANGE_LOG_MODELS = (BiobankOrder, PhysicalMeasurements)
+
+# Number of log positions reserved at a time.
+BLOCK_SIZE = 100
+# Number of seconds a reserved block may be used for, unused positions are skipped after this.
+BLOCK_TTL = 5
+# Number of seconds allowed for a write using a position to commit after its block expires.
+SETTLE_TIME = 5
+# Number of times reserving a block is retried when another process reserved the same positions.
+RESERVE_RETRIES = 5
+
+Change = namedtuple('Change', ['position', 'resource', 'pkId'])
+
+
+class LogPositionDao(BaseDao):
+
+    model = None  # type: LogPosition
+
+    def __init__(self):
+        super(LogPositionDao, self).__init__(LogPosition)
+
+    def reserve_block(self, size: int):
+        """
+        Insert log position rows for the next block of positions
+        :param size: number of positions
+        :return: first position of the block
+        """
+        table = LogPosition.__table__
+        for _ in range(RESERVE_RETRIES):
+            try:
+                with self.session() as session:
+                    start = (self.get_query(session, func.max(LogPosition.logPositionId)).scalar() or 0) + 1
+                    now = func.now(literal_column('6'))
+                    session.execute(table.insert().values(created=now, modified=now), [
+                        {'log_position_id': position} for position in range(start, start + size)
+                    ])
+                return start
+            except IntegrityError:
+                # Another process reserved the same positions first.
+                continue
+        raise RuntimeError('failed to reserve log positions.')
+
+    def get_horizon(self, settle_time: int = BLOCK_TTL + SETTLE_TIME):
+        """
+        Return the last position that can no longer be used by a write in progress, positions are
+        reserved in increasing order so this is the last position reserved before the settle time.
+        :param settle_time: number of seconds
+        :return: log position
+        """
+        with self.session() as session:
+            query = self.get_query(session, LogPosition.logPositionId)
+            query = query.filter(LogPosition.created < server_time_ago(settle_time))
+            row = query.order_by(LogPosition.logPositionId.desc()).first()
+            return row[0] if row else 0
+
+
+class LogPositionAllocator(object):
+    """
+    Hands out log positions from blocks reserved in the database. Thread safe, one allocator is shared
+    by every session in the process.
+    """
+
+    def __init__(self, block_size: int = BLOCK_SIZE, block_ttl: int = BLOCK_TTL):
+        self.block_size = block_size
+        self.block_ttl = block_ttl
+        self.dao = LogPositionDao()
+        self._lock = threading.Lock()
+        self._next = 0
+        self._end = 0
+        self._expires = 0
+
+    def allocate(self) -> int:
+        """
+        Return the next log position
+        :return: log position
+        """
+        with self._lock:
+            if self._next >= self._end or time.monotonic() >= self._expires:
+                # Measure the time to live from before the reservation, the block is visible to the
+                # change feed from its created time.
+                expires = time.monotonic() + self.block_ttl
+                self._next = self.dao.reserve_block(self.block_size)
+                self._end = self._next + self.block_size
+                self._expires = expires
+            position = self._next
+            self._next += 1
+            return position
+
+
+_allocator = LogPositionAllocator()
+
+
+@event.listens_for(Session, 'before_flush')
+def _stamp_log_positions(session, flush_context, instances):
+    """
+    Give every new or changed change log model record a new log position.
+    """
+    for obj in session.new:
+        if isinstance(obj, CHANGE_LOG_MODELS):
+            obj.logPositionId = _allocator.allocate()
+    for obj in session.dirty:
+        if isinstance(obj, CHANGE_LOG_MODELS) and session.is_modified(obj):
+            obj.logPositionId = _allocator.allocate()
+
+
+class ChangeLogService(object):
+    """
+    Serves the change log models' records in log position order.
+    """
+
+    def __init__(self, settle_time: int = BLOCK_TTL + SETTLE_TIME):
+        """
+        :param settle_time: number of seconds before positions are returned, must be at least the block
+                            time to live plus the longest time a write takes to commit.
+        """
+        self.settle_time = settle_time
+        self.dao = LogPositionDao()
+
+    def changes_since(self, position: int = 0, limit: int = DEFAULT_PAGE_SIZE):
+        """
+        Return the records written after a log position
+        :param position: last log position seen by the caller, 0 to start from the beginning
+        :param limit: maximum number of changes to return
+        :return: tuple of (list of Change, position to pass to the next call)
+        """
+        if not limit or limit < 1 or limit > MAX_PAGE_SIZE:
+            raise ValueError('invalid limit.')
+
+        horizon = self.dao.get_horizon(self.settle_time)
+        if position >= horizon:
+            return list(), position
+
+        changes = list()
+        with self.dao.session() as session:
+            for model in CHANGE_LOG_MODELS:
+                query = self.dao.get_query(session, [model.logPositionId, model.pkId])
+                query = query.filter(model.logPositionId > position, model.logPositionId <= horizon)
+                rows = query.order_by(model.logPositionId).limit(limit).all()
+                changes.append([Change(row[0], model.__tablename__, row[1]) for row in rows])
+
+        changes = list(heapq.merge(*changes))[:limit]
+        # When there are fewer changes than the limit everything up to the horizon has been read.
+        next_position = changes[-1].position if len(changes) == limit else horizon
+        return changes, next_position
+
+    def stream_changes(self, position: int = 0, batch_size: int = MAX_PAGE_SIZE):
+        """
+        Generator returning all the changes after a log position, up to the current horizon
+        :param position: last log position seen by the caller
+        :param batch_size: number of changes to read at a time
+        :return: generator of Change
+        """
+        while True:
+            changes, position = self.changes_since(position, batch_size)
+            for change in changes:
+                yield change
+            if len(changes) < batch_size:
+                return
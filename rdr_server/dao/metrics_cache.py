@@ -0,0 +1,437 @@
+#
+# This file is subject to the terms and conditions defined in the
+# file 'LICENSE', which is part of this source code package.
+#
+
+#
+# Builds the metrics_*_cache tables from a single scan of the participant summaries. Every daily count
+# is a count of participants in a state on that day, so each participant adds a +1 to a per HPO
+# difference array on the day it enters a state and a -1 on the day it leaves it. A cumulative sum of
+# each array then gives the counts for every day, so the build is linear in the number of participants
+# plus the number of HPO days, instead of one GROUP BY scan per day.
+#
+# Each build inserts a new generation of every cache table with its own date_inserted. The daily
+# refresh only recomputes the HPOs with changes since the previous generation and copies the records
+# of the other HPOs, so its cost follows the number of changed participants.
+#
+import bisect
+import itertools
+import logging
+from collections import namedtuple, OrderedDict
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import and_, func, literal, or_, select
+
+from rdr_server.common.enums import AGE_BUCKETS, Race, WithdrawalStatus
+from rdr_server.dao.base_dao import BaseDao, batches, BULK_BATCH_SIZE, STREAM_BATCH_SIZE
+from rdr_server.dao.code_cache import get_code_cache
+from rdr_server.model.hpo import HPO
+from rdr_server.model.metrics_cache import MetricsEnrollmentStatusCache, MetricsRaceCache, \
+    MetricsGenderCache, MetricsAgeCache
+from rdr_server.model.participant_summary import ParticipantSummary
+
+# Participant summary fields used by the cache builder, in ParticipantMetrics order.
+METRICS_FIELDS = ['hpoId', 'signUpTime', 'enrollmentStatusMemberTime', 'enrollmentStatusCoreStoredSampleTime',
+                  'race', 'genderIdentityId', 'dateOfBirth']
+ParticipantMetrics = namedtuple('ParticipantMetrics', METRICS_FIELDS)
+
+ENROLLMENT_STATUS_FIELDS = ['registeredCount', 'consentedCount', 'coreCount']
+
+# MetricsRaceCache field for each race answer, answers with more than one race count as multi ancestry.
+RACE_FIELDS = OrderedDict([
+    (Race.AMERICAN_INDIAN_OR_ALASKA_NATIVE, 'americanIndianAlaskaNative'),
+    (Race.ASIAN, 'asian'),
+    (Race.BLACK_OR_AFRICAN_AMERICAN, 'blackAfricanAmerican'),
+    (Race.MIDDLE_EASTERN_OR_NORTH_AFRICAN, 'middleEasternNorthAfrican'),
+    (Race.NATIVE_HAWAIIAN_OR_OTHER_PACIFIC_ISLANDER, 'nativeHawaiianOtherPacificIslander'),
+    (Race.WHITE, 'white'),
+    (Race.HISPANIC_LATINO_OR_SPANISH, 'hispanicLatinoSpanish'),
+    (Race.OTHER_RACE, 'noneOfTheseFullyDescribeMe'),
+    (Race.PREFER_NOT_TO_SAY, 'preferNotToAnswer'),
+    (Race.HLS_AND_WHITE, 'multiAncestry'),
+    (Race.HLS_AND_BLACK, 'multiAncestry'),
+    (Race.HLS_AND_ONE_OTHER_RACE, 'multiAncestry'),
+    (Race.HLS_AND_MORE_THAN_ONE_OTHER_RACE, 'multiAncestry'),
+    (Race.MORE_THAN_ONE_RACE, 'multiAncestry'),
+    (Race.UNSET, 'noAncestryChecked'),
+    (Race.PMI_Skip, 'noAncestryChecked'),
+])
+RACE_CACHE_FIELDS = list(OrderedDict.fromkeys(RACE_FIELDS.values()))
+
+# Number of seconds before the previous generation's date_inserted to look for modified participants,
+# covering writes that committed after the previous refresh started reading.
+REFRESH_SETTLE_TIME = 60
+# Number of cache generations kept by delete_old_generations().
+KEEP_GENERATIONS = 2
+
+# A cache generation, with the first and last days it has counts for.
+CacheGeneration = namedtuple('CacheGeneration', ['dateInserted', 'firstDate', 'lastDate'])
+
+# Gender name and age range of participants without an answer.
+UNSET = 'UNSET'
+
+# Lower bound of each age bucket in AGE_BUCKETS.
+_AGE_BOUNDS = [int(bucket.split('-')[0]) for bucket in AGE_BUCKETS]
+
+
+def _add_years(day: date, years: int) -> date:
+    try:
+        return day.replace(year=day.year + years)
+    except ValueError:
+        # February 29th in a year that is not a leap year.
+        return day.replace(year=day.year + years, month=3, day=1)
+
+
+def _age_bucket(date_of_birth: date, day: date) -> int:
+    age = day.year - date_of_birth.year - ((day.month, day.day) < (date_of_birth.month, date_of_birth.day))
+    return max(bisect.bisect_right(_AGE_BOUNDS, age) - 1, 0)
+
+
+class MetricsCacheAccumulator(object):
+    """
+    Accumulates the daily enrollment status, race, gender and age counts of each HPO from participant
+    metrics records. Does no database access.
+    """
+
+    def __init__(self, start_date: date, end_date: date):
+        """
+        :param start_date: first day to count
+        :param end_date: last day to count
+        """
+        self.start_date = start_date
+        self.days = (end_date - start_date).days + 1
+        # HPO id to series key to difference array, a series key is (cache table, name).
+        self._deltas = dict()
+
+    def _day(self, value) -> int:
+        """ Return the day index of a date or datetime. """
+        if isinstance(value, datetime):
+            value = value.date()
+        return max((value - self.start_date).days, 0)
+
+    def _add(self, series: dict, key, start: int, end: int = None):
+        """ Count a participant in a series from the start day up to, but not including, the end day. """
+        if start >= self.days or (end is not None and end <= start):
+            return
+        deltas = series.get(key)
+        if deltas is None:
+            deltas = series[key] = [0] * (self.days + 1)
+        deltas[start] += 1
+        if end is not None and end < self.days:
+            deltas[end] -= 1
+
+    def add(self, participant: ParticipantMetrics, gender_name: str = UNSET):
+        """
+        Add a participant's counts
+        :param participant: ParticipantMetrics record
+        :param gender_name: name of the participant's gender identity
+        """
+        if not participant.signUpTime:
+            return
+        series = self._deltas.get(participant.hpoId)
+        if series is None:
+            series = self._deltas[participant.hpoId] = dict()
+
+        registered = self._day(participant.signUpTime)
+        # Clamp the later states so a participant is only in one enrollment state at a time.
+        consented = max(self._day(participant.enrollmentStatusMemberTime), registered) \
+            if participant.enrollmentStatusMemberTime else None
+        core = max(self._day(participant.enrollmentStatusCoreStoredSampleTime), consented or registered) \
+            if participant.enrollmentStatusCoreStoredSampleTime else None
+
+        self._add(series, ('enrollment', 'registeredCount'), registered, consented if consented is not None else core)
+        if consented is not None:
+            self._add(series, ('enrollment', 'consentedCount'), consented, core)
+        if core is not None:
+            self._add(series, ('enrollment', 'coreCount'), core)
+
+        self._add(series, ('race', RACE_FIELDS.get(participant.race, 'noAncestryChecked')), registered)
+        self._add(series, ('gender', gender_name), registered)
+
+        if not participant.dateOfBirth:
+            self._add(series, ('age', UNSET), registered)
+            return
+        # Move the participant to the next age bucket on each birthday that crosses a bucket bound.
+        day = registered
+        bucket = _age_bucket(participant.dateOfBirth, date.fromordinal(self.start_date.toordinal() + day))
+        for next_bucket in range(bucket + 1, len(_AGE_BOUNDS)):
+            birthday = self._day(_add_years(participant.dateOfBirth, _AGE_BOUNDS[next_bucket]))
+            self._add(series, ('age', AGE_BUCKETS[bucket]), day, birthday)
+            if birthday >= self.days:
+                return
+            day, bucket = max(birthday, day), next_bucket
+        self._add(series, ('age', AGE_BUCKETS[bucket]), day)
+
+    def get_counts(self):
+        """
+        Return the daily counts of each HPO
+        :return: dict of HPO id to dict of series key to list of daily counts
+        """
+        return {
+            hpo_id: {key: list(itertools.accumulate(deltas[:self.days])) for key, deltas in series.items()}
+            for hpo_id, series in self._deltas.items()
+        }
+
+    def iter_cache_rows(self, date_inserted: datetime, hpo_names: dict):
+        """
+        Generator returning the cache table records of every HPO and day
+        :param date_inserted: cache generation timestamp stored in every record
+        :param hpo_names: dict of HPO id to HPO name
+        :return: generator of (model, dict keyed by model attribute key)
+        """
+        days = [date.fromordinal(self.start_date.toordinal() + day) for day in range(self.days)]
+        zeros = [0] * self.days
+
+        for hpo_id, series in sorted(self.get_counts().items()):
+            grouped = dict()
+            for (table, name), counts in series.items():
+                grouped.setdefault(table, dict())[name] = counts
+            base = {'dateInserted': date_inserted, 'hpoId': str(hpo_id), 'hpoName': hpo_names.get(hpo_id, UNSET)}
+
+            enrollment = grouped.get('enrollment', dict())
+            race = grouped.get('race', dict())
+            genders = sorted(grouped.get('gender', dict()).items())
+            ages = sorted(grouped.get('age', dict()).items())
+
+            for index, day in enumerate(days):
+                row = dict(base, date=day)
+                yield MetricsEnrollmentStatusCache, \
+                    dict(row, **{name: enrollment.get(name, zeros)[index] for name in ENROLLMENT_STATUS_FIELDS})
+                yield MetricsRaceCache, dict(row, **{name: race.get(name, zeros)[index] for name in RACE_CACHE_FIELDS})
+                for name, counts in genders:
+                    yield MetricsGenderCache, dict(row, genderName=name, genderCount=counts[index])
+                for name, counts in ages:
+                    yield MetricsAgeCache, dict(row, ageRange=name, ageCount=counts[index])
+
+
+class MetricsCacheBuilder(object):
+    """
+    Rebuilds every metrics cache table from one streamed scan of the participant summaries. Each build
+    inserts a new generation of records with the same date_inserted value, in a single transaction.
+    """
+
+    CACHE_MODELS = (MetricsEnrollmentStatusCache, MetricsRaceCache, MetricsGenderCache, MetricsAgeCache)
+
+    def __init__(self, batch_size: int = BULK_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.dao = BaseDao(ParticipantSummary)
+
+    def _participant_query(self, session, columns, hpo_ids: set = None):
+        query = self.dao.get_query(session, columns) \
+            .filter(ParticipantSummary.withdrawalStatus != WithdrawalStatus.NO_USE) \
+            .filter(ParticipantSummary.signUpTime.isnot(None))
+        if hpo_ids is not None:
+            query = query.filter(ParticipantSummary.hpoId.in_(hpo_ids))
+        return query
+
+    def get_start_date(self):
+        """
+        Return the first sign up date of a participant included in the metrics
+        :return: date or None
+        """
+        with self.dao.session() as session:
+            first = self._participant_query(session, func.min(ParticipantSummary.signUpTime)).scalar()
+        return first.date() if first else None
+
+    def stream_participants(self, batch_size: int = STREAM_BATCH_SIZE, hpo_ids: set = None):
+        """
+        Generator returning the metrics fields of every included participant
+        :param batch_size: number of rows to fetch from the cursor at a time
+        :param hpo_ids: only return participants of these HPOs, all HPOs if not given
+        :return: generator of ParticipantMetrics
+        """
+        columns = [getattr(ParticipantSummary, field) for field in METRICS_FIELDS]
+        with self.dao.session() as session:
+            query = self._participant_query(session, columns, hpo_ids).execution_options(stream_results=True)
+            for row in query.yield_per(batch_size):
+                yield ParticipantMetrics(*row)
+
+    def accumulate(self, start_date: date, end_date: date, hpo_ids: set = None) -> MetricsCacheAccumulator:
+        """
+        Scan the participant summaries and accumulate their counts
+        :param start_date: first day to count
+        :param end_date: last day to count
+        :param hpo_ids: only count participants of these HPOs, all HPOs if not given
+        :return: MetricsCacheAccumulator
+        """
+        accumulator = MetricsCacheAccumulator(start_date, end_date)
+        codes = get_code_cache()
+        gender_names = dict()
+        for participant in self.stream_participants(hpo_ids=hpo_ids):
+            gender_name = gender_names.get(participant.genderIdentityId)
+            if gender_name is None:
+                code = codes.get(participant.genderIdentityId) if participant.genderIdentityId else None
+                gender_name = gender_names[participant.genderIdentityId] = \
+                    (code.display or code.value) if code else UNSET
+            accumulator.add(participant, gender_name)
+        return accumulator
+
+    def _insert_rows(self, session, accumulator: MetricsCacheAccumulator, date_inserted: datetime, counts: dict):
+        hpo_names = dict(self.dao.get_query(session, [HPO.hpoId, HPO.name]).all())
+        for batch in batches(accumulator.iter_cache_rows(date_inserted, hpo_names), self.batch_size):
+            rows = OrderedDict((model, list()) for model in self.CACHE_MODELS)
+            for model, item in batch:
+                rows[model].append(model.get_serializer().to_row(item))
+            for model, model_rows in rows.items():
+                if model_rows:
+                    session.execute(model.__table__.insert(), model_rows)
+                    counts[model.__tablename__] += len(model_rows)
+
+    def write(self, accumulator: MetricsCacheAccumulator, date_inserted: datetime):
+        """
+        Insert the accumulated cache records in a single transaction
+        :param accumulator: MetricsCacheAccumulator
+        :param date_inserted: cache generation timestamp
+        :return: dict of cache table name to number of records inserted
+        """
+        counts = OrderedDict((model.__tablename__, 0) for model in self.CACHE_MODELS)
+        with self.dao.session() as session:
+            self._insert_rows(session, accumulator, date_inserted, counts)
+        return counts
+
+    def build(self, end_date: date = None):
+        """
+        Build a new generation of every metrics cache table
+        :param end_date: last day to count, defaults to today
+        :return: dict of cache table name to number of records inserted
+        """
+        date_inserted = datetime.utcnow()
+        end_date = end_date or date_inserted.date()
+        start_date = self.get_start_date()
+        if start_date is None or start_date > end_date:
+            return OrderedDict((model.__tablename__, 0) for model in self.CACHE_MODELS)
+
+        counts = self.write(self.accumulate(start_date, end_date), date_inserted)
+        logging.info('built metrics cache {0}: {1}'.format(date_inserted.isoformat(), dict(counts)))
+        return counts
+
+    def get_latest_generation(self, session):
+        """
+        Return the latest cache generation
+        :param session: Session object
+        :return: CacheGeneration or None if the cache is empty
+        """
+        cache = MetricsEnrollmentStatusCache
+        date_inserted = self.dao.get_query(session, func.max(cache.dateInserted)).scalar()
+        if date_inserted is None:
+            return None
+        first, last = self.dao.get_query(session, [func.min(cache.date), func.max(cache.date)]) \
+            .filter(cache.dateInserted == date_inserted).one()
+        return CacheGeneration(date_inserted, first, last)
+
+    def find_changed_hpos(self, session, generation: CacheGeneration, end_date: date):
+        """
+        Return the HPOs whose counts may differ from the given cache generation: HPOs of participants
+        modified since the generation was built, HPOs of participants moving to another age bucket
+        after the last day of the generation, and HPOs whose number of participants changed, which
+        catches participants that moved to another HPO or were deleted.
+        :param session: Session object
+        :param generation: CacheGeneration
+        :param end_date: last day to count
+        :return: set of HPO ids
+        """
+        hpo_id = ParticipantSummary.hpoId
+        since = generation.dateInserted - timedelta(seconds=REFRESH_SETTLE_TIME)
+        query = self._participant_query(session, hpo_id).filter(ParticipantSummary.lastModified > since)
+        hpo_ids = {row[0] for row in query.distinct()}
+
+        if end_date > generation.lastDate:
+            # Birthdays of a bucket bound in (last date, end date], widened a day for February 29th.
+            birthdays = [and_(ParticipantSummary.dateOfBirth >= _add_years(generation.lastDate, -bound),
+                              ParticipantSummary.dateOfBirth <= _add_years(end_date + timedelta(days=1), -bound))
+                         for bound in _AGE_BOUNDS if bound]
+            query = self._participant_query(session, hpo_id).filter(or_(*birthdays))
+            hpo_ids.update(row[0] for row in query.distinct())
+
+        cache = MetricsEnrollmentStatusCache
+        total = cache.registeredCount + cache.consentedCount + cache.coreCount
+        previous = self.dao.get_query(session, [cache.hpoId, total]) \
+            .filter(cache.dateInserted == generation.dateInserted, cache.date == generation.lastDate).all()
+        previous = {int(row[0]): row[1] for row in previous}
+        signed_up_before = datetime.combine(generation.lastDate + timedelta(days=1), datetime.min.time())
+        current = self._participant_query(session, [hpo_id, func.count()]) \
+            .filter(ParticipantSummary.signUpTime < signed_up_before) \
+            .group_by(hpo_id).all()
+        current = dict(current)
+        hpo_ids.update(key for key in set(previous) | set(current) if previous.get(key, 0) != current.get(key, 0))
+        return hpo_ids
+
+    def _copy_generation(self, session, generation: CacheGeneration, date_inserted: datetime, end_date: date,
+                         exclude_hpo_ids: set, counts: dict):
+        """
+        Copy the records of HPOs without changes to the new generation, and repeat their last day for
+        every day after the last day of the previous generation.
+        """
+        exclude = [str(hpo_id) for hpo_id in exclude_hpo_ids]
+        days = [generation.lastDate + timedelta(days=day)
+                for day in range(1, (end_date - generation.lastDate).days + 1)]
+
+        for model in self.CACHE_MODELS:
+            table = model.__table__
+            columns = [column for column in table.columns if column.name not in ('id', 'created', 'modified')]
+            condition = table.c.date_inserted == generation.dateInserted
+            if exclude:
+                condition = and_(condition, table.c.hpo_id.notin_(exclude))
+
+            values = {'date_inserted': literal(date_inserted, table.c.date_inserted.type)}
+            statements = [select([values.get(c.name, c) for c in columns]).where(condition)]
+            for day in days:
+                values['date'] = literal(day, table.c.date.type)
+                statements.append(select([values.get(c.name, c) for c in columns])
+                                  .where(and_(condition, table.c.date == generation.lastDate)))
+
+            for statement in statements:
+                result = session.execute(table.insert().from_select([c.name for c in columns], statement))
+                counts[model.__tablename__] += result.rowcount
+
+    def refresh(self, end_date: date = None):
+        """
+        Build a new cache generation from the latest one, recomputing only the HPOs with changes and
+        copying the records of the other HPOs. The new generation is written in a single transaction,
+        so readers of the latest generation switch to it when it commits. Does a full build if there
+        is no previous generation.
+        :param end_date: last day to count, defaults to today
+        :return: dict of cache table name to number of records inserted
+        """
+        date_inserted = datetime.utcnow()
+        end_date = end_date or date_inserted.date()
+
+        with self.dao.session() as session:
+            generation = self.get_latest_generation(session)
+            if generation is None or generation.lastDate > end_date:
+                return self.build(end_date)
+            hpo_ids = self.find_changed_hpos(session, generation, end_date)
+
+        # Recomputed HPOs start at the first day of the previous generation, earlier sign ups are
+        # counted from that day.
+        accumulator = self.accumulate(generation.firstDate, end_date, hpo_ids) if hpo_ids else None
+
+        counts = OrderedDict((model.__tablename__, 0) for model in self.CACHE_MODELS)
+        with self.dao.session() as session:
+            self._copy_generation(session, generation, date_inserted, end_date, hpo_ids, counts)
+            if accumulator:
+                self._insert_rows(session, accumulator, date_inserted, counts)
+
+        logging.info('refreshed metrics cache {0}, recomputed {1} HPOs: {2}'.format(
+            date_inserted.isoformat(), len(hpo_ids), dict(counts)))
+        return counts
+
+    def delete_old_generations(self, keep: int = KEEP_GENERATIONS):
+        """
+        Delete all but the latest cache generations
+        :param keep: number of generations to keep
+        :return: dict of cache table name to number of records deleted
+        """
+        counts = OrderedDict()
+        with self.dao.session() as session:
+            cache = MetricsEnrollmentStatusCache
+            kept = self.dao.get_query(session, cache.dateInserted).distinct() \
+                .order_by(cache.dateInserted.desc()).limit(keep).all()
+            if len(kept) < keep:
+                return counts
+            oldest = kept[-1][0]
+            for model in self.CACHE_MODELS:
+                table = model.__table__
+                result = session.execute(table.delete().where(table.c.date_inserted < oldest))
+                counts[model.__tablename__] = result.rowcount
+        return counts
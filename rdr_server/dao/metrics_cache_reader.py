@@ -0,0 +1,240 @@
+#
+# This file is subject to the terms and conditions defined in the
+# file 'LICENSE', which is part of this source code package.
+#
+
+#
+# Read access to the metrics cache tables. The records of a cache generation never change, so the
+# first request for a metric loads the whole latest generation of its table into per HPO daily arrays,
+# with the last day of every week and month precomputed. Requests are then answered from memory, and
+# responses are cached by (metric, HPOs, date range, period, generation). The latest generation is
+# looked up at most once every check interval, with a single row index lookup.
+#
+import bisect
+import threading
+import time
+from array import array
+from collections import namedtuple, OrderedDict
+from datetime import date, timedelta
+
+from sqlalchemy import func
+
+from rdr_server.dao.base_dao import BaseDao
+from rdr_server.dao.cache import LRUCache
+from rdr_server.dao.metrics_cache import ENROLLMENT_STATUS_FIELDS, RACE_CACHE_FIELDS
+from rdr_server.model.metrics_cache import MetricsEnrollmentStatusCache, MetricsRaceCache, \
+    MetricsGenderCache, MetricsAgeCache
+
+# Number of seconds between checks for a new cache generation.
+CHECK_INTERVAL = 60
+
+# A metric cache table. Tables with a name_field have one record per name and day, the other tables
+# have one record per day with a column for each name.
+MetricTable = namedtuple('MetricTable', ['model', 'name_field', 'count_fields'])
+
+METRIC_TABLES = OrderedDict([
+    ('enrollment', MetricTable(MetricsEnrollmentStatusCache, None, ENROLLMENT_STATUS_FIELDS)),
+    ('race', MetricTable(MetricsRaceCache, None, RACE_CACHE_FIELDS)),
+    ('gender', MetricTable(MetricsGenderCache, 'genderName', ['genderCount'])),
+    ('age', MetricTable(MetricsAgeCache, 'ageRange', ['ageCount'])),
+])
+
+# Rollup periods. The metrics are participant counts on a day, so the value of a period is the
+# value on its last day.
+PERIODS = ('day', 'week', 'month')
+
+
+def _is_period_end(day: date, period: str) -> bool:
+    if period == 'week':
+        # Weeks end on Sunday.
+        return day.weekday() == 6
+    if period == 'month':
+        return (day + timedelta(days=1)).day == 1
+    return True
+
+
+class MetricSnapshot(object):
+    """
+    The daily counts of one metric in one cache generation.
+    """
+
+    def __init__(self, metric: str, first_date: date, days: int, hpos: dict):
+        """
+        :param metric: metric name
+        :param first_date: first day of the generation
+        :param days: number of days in the generation
+        :param hpos: dict of HPO id to (HPO name, OrderedDict of name to array of daily counts)
+        """
+        self.metric = metric
+        self.first_date = first_date
+        self.days = days
+        self.hpos = hpos
+        # Day indexes of the last day of each period, in increasing order.
+        dates = [first_date + timedelta(days=day) for day in range(days)]
+        self.period_ends = {period: [day for day, value in enumerate(dates) if _is_period_end(value, period)]
+                            for period in PERIODS}
+
+    def _day(self, value: date) -> int:
+        return (value - self.first_date).days
+
+    def get_series(self, hpo_ids: list = None, start_date: date = None, end_date: date = None,
+                   period: str = 'day'):
+        """
+        Return the counts of the HPOs for the last day of each period in the date range. A period
+        cut short by the end of the range uses the last day of the range.
+        :param hpo_ids: list of HPO ids, all HPOs if not given
+        :param start_date: first day of the range, defaults to the first day of the generation
+        :param end_date: last day of the range, defaults to the last day of the generation
+        :param period: 'day', 'week' or 'month'
+        :return: list of dicts
+        """
+        if period not in PERIODS:
+            raise ValueError('invalid period: {0}'.format(period))
+        if not self.days:
+            return list()
+        start = max(self._day(start_date), 0) if start_date else 0
+        end = min(self._day(end_date), self.days - 1) if end_date else self.days - 1
+
+        ends = self.period_ends[period]
+        indexes = ends[bisect.bisect_left(ends, start):bisect.bisect_right(ends, end)]
+        if start <= end and (not indexes or indexes[-1] != end):
+            indexes.append(end)
+        dates = [(self.first_date + timedelta(days=index)).isoformat() for index in indexes]
+
+        items = list()
+        for hpo_id in (hpo_ids if hpo_ids is not None else sorted(self.hpos, key=lambda key: self.hpos[key][0])):
+            if hpo_id not in self.hpos:
+                continue
+            hpo_name, series = self.hpos[hpo_id]
+            items.append({
+                'hpoId': hpo_id,
+                'hpoName': hpo_name,
+                'data': [{'date': value, 'values': {name: counts[index] for name, counts in series.items()}}
+                         for index, value in zip(indexes, dates)]
+            })
+        return items
+
+
+class MetricsCacheReader(object):
+    """
+    Serves the latest metrics cache generation from memory.
+    """
+
+    def __init__(self, check_interval: int = CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self.dao = BaseDao(MetricsEnrollmentStatusCache)
+        self._snapshots = LRUCache('metrics_cache_snapshots', max_size=len(METRIC_TABLES) * 2, ttl=86400)
+        self._responses = LRUCache('metrics_cache_responses', max_size=1000, ttl=86400)
+        self._generation = None
+        self._next_check = 0
+        self._lock = threading.Lock()
+
+    def get_generation(self):
+        """
+        Return the date_inserted of the latest cache generation, checked once every check interval
+        :return: datetime or None if the cache is empty
+        """
+        # Wait for the first check, later checks are skipped while another thread is checking.
+        if self._next_check <= time.monotonic() and self._lock.acquire(blocking=not self._next_check):
+            try:
+                if self._next_check <= time.monotonic():
+                    with self.dao.session() as session:
+                        model = MetricsEnrollmentStatusCache
+                        self._generation = self.dao.get_query(session, func.max(model.dateInserted)).scalar()
+                    self._next_check = time.monotonic() + self.check_interval
+            finally:
+                self._lock.release()
+        return self._generation
+
+    def load_snapshot(self, metric: str, generation) -> MetricSnapshot:
+        """
+        Load the records of a metric cache generation
+        :param metric: metric name
+        :param generation: date_inserted of the generation
+        :return: MetricSnapshot
+        """
+        table = METRIC_TABLES[metric]
+        model = table.model
+        columns = [model.hpoId, model.hpoName, model.date] + \
+            ([getattr(model, table.name_field)] if table.name_field else []) + \
+            [getattr(model, field) for field in table.count_fields]
+
+        with self.dao.session() as session:
+            rows = self.dao.get_query(session, columns).filter(model.dateInserted == generation).all()
+            first_date, last_date = self.dao.get_query(session, [func.min(model.date), func.max(model.date)]) \
+                .filter(model.dateInserted == generation).one()
+        if not rows:
+            return MetricSnapshot(metric, None, 0, dict())
+
+        days = (last_date - first_date).days + 1
+        hpos = dict()
+        for row in rows:
+            hpo_id, hpo_name, day = row[:3]
+            series = hpos.setdefault(hpo_id, (hpo_name, OrderedDict()))[1]
+            if table.name_field:
+                names, counts = [row[3]], row[4:]
+            else:
+                names, counts = table.count_fields, row[3:]
+            index = (day - first_date).days
+            for name, count in zip(names, counts):
+                values = series.get(name)
+                if values is None:
+                    values = series[name] = array('l', [0]) * days
+                values[index] = count
+
+        if table.name_field:
+            hpos = {hpo_id: (hpo_name, OrderedDict(sorted(series.items())))
+                    for hpo_id, (hpo_name, series) in hpos.items()}
+        return MetricSnapshot(metric, first_date, days, hpos)
+
+    def get_snapshot(self, metric: str, generation) -> MetricSnapshot:
+        key = (metric, generation)
+        snapshot = self._snapshots.get(key)
+        if snapshot is None:
+            snapshot = self.load_snapshot(metric, generation)
+            self._snapshots.set(key, snapshot)
+        return snapshot
+
+    def get_metrics(self, metric: str, hpo_ids: list = None, start_date: date = None, end_date: date = None,
+                    period: str = 'day'):
+        """
+        Return the counts of a metric from the latest cache generation
+        :param metric: 'enrollment', 'race', 'gender' or 'age'
+        :param hpo_ids: list of HPO ids, all HPOs if not given
+        :param start_date: first day of the range
+        :param end_date: last day of the range
+        :param period: 'day', 'week' or 'month'
+        :return: dict
+        """
+        if metric not in METRIC_TABLES:
+            raise ValueError('invalid metric: {0}'.format(metric))
+        if period not in PERIODS:
+            raise ValueError('invalid period: {0}'.format(period))
+        if start_date and end_date and start_date > end_date:
+            raise ValueError('start date is after end date.')
+
+        generation = self.get_generation()
+        if generation is None:
+            return {'metric': metric, 'generation': None, 'period': period, 'items': list()}
+
+        hpo_ids = tuple(sorted(set(hpo_ids))) if hpo_ids else None
+        key = (metric, hpo_ids, start_date, end_date, period, generation)
+        response = self._responses.get(key)
+        if response is None:
+            snapshot = self.get_snapshot(metric, generation)
+            response = {
+                'metric': metric,
+                'generation': generation.isoformat(),
+                'period': period,
+                'items': snapshot.get_series(hpo_ids, start_date, end_date, period)
+            }
+            self._responses.set(key, response)
+        return response
+
+
+# The shared metrics cache reader for the process.
+_reader = MetricsCacheReader()
+
+
+def get_metrics_cache_reader() -> MetricsCacheReader:
+    return _reader
@@ -0,0 +1,409 @@
+#
+# This file is subject to the terms and conditions defined in the
+# file 'LICENSE', which is part of this source code package.
+#
+
+#
+# Sharded MetricsVersion pipeline. The participants are split into shards by primary key id, and a
+# pool of worker processes computes each shard's changes to the daily metrics of every HPO: the
+# number of participants entering and leaving each metric on each day. A shard's changes are written
+# to metrics_shard_bucket in the same transaction that marks the shard complete. Once every shard is
+# complete the changes are merged into cumulative daily MetricsBucket records, and the version is
+# marked complete in the same transaction. A pipeline that stops part way leaves its version in
+# progress, and the next run resumes it with the shards that are not complete.
+#
+#   python -m rdr_server.dao.metrics_pipeline --processes 8
+#
+import argparse
+import bisect
+import logging
+import multiprocessing
+from array import array
+from collections import Counter, namedtuple
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import func
+
+from rdr_server.common.enums import AGE_BUCKETS, PhysicalMeasurementsStatus, QuestionnaireStatus, \
+    WithdrawalStatus
+from rdr_server.common.metrics_bucket import BucketView, encode_bucket, METRIC_IDS, METRIC_NAMES
+from rdr_server.dao.base_dao import BaseDao, batches, dispose_connections, BULK_BATCH_SIZE, STREAM_BATCH_SIZE
+from rdr_server.dao.code_cache import get_code_cache
+from rdr_server.model.metrics import MetricsVersion, MetricsBucket, MetricsShard, MetricsShardBucket
+from rdr_server.model.participant_summary import ParticipantSummary
+
+# Number of participant shards of a new version.
+METRICS_SHARDS = 10
+# Version of the metrics computed by this pipeline. In progress versions with another data version are
+# abandoned instead of resumed.
+DATA_VERSION = 1
+# HPO id of the buckets with the metrics of all HPOs.
+ALL_HPOS = ''
+# Metric value of participants without a value, or with a value that has no metric id.
+UNSET = 'UNSET'
+
+# Participant summary fields used by the pipeline, in ParticipantMetrics order.
+METRICS_FIELDS = ['hpoId', 'signUpTime', 'enrollmentStatusMemberTime', 'enrollmentStatusCoreStoredSampleTime',
+                  'race', 'genderIdentityId', 'dateOfBirth', 'physicalMeasurementsStatus',
+                  'physicalMeasurementsTime', 'consentForElectronicHealthRecords',
+                  'consentForElectronicHealthRecordsTime', 'questionnaireOnTheBasics',
+                  'questionnaireOnTheBasicsTime', 'questionnaireOnOverallHealth',
+                  'questionnaireOnOverallHealthTime', 'questionnaireOnLifestyle', 'questionnaireOnLifestyleTime']
+ParticipantMetrics = namedtuple('ParticipantMetrics', METRICS_FIELDS)
+
+# Lower bound of each age bucket in AGE_BUCKETS.
+_AGE_BOUNDS = [int(bucket.split('-')[0]) for bucket in AGE_BUCKETS]
+
+
+def _date(value):
+    return value.date() if isinstance(value, datetime) else value
+
+
+def _add_years(day: date, years: int) -> date:
+    try:
+        return day.replace(year=day.year + years)
+    except ValueError:
+        # February 29th in a year that is not a leap year.
+        return day.replace(year=day.year + years, month=3, day=1)
+
+
+class MetricsChangeAccumulator(object):
+    """
+    Accumulates the number of participants entering and leaving each metric, by HPO and day. Does no
+    database access.
+    """
+
+    def __init__(self, end_date: date):
+        """
+        :param end_date: last day to count
+        """
+        self.end_date = end_date
+        # (HPO id, date) to dict of metric name to count.
+        self.added = dict()
+        self.removed = dict()
+        # Metric name to number of participants counted as UNSET because the name is not in METRIC_NAMES.
+        self.unknown = Counter()
+
+    def _count(self, changes: dict, hpo_id: str, day: date, name: str):
+        counts = changes.setdefault((hpo_id, day), dict())
+        counts[name] = counts.get(name, 0) + 1
+
+    def _states(self, hpo_id: str, prefix: str, states: list):
+        """
+        Count a participant in a sequence of metric values. Each value lasts from its start day until the
+        start day of the next value, or until after the end date for the last value.
+        :param states: list of (start day, value) in order, values not in METRIC_NAMES are counted as
+                       UNSET, so the values of a metric always add up to the number of participants
+        """
+        start = None
+        spans = list()
+        for day, value in states:
+            day = max(_date(day), start) if start else _date(day)
+            if spans and spans[-1][0] == day:
+                spans.pop()
+            name = prefix + value
+            if name not in METRIC_IDS:
+                self.unknown[name] += 1
+                name = prefix + UNSET
+            spans.append((day, name))
+            start = day
+
+        for (day, name), following in zip(spans, spans[1:] + [(None, None)]):
+            # Metrics without an UNSET value only have values with metric ids.
+            if day > self.end_date or name not in METRIC_IDS:
+                continue
+            self._count(self.added, hpo_id, day, name)
+            if following[0] is not None and following[0] <= self.end_date:
+                self._count(self.removed, hpo_id, following[0], name)
+
+    def add(self, participant: ParticipantMetrics, gender: str = None):
+        """
+        Add a participant's metrics from the day it signed up
+        :param participant: ParticipantMetrics record
+        :param gender: code value of the participant's gender identity
+        """
+        if not participant.signUpTime:
+            return
+        hpo_id = str(participant.hpoId)
+        signed_up = _date(participant.signUpTime)
+
+        self._states(hpo_id, 'Participant', [(signed_up, '')])
+
+        enrollment = [(signed_up, 'INTERESTED')]
+        if participant.enrollmentStatusMemberTime:
+            enrollment.append((participant.enrollmentStatusMemberTime, 'MEMBER'))
+        if participant.enrollmentStatusCoreStoredSampleTime:
+            enrollment.append((participant.enrollmentStatusCoreStoredSampleTime, 'FULL_PARTICIPANT'))
+        self._states(hpo_id, 'Participant.enrollmentStatus.', enrollment)
+
+        self._states(hpo_id, 'Participant.race.', [(signed_up, participant.race.name if participant.race else UNSET)])
+        self._states(hpo_id, 'Participant.genderIdentity.', [(signed_up, gender or UNSET)])
+
+        if participant.dateOfBirth:
+            ages = list()
+            bucket = max(bisect.bisect_right(_AGE_BOUNDS, self._age(participant.dateOfBirth, signed_up)) - 1, 0)
+            ages.append((signed_up, AGE_BUCKETS[bucket]))
+            for bound in range(bucket + 1, len(_AGE_BOUNDS)):
+                birthday = _add_years(participant.dateOfBirth, _AGE_BOUNDS[bound])
+                if birthday > self.end_date:
+                    break
+                ages.append((birthday, AGE_BUCKETS[bound]))
+            self._states(hpo_id, 'Participant.ageRange.', ages)
+        else:
+            self._states(hpo_id, 'Participant.ageRange.', [(signed_up, UNSET)])
+
+        status = participant.physicalMeasurementsStatus or PhysicalMeasurementsStatus.UNSET
+        if status == PhysicalMeasurementsStatus.COMPLETED and participant.physicalMeasurementsTime:
+            measurements = [(signed_up, UNSET), (participant.physicalMeasurementsTime, status.name)]
+        else:
+            measurements = [(signed_up, status.name)]
+        self._states(hpo_id, 'Participant.physicalMeasurementsStatus.', measurements)
+
+        samples = [(signed_up, UNSET)]
+        if participant.enrollmentStatusCoreStoredSampleTime:
+            samples.append((participant.enrollmentStatusCoreStoredSampleTime, 'RECEIVED'))
+        self._states(hpo_id, 'Participant.samplesToIsolateDNA.', samples)
+
+        submitted = sorted(_date(time) for status, time in (
+            (participant.questionnaireOnTheBasics, participant.questionnaireOnTheBasicsTime),
+            (participant.questionnaireOnOverallHealth, participant.questionnaireOnOverallHealthTime),
+            (participant.questionnaireOnLifestyle, participant.questionnaireOnLifestyleTime))
+            if status == QuestionnaireStatus.SUBMITTED and time)
+        self._states(hpo_id, 'Participant.numCompletedBaselinePPIModules.',
+                     [(signed_up, '0')] + [(day, str(count + 1)) for count, day in enumerate(submitted)])
+
+        status = participant.consentForElectronicHealthRecords or QuestionnaireStatus.UNSET
+        if status != QuestionnaireStatus.UNSET and participant.consentForElectronicHealthRecordsTime:
+            consent = [(signed_up, UNSET), (participant.consentForElectronicHealthRecordsTime, status.name)]
+        else:
+            consent = [(signed_up, status.name)]
+        self._states(hpo_id, 'Participant.consentForElectronicHealthRecords.', consent)
+
+    @staticmethod
+    def _age(date_of_birth: date, day: date) -> int:
+        return day.year - date_of_birth.year - ((day.month, day.day) < (date_of_birth.month, date_of_birth.day))
+
+    def iter_changes(self):
+        """
+        Generator returning the encoded changes of each HPO and day
+        :return: generator of (HPO id, date, added payload, removed payload)
+        """
+        for key in sorted(set(self.added) | set(self.removed)):
+            yield key[0], key[1], encode_bucket(self.added.get(key, dict())), \
+                encode_bucket(self.removed.get(key, dict()))
+
+
+class MetricsPipeline(object):
+    """
+    Computes a MetricsVersion from the participant summaries.
+    """
+
+    def __init__(self, shard_count: int = METRICS_SHARDS, batch_size: int = BULK_BATCH_SIZE):
+        """
+        :param shard_count: number of participant shards of a new version
+        :param batch_size: number of records to write per statement
+        """
+        self.shard_count = shard_count
+        self.batch_size = batch_size
+        self.dao = BaseDao(MetricsVersion)
+
+    def start_version(self) -> MetricsVersion:
+        """
+        Return the version in progress, or create a new version with its shards. In progress versions
+        with another data version are abandoned.
+        :return: MetricsVersion
+        """
+        with self.dao.session() as session:
+            version = self.dao.get_query(session).filter(MetricsVersion.inProgress.is_(True)) \
+                .order_by(MetricsVersion.metricsVersionId.desc()).first()
+            if version and version.dataVersion == DATA_VERSION:
+                logging.info('resuming metrics version {0}'.format(version.metricsVersionId))
+                session.expunge(version)
+                return version
+
+            # Abandoned versions are never merged, their partial buckets are no longer needed.
+            for abandoned in self.dao.get_query(session).filter(MetricsVersion.inProgress.is_(True)):
+                abandoned.inProgress = False
+                self.dao.get_query(session, MetricsShardBucket).filter(
+                    MetricsShardBucket.metricsVersionId == abandoned.metricsVersionId).delete(synchronize_session=False)
+
+            last_id = self.dao.get_query(session, func.max(MetricsVersion.metricsVersionId)).scalar() or 0
+            version = MetricsVersion(metricsVersionId=last_id + 1, inProgress=True, complete=False,
+                                     date=datetime.utcnow(), dataVersion=DATA_VERSION)
+            session.add(version)
+            session.add_all(MetricsShard(metricsVersionId=version.metricsVersionId, shard=shard, complete=False)
+                            for shard in range(self.shard_count))
+            session.flush()
+            session.expunge(version)
+            return version
+
+    def get_unfinished_shards(self, version_id: int):
+        """
+        Return the shards of a version that are not complete
+        :param version_id: metrics version id
+        :return: tuple of (list of shard numbers, shard count)
+        """
+        with self.dao.session() as session:
+            rows = self.dao.get_query(session, [MetricsShard.shard, MetricsShard.complete]) \
+                .filter(MetricsShard.metricsVersionId == version_id).all()
+        return sorted(row.shard for row in rows if not row.complete), len(rows)
+
+    def stream_participants(self, shard: int, shard_count: int, batch_size: int = STREAM_BATCH_SIZE):
+        """
+        Generator returning the metrics fields of the included participants of a shard
+        :return: generator of ParticipantMetrics
+        """
+        columns = [getattr(ParticipantSummary, field) for field in METRICS_FIELDS]
+        with self.dao.session() as session:
+            query = self.dao.get_query(session, columns) \
+                .filter(ParticipantSummary.withdrawalStatus != WithdrawalStatus.NO_USE) \
+                .filter(ParticipantSummary.signUpTime.isnot(None)) \
+                .filter(ParticipantSummary.pkId % shard_count == shard) \
+                .execution_options(stream_results=True)
+            for row in query.yield_per(batch_size):
+                yield ParticipantMetrics(*row)
+
+    def compute_shard(self, version_id: int, shard: int, shard_count: int, end_date: date):
+        """
+        Compute and write the metric changes of a shard, and mark the shard complete
+        :param version_id: metrics version id
+        :param shard: shard number
+        :param shard_count: number of shards of the version
+        :param end_date: last day of the version
+        :return: number of change records written
+        """
+        accumulator = MetricsChangeAccumulator(end_date)
+        codes = get_code_cache()
+        for participant in self.stream_participants(shard, shard_count):
+            code = codes.get(participant.genderIdentityId) if participant.genderIdentityId else None
+            accumulator.add(participant, code.value if code else None)
+        if accumulator.unknown:
+            logging.warning('metrics version {0} shard {1}: values without a metric id counted as UNSET: {2}'.format(
+                version_id, shard, dict(accumulator.unknown)))
+
+        table = MetricsShardBucket.__table__
+        count = 0
+        with self.dao.session() as session:
+            # Remove the changes of an earlier attempt, in case one was written without its shard row.
+            session.execute(table.delete().where(table.c.metrics_version_id == version_id)
+                            .where(table.c.shard == shard))
+            for batch in batches(accumulator.iter_changes(), self.batch_size):
+                session.execute(table.insert(), [
+                    {'metrics_version_id': version_id, 'shard': shard, 'hpo_id': hpo_id, 'date': day,
+                     'added_metrics': added, 'removed_metrics': removed}
+                    for hpo_id, day, added, removed in batch
+                ])
+                count += len(batch)
+            self.dao.get_query(session, MetricsShard) \
+                .filter(MetricsShard.metricsVersionId == version_id, MetricsShard.shard == shard) \
+                .update({MetricsShard.complete: True}, synchronize_session=False)
+        return count
+
+    def _iter_buckets(self, version_id: int, hpo_id: str, changes: list, first_date: date, end_date: date,
+                      all_hpos: list):
+        """
+        Generator returning the MetricsBucket rows of an HPO from its changes in date order, and adding
+        the counts to the totals of all HPOs
+        """
+        added = array('q', [0]) * (len(METRIC_NAMES) + 1)
+        removed = array('q', [0]) * (len(METRIC_NAMES) + 1)
+        index = 0
+        for offset in range((end_date - first_date).days + 1):
+            day = first_date + timedelta(days=offset)
+            while index < len(changes) and changes[index][0] == day:
+                BucketView(changes[index][1]).add_to(added)
+                BucketView(changes[index][2]).add_to(removed)
+                index += 1
+            counts = [a - r for a, r in zip(added, removed)]
+            totals = all_hpos[offset]
+            for metric_id, count in enumerate(counts):
+                totals[metric_id] += count
+            yield {'metrics_version_id': version_id, 'date': day, 'hpo_id': hpo_id,
+                   'metrics': encode_bucket({METRIC_NAMES[i - 1]: c for i, c in enumerate(counts) if i and c})}
+
+    def merge(self, version_id: int, end_date: date):
+        """
+        Merge the changes of every shard into daily MetricsBucket records, delete the changes and mark
+        the version complete, in a single transaction
+        :param version_id: metrics version id
+        :param end_date: last day of the version
+        :return: number of buckets written
+        """
+        table = MetricsBucket.__table__
+        count = 0
+        with self.dao.session() as session:
+            query = self.dao.get_query(session, [func.min(MetricsShardBucket.date)]) \
+                .filter(MetricsShardBucket.metricsVersionId == version_id)
+            first_date = query.scalar()
+            hpo_ids = [row[0] for row in self.dao.get_query(session, MetricsShardBucket.hpoId).distinct()
+                       .filter(MetricsShardBucket.metricsVersionId == version_id)]
+
+            if first_date is not None:
+                all_hpos = [array('q', [0]) * (len(METRIC_NAMES) + 1)
+                            for _ in range((end_date - first_date).days + 1)]
+                for hpo_id in sorted(hpo_ids):
+                    changes = self.dao.get_query(session, [MetricsShardBucket.date, MetricsShardBucket.addedMetrics,
+                                                           MetricsShardBucket.removedMetrics]) \
+                        .filter(MetricsShardBucket.metricsVersionId == version_id,
+                                MetricsShardBucket.hpoId == hpo_id) \
+                        .order_by(MetricsShardBucket.date).all()
+                    rows = self._iter_buckets(version_id, hpo_id, changes, first_date, end_date, all_hpos)
+                    for batch in batches(rows, self.batch_size):
+                        session.execute(table.insert(), batch)
+                        count += len(batch)
+
+                rows = [{'metrics_version_id': version_id, 'date': first_date + timedelta(days=offset),
+                         'hpo_id': ALL_HPOS,
+                         'metrics': encode_bucket({METRIC_NAMES[i - 1]: c for i, c in enumerate(totals) if i and c})}
+                        for offset, totals in enumerate(all_hpos)]
+                for batch in batches(rows, self.batch_size):
+                    session.execute(table.insert(), batch)
+                    count += len(batch)
+
+            self.dao.get_query(session, MetricsShardBucket) \
+                .filter(MetricsShardBucket.metricsVersionId == version_id).delete(synchronize_session=False)
+            self.dao.get_query(session).filter(MetricsVersion.metricsVersionId == version_id) \
+                .update({MetricsVersion.inProgress: False, MetricsVersion.complete: True}, synchronize_session=False)
+        return count
+
+    def run(self, processes: int = None):
+        """
+        Compute a new metrics version, or resume the version in progress
+        :param processes: number of worker processes, defaults to the number of CPUs
+        :return: metrics version id
+        """
+        version = self.start_version()
+        version_id = version.metricsVersionId
+        end_date = version.date.date()
+        shards, shard_count = self.get_unfinished_shards(version_id)
+
+        if shards:
+            args = [(self.batch_size, version_id, shard, shard_count, end_date) for shard in shards]
+            with multiprocessing.Pool(processes, initializer=dispose_connections) as pool:
+                for shard, count in pool.imap_unordered(_compute_shard, args):
+                    logging.info('metrics version {0}: shard {1} complete, {2} changes'.format(
+                        version_id, shard, count))
+
+        count = self.merge(version_id, end_date)
+        logging.info('metrics version {0} complete: {1} buckets'.format(version_id, count))
+        return version_id
+
+
+def _compute_shard(args):
+    batch_size, version_id, shard, shard_count, end_date = args
+    pipeline = MetricsPipeline(shard_count, batch_size)
+    return shard, pipeline.compute_shard(version_id, shard, shard_count, end_date)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compute a metrics version.')
+    parser.add_argument('--processes', type=int, default=None, help='number of worker processes')
+    parser.add_argument('--shards', type=int, default=METRICS_SHARDS, help='number of shards of a new version')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    print('metrics version {0}'.format(MetricsPipeline(args.shards).run(args.processes)))
+
+
+if __name__ == '__main__':
+    main()
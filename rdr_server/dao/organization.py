@@ -0,0 +1,19 @@
+#
+# This file is subject to the terms and conditions defined in the
+# file 'LICENSE', which is part of this source code package.
+#
+
+from rdr_server.dao.base_dao import BaseDao
+from rdr_server.dao.cache import LRUCache
+from rdr_server.model.organization import Organization
+
+# Shared by all DAO instances so writes through any of them invalidate the cached records.
+_cache = LRUCache('organization', max_size=1000, ttl=3600)
+
+
+class OrganizationDao(BaseDao):
+
+    model = None  # type: Organization
+
+    def __init__(self):
+        super(OrganizationDao, self).__init__(Organization, cache=_cache)
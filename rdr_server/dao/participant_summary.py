@@ -0,0 +1,116 @@
+#
+# This file is subject to the terms and conditions defined in the
+# file 'LICENSE', which is part of this source code package.
+#
+from sqlalchemy import and_, case, null
+from sqlalchemy.orm import Query
+
+from rdr_server.common.enums import SuspensionStatus, WithdrawalStatus
+from rdr_server.dao.base_dao import BaseDao
+from rdr_server.model.participant_summary import ParticipantSummary, ParticipantSummaryQueue, \
+    WITHDRAWN_PARTICIPANT_FIELDS, SUSPENDED_PARTICIPANT_FIELDS
+
+
+# Conditions under which the masked fields of a participant may be returned.
+_NOT_WITHDRAWN = ParticipantSummary.withdrawalStatus != WithdrawalStatus.NO_USE
+_NOT_SUSPENDED = ParticipantSummary.suspensionStatus != SuspensionStatus.NO_CONTACT
+
+
+def _mask_conditions(fields):
+    """
+    Return the conditions selecting the participants for which none of the fields are masked
+    :param fields: iterable of participant summary attribute keys
+    :return: list of filter expressions, empty if the fields are never masked
+    """
+    fields = list(fields)
+    conditions = list()
+    if any(key not in WITHDRAWN_PARTICIPANT_FIELDS for key in fields):
+        conditions.append(_NOT_WITHDRAWN)
+    if any(key in SUSPENDED_PARTICIPANT_FIELDS for key in fields):
+        conditions.append(_NOT_SUSPENDED)
+    return conditions
+
+
+def _masked_column(key):
+    """
+    Return the select expression for a participant summary field. Fields that may not be returned for
+    withdrawn or suspended participants are selected as NULL for those participants.
+    :param key: model attribute key
+    :return: labeled column expression
+    """
+    column = getattr(ParticipantSummary, key)
+    conditions = _mask_conditions([key])
+    if not conditions:
+        return column.label(key)
+    return case([(and_(*conditions), column)], else_=null()).label(key)
+
+
+class ParticipantSummaryDao(BaseDao):
+
+    model = None  # type: ParticipantSummary
+    # Attribute key to masked select expression, built on first use.
+    _projection_columns = None
+
+    def __init__(self):
+        super(ParticipantSummaryDao, self).__init__(ParticipantSummary)
+
+    def get_projection(self, fields: list = None):
+        """
+        Return the masked select expressions for the requested fields
+        :param fields: list of participant summary attribute keys, all fields if not given
+        :return: list of labeled column expressions
+        """
+        columns = ParticipantSummaryDao._projection_columns
+        if columns is None:
+            keys = self.model.get_serializer().column_keys
+            columns = ParticipantSummaryDao._projection_columns = {key: _masked_column(key) for key in keys}
+
+        if not fields:
+            return list(columns.values())
+        unknown = [key for key in fields if key not in columns]
+        if unknown:
+            raise ValueError('invalid participant summary fields: {0}'.format(', '.join(unknown)))
+        return [columns[key] for key in fields]
+
+    def get_unmasked_filters(self, fields):
+        """
+        Return the filters selecting the participants for which none of the fields are masked. Queries
+        filtering or sorting on masked fields apply them, so the masked values can't be matched or
+        ordered by.
+        :param fields: iterable of participant summary attribute keys
+        :return: list of filter expressions
+        """
+        return _mask_conditions(fields)
+
+    def query_fields(self, session, fields: list = None) -> Query:
+        """
+        Return a query selecting only the requested fields, with withdrawn and suspended participant
+        fields masked in the select
+        :param session: Session object
+        :param fields: list of participant summary attribute keys, all fields if not given
+        :return: Query object
+        """
+        return self.get_query(session, self.get_projection(fields))
+
+    def get_summaries(self, participant_ids: list, fields: list = None):
+        """
+        Return the requested fields of the participant summaries
+        :param participant_ids: list of participant ids
+        :param fields: list of participant summary attribute keys, all fields if not given
+        :return: list of dicts
+        """
+        columns = self.get_projection(fields)
+        keys = [column.key for column in columns]
+        serializer = self.model.get_serializer()
+
+        with self.session() as session:
+            query = self.get_query(session, columns).filter(ParticipantSummary.participantId.in_(participant_ids))
+            return [serializer.row_to_dict(keys, row) for row in query]
+
+
+class ParticipantSummaryQueueDao(BaseDao):
+
+    model = None  # type: ParticipantSummaryQueue
+
+    def __init__(self):
+        super(ParticipantSummaryQueueDao, self).__init__(ParticipantSummaryQueue)
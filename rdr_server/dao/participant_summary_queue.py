@@ -0,0 +1,158 @@
+#
+# This file is subject to the terms and conditions defined in the
+# file 'LICENSE', which is part of this source code package.
+#
+
+#
+# Incremental participant summary maintenance. An after_flush hook adds the participants touched by
+# writes to the summary source tables to the participant_summary_queue table, in the same transaction
+# as the write, and a worker drains the queue in batches with ParticipantSummaryRecomputer. Repeated
+# touches of the same participant are coalesced into a single recompute. Workers lock the queue rows of
+# their batch with SELECT ... FOR UPDATE SKIP LOCKED, so several workers can drain the queue at once,
+# and claim them at READ COMMITTED so the locks don't block new queue rows.
+#
+import itertools
+import logging
+import threading
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from rdr_server.dao.base_dao import BULK_BATCH_SIZE
+from rdr_server.dao.participant_summary import ParticipantSummaryQueueDao
+from rdr_server.dao.participant_summary_recompute import ParticipantSummaryRecomputer
+from rdr_server.model.biobank_order import BiobankOrder, BiobankOrderedSample
+from rdr_server.model.biobank_stored_sample import BiobankStoredSample
+from rdr_server.model.measurements import PhysicalMeasurements
+from rdr_server.model.participant import Participant
+from rdr_server.model.participant_summary import ParticipantSummaryQueue
+from rdr_server.model.questionnaire_response import QuestionnaireResponse
+
+# Number of seconds the worker waits before checking an empty queue again.
+POLL_INTERVAL = 2
+# Maximum number of batches drained by a single /internal/ProcessSummaryQueue request.
+REQUEST_MAX_BATCHES = 20
+
+# Models with a participantId column that are sources of the participant summary.
+_PARTICIPANT_MODELS = (BiobankOrder, PhysicalMeasurements, QuestionnaireResponse)
+
+
+def enqueue_participants(session, participant_ids):
+    """
+    Add participants to the summary queue in the session's transaction. Writes made with Core
+    statements bypass the flush hook and should call this directly.
+    :param session: Session object
+    :param participant_ids: iterable of participant ids
+    """
+    rows = [{'participant_id': participant_id} for participant_id in set(participant_ids) if participant_id]
+    if rows:
+        session.execute(ParticipantSummaryQueue.__table__.insert(), rows)
+
+
+def _select_column(session, column, key_column, keys):
+    if not keys:
+        return set()
+    return {row[0] for row in session.execute(select([column]).where(key_column.in_(keys)))}
+
+
+@event.listens_for(Session, 'after_flush')
+def _enqueue_flushed_participants(session, flush_context):
+    """
+    Queue the participants of all summary source records written by the flush. Stored samples and
+    ordered samples don't have a participant id, it is looked up from their biobank id or order.
+    """
+    participant_ids = set()
+    biobank_ids = set()
+    order_ids = set()
+
+    for obj in itertools.chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, _PARTICIPANT_MODELS):
+            participant_ids.add(obj.participantId)
+        elif isinstance(obj, BiobankStoredSample):
+            biobank_ids.add(obj.biobankId)
+        elif isinstance(obj, BiobankOrderedSample):
+            order_ids.add(obj.biobankOrderId)
+
+    participant_ids.update(_select_column(session, Participant.participantId, Participant.biobankId,
+                                          biobank_ids))
+    participant_ids.update(_select_column(session, BiobankOrder.participantId, BiobankOrder.biobankOrderId,
+                                          order_ids))
+    enqueue_participants(session, participant_ids)
+
+
+class ParticipantSummaryQueueWorker(object):
+    """
+    Drains the participant summary queue. Each batch of queued participants is claimed, recomputed and
+    removed from the queue in a single transaction, so a failed batch is retried by the next drain.
+    Queue rows added while a batch is being recomputed are left for the next batch.
+    """
+
+    def __init__(self, batch_size: int = BULK_BATCH_SIZE, poll_interval: int = POLL_INTERVAL):
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.dao = ParticipantSummaryQueueDao()
+        self.recomputer = ParticipantSummaryRecomputer(batch_size)
+
+    def claim_statement(self):
+        """
+        Return the select locking the queue rows of the next batch until the transaction ends. Rows
+        already locked by another worker are skipped. SQLAlchemy 1.2 doesn't compile skip_locked for
+        MySQL, so SKIP LOCKED is added as a MySQL suffix.
+        :return: Select
+        """
+        table = ParticipantSummaryQueue.__table__
+        return select([table.c.id, table.c.participant_id]).order_by(table.c.id).limit(self.batch_size) \
+            .with_for_update().suffix_with('SKIP LOCKED', dialect='mysql')
+
+    def drain_batch(self):
+        """
+        Recompute the summaries of the next batch of queued participants
+        :return: dict with the number of queue rows processed and summaries updated, unchanged and missing
+        """
+        with self.dao.session() as session:
+            if session.get_bind().dialect.name == 'mysql':
+                # Without gap locks the claim doesn't block the queue inserts of other transactions
+                # while the batch is being recomputed.
+                session.connection(execution_options={'isolation_level': 'READ COMMITTED'})
+            rows = session.execute(self.claim_statement()).fetchall()
+            if not rows:
+                return {'queued': 0, 'updated': 0, 'unchanged': 0, 'missing': 0}
+
+            result = self.recomputer.recompute_batch(session, list({row.participant_id for row in rows}))
+
+            self.dao.get_query(session).filter(ParticipantSummaryQueue.pkId.in_([row.id for row in rows])) \
+                .delete(synchronize_session=False)
+
+        result['queued'] = len(rows)
+        return result
+
+    def drain(self, max_batches: int = None):
+        """
+        Drain batches until the queue is empty or the maximum number of batches has been drained
+        :param max_batches: optional maximum number of batches to drain
+        :return: dict with the totals of all batches
+        """
+        totals = {'queued': 0, 'updated': 0, 'unchanged': 0, 'missing': 0}
+        for _ in itertools.count() if max_batches is None else range(max_batches):
+            result = self.drain_batch()
+            if not result['queued']:
+                break
+            for key, value in result.items():
+                totals[key] += value
+
+        if totals['queued']:
+            logging.info('drained participant summary queue: {0}'.format(totals))
+        return totals
+
+    def run(self, stop_event: threading.Event = None):
+        """
+        Drain the queue continuously, polling an empty queue every poll_interval seconds
+        :param stop_event: optional event that stops the worker when set
+        """
+        stop_event = stop_event or threading.Event()
+        while not stop_event.is_set():
+            try:
+                self.drain()
+            except Exception:  # pylint: disable=broad-except
+                logging.exception('failed to drain participant summary queue')
+            stop_event.wait(self.poll_interval)
@@ -0,0 +1,443 @@
+#
+# This file is subject to the terms and conditions defined in the
+# file 'LICENSE', which is part of this source code package.
+#
+
+#
+# Bulk recompute of the derived participant summary fields. For each batch of participants the source
+# tables are read once with IN queries, the rows are grouped by participant and the summary fields are
+# computed in python, then the changed summaries are written back with a single executemany() update.
+# Batches are independent of each other, so a full rebuild can be split into shards run in parallel.
+#
+import logging
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import bindparam
+
+from rdr_server.common.code_constants import BIOBANK_TESTS, BIOBANK_TESTS_SET, \
+    CONSENT_FOR_STUDY_ENROLLMENT_MODULE, CONSENT_FOR_ELECTRONIC_HEALTH_RECORDS_MODULE, \
+    CONSENT_FOR_DVEHR_MODULE, OVERALL_HEALTH_PPI_MODULE, LIFESTYLE_PPI_MODULE, THE_BASICS_PPI_MODULE, \
+    FAMILY_HISTORY_MODULE, PERSONAL_MEDICAL_HISTORY_MODULE, MEDICATIONS_MODULE, HEALTHCARE_ACCESS_MODULE
+from rdr_server.common.enums import BiobankOrderStatus, EnrollmentStatus, OrderStatus, \
+    PhysicalMeasurementsStatus, QuestionnaireStatus, SampleStatus
+from rdr_server.dao.base_dao import BULK_BATCH_SIZE, batches
+from rdr_server.dao.participant_summary import ParticipantSummaryDao
+from rdr_server.model.biobank_order import BiobankOrder, BiobankOrderedSample
+from rdr_server.model.biobank_stored_sample import BiobankStoredSample
+from rdr_server.model.code import Code
+from rdr_server.model.measurements import PhysicalMeasurements
+from rdr_server.model.participant import Participant
+from rdr_server.model.participant_summary import ParticipantSummary
+from rdr_server.model.questionnaire import QuestionnaireConcept
+from rdr_server.model.questionnaire_response import QuestionnaireResponse
+
+# The config settings used by the recompute, see get_summary_config().
+SummaryConfig = namedtuple('SummaryConfig', ['baselineSampleTestCodes', 'dnaSampleTestCodes',
+                                             'baselinePPIQuestionnaireFields', 'ppiQuestionnaireFields'])
+
+# Questionnaire module code value to participant summary status field.
+QUESTIONNAIRE_MODULE_FIELDS = {
+    CONSENT_FOR_STUDY_ENROLLMENT_MODULE: 'consentForStudyEnrollment',
+    CONSENT_FOR_ELECTRONIC_HEALTH_RECORDS_MODULE: 'consentForElectronicHealthRecords',
+    CONSENT_FOR_DVEHR_MODULE: 'consentForDvElectronicHealthRecordsSharing',
+    OVERALL_HEALTH_PPI_MODULE: 'questionnaireOnOverallHealth',
+    LIFESTYLE_PPI_MODULE: 'questionnaireOnLifestyle',
+    THE_BASICS_PPI_MODULE: 'questionnaireOnTheBasics',
+    FAMILY_HISTORY_MODULE: 'questionnaireOnFamilyHealth',
+    PERSONAL_MEDICAL_HISTORY_MODULE: 'questionnaireOnMedicalHistory',
+    MEDICATIONS_MODULE: 'questionnaireOnMedications',
+    HEALTHCARE_ACCESS_MODULE: 'questionnaireOnHealthcareAccess',
+}
+
+# Participant columns copied to the summary as is.
+_PARTICIPANT_FIELDS = ('participantId', 'biobankId', 'hpoId', 'organizationId', 'siteId', 'signUpTime',
+                       'withdrawalStatus', 'withdrawalReason', 'withdrawalTime',
+                       'withdrawalReasonJustification', 'suspensionStatus', 'suspensionTime')
+
+ParticipantInfo = namedtuple('ParticipantInfo', _PARTICIPANT_FIELDS)
+
+# The source rows for a single participant.
+ParticipantSources = namedtuple('ParticipantSources', ['participant', 'ordered_samples', 'stored_samples',
+                                                       'measurements', 'responses'])
+
+
+def get_summary_config():
+    """
+    Read the recompute settings from the project config
+    :return: SummaryConfig
+    """
+    # The config package needs GCP_PROJECT set, so it is imported when the settings are read instead of
+    # on the server import path.
+    from rdr_server.config import config
+    return SummaryConfig(frozenset(config.biobank.BASELINE_SAMPLE_TEST_CODES),
+                         frozenset(config.biobank.DNA_SAMPLE_TEST_CODES),
+                         tuple(config.survey.BASELINE_PPI_QUESTIONNAIRE_FIELDS),
+                         tuple(config.survey.PPI_QUESTIONNAIRE_FIELDS))
+
+
+def _earliest(current, time):
+    if time is None:
+        return current
+    return time if current is None or time < current else current
+
+
+def _latest(*times):
+    """ Return the latest time, or None if any of the times is not set. """
+    if any(time is None for time in times):
+        return None
+    return max(times)
+
+
+def _ordered_sample_status(row):
+    """ Return the (status, time) of an ordered sample row, or of the order when it has no samples. """
+    if row.finalized:
+        return OrderStatus.FINALIZED, row.finalized
+    if row.processed:
+        return OrderStatus.PROCESSED, row.processed
+    if row.collected:
+        return OrderStatus.COLLECTED, row.collected
+    return OrderStatus.CREATED, row.created
+
+
+def _compute_order_fields(fields: dict, rows, summary_config: SummaryConfig):
+    """
+    Set the per test sample order status fields and the biospecimen fields from the ordered sample rows.
+    :return: time of the first order with a DNA sample, or None
+    """
+    orders = dict()
+    dna_order_time = None
+
+    for row in rows:
+        if row.orderStatus == BiobankOrderStatus.CANCELLED:
+            continue
+        status, time = _ordered_sample_status(row)
+
+        order = orders.get(row.biobankOrderId)
+        if order is None or status.value > order[1].value:
+            orders[row.biobankOrderId] = (row, status)
+
+        if row.test not in BIOBANK_TESTS_SET:
+            continue
+        key = 'sampleOrderStatus' + row.test
+        current = fields[key]
+        if status.value > current.value or (status == current and time < fields[key + 'Time']):
+            fields[key] = status
+            fields[key + 'Time'] = time
+        if row.test in summary_config.dnaSampleTestCodes:
+            dna_order_time = _earliest(dna_order_time, row.created)
+
+    if orders:
+        row, status = max(orders.values(), key=lambda order: order[0].created)
+        fields['biospecimenStatus'] = status
+        fields['biospecimenOrderTime'] = row.created
+        fields['biospecimenSourceSiteId'] = row.sourceSiteId
+        fields['biospecimenCollectedSiteId'] = row.collectedSiteId
+        fields['biospecimenProcessedSiteId'] = row.processedSiteId
+        fields['biospecimenFinalizedSiteId'] = row.finalizedSiteId
+
+    return dna_order_time
+
+
+def _compute_stored_sample_fields(fields: dict, rows, summary_config: SummaryConfig):
+    """
+    Set the per test sample status fields and sample counts from the stored sample rows. The status of
+    a test is the status of the most recently confirmed sample.
+    """
+    baseline_tests = set()
+
+    for row in rows:
+        if row.confirmed is None or row.test not in BIOBANK_TESTS_SET:
+            continue
+        key = 'sampleStatus' + row.test
+        if fields[key + 'Time'] is None or row.confirmed > fields[key + 'Time']:
+            fields[key] = row.status if row.status is not None else SampleStatus.RECEIVED
+            fields[key + 'Time'] = row.confirmed
+        if row.test in summary_config.baselineSampleTestCodes:
+            baseline_tests.add(row.test)
+        if row.test in summary_config.dnaSampleTestCodes:
+            fields['samplesToIsolateDNA'] = SampleStatus.RECEIVED
+            fields['enrollmentStatusCoreStoredSampleTime'] = _earliest(
+                fields['enrollmentStatusCoreStoredSampleTime'], row.confirmed)
+
+    fields['numBaselineSamplesArrived'] = len(baseline_tests)
+
+
+def _compute_measurements_fields(fields: dict, rows):
+    """ Set the physical measurements fields from the first measurements that were not cancelled. """
+    rows = sorted(rows, key=lambda r: r.created)
+    first = next((row for row in rows if row.status != PhysicalMeasurementsStatus.CANCELLED), None)
+    if first:
+        fields['physicalMeasurementsStatus'] = PhysicalMeasurementsStatus.COMPLETED
+        fields['physicalMeasurementsTime'] = first.created
+        fields['physicalMeasurementsFinalizedTime'] = first.finalized
+        fields['physicalMeasurementsCreatedSiteId'] = first.createdSiteId
+        fields['physicalMeasurementsFinalizedSiteId'] = first.finalizedSiteId
+    elif rows:
+        fields['physicalMeasurementsStatus'] = PhysicalMeasurementsStatus.CANCELLED
+
+
+def _compute_questionnaire_fields(fields: dict, rows, summary_config: SummaryConfig):
+    """ Set the questionnaire status fields from the first response to each module. """
+    for row in rows:
+        key = QUESTIONNAIRE_MODULE_FIELDS.get(row.module)
+        if key is None:
+            continue
+        fields[key] = QuestionnaireStatus.SUBMITTED
+        fields[key + 'Time'] = _earliest(fields[key + 'Time'], row.created)
+
+    def submitted(key):
+        return fields[key] == QuestionnaireStatus.SUBMITTED
+
+    fields['numCompletedBaselinePPIModules'] = sum(1 for key in summary_config.baselinePPIQuestionnaireFields
+                                                   if submitted(key))
+    fields['numCompletedPPIModules'] = sum(1 for key in summary_config.ppiQuestionnaireFields if submitted(key))
+
+
+def _compute_enrollment_fields(fields: dict, dna_order_time, summary_config: SummaryConfig):
+    """
+    Set the enrollment status fields. Members have consented to the study and to sharing EHR, full
+    participants have also completed physical measurements, the baseline questionnaires and provided
+    a DNA sample.
+    """
+    stored_sample_time = fields['enrollmentStatusCoreStoredSampleTime']
+    fields['enrollmentStatus'] = EnrollmentStatus.INTERESTED
+    fields['enrollmentStatusMemberTime'] = None
+    fields['enrollmentStatusCoreStoredSampleTime'] = None
+    fields['enrollmentStatusCoreOrderedSampleTime'] = None
+
+    if fields['consentForStudyEnrollment'] != QuestionnaireStatus.SUBMITTED or \
+            fields['consentForElectronicHealthRecords'] != QuestionnaireStatus.SUBMITTED:
+        return
+
+    member_time = _latest(fields['consentForStudyEnrollmentTime'],
+                          fields['consentForElectronicHealthRecordsTime'])
+    fields['enrollmentStatus'] = EnrollmentStatus.MEMBER
+    fields['enrollmentStatusMemberTime'] = member_time
+
+    if fields['physicalMeasurementsStatus'] != PhysicalMeasurementsStatus.COMPLETED or \
+            fields['numCompletedBaselinePPIModules'] != len(summary_config.baselinePPIQuestionnaireFields):
+        return
+
+    core_time = _latest(member_time, fields['physicalMeasurementsTime'],
+                        *[fields[key + 'Time'] for key in summary_config.baselinePPIQuestionnaireFields])
+    if dna_order_time:
+        fields['enrollmentStatusCoreOrderedSampleTime'] = _latest(core_time, dna_order_time)
+    if stored_sample_time:
+        fields['enrollmentStatus'] = EnrollmentStatus.FULL_PARTICIPANT
+        fields['enrollmentStatusCoreStoredSampleTime'] = _latest(core_time, stored_sample_time)
+
+
+def compute_summary_fields(sources: ParticipantSources, summary_config: SummaryConfig):
+    """
+    Compute the derived participant summary fields for a single participant. Always returns every
+    field, so the results for a batch of participants can be written with a single statement.
+    :param sources: ParticipantSources with the participant's rows from each source table
+    :param summary_config: SummaryConfig
+    :return: dict keyed by participant summary attribute key
+    """
+    fields = dict(sources.participant._asdict())
+    del fields['participantId']
+
+    for test in BIOBANK_TESTS:
+        fields['sampleOrderStatus' + test] = OrderStatus.UNSET
+        fields['sampleOrderStatus' + test + 'Time'] = None
+        fields['sampleStatus' + test] = SampleStatus.UNSET
+        fields['sampleStatus' + test + 'Time'] = None
+    fields.update({
+        'biospecimenStatus': OrderStatus.UNSET,
+        'biospecimenOrderTime': None,
+        'biospecimenSourceSiteId': None,
+        'biospecimenCollectedSiteId': None,
+        'biospecimenProcessedSiteId': None,
+        'biospecimenFinalizedSiteId': None,
+        'samplesToIsolateDNA': SampleStatus.UNSET,
+        'enrollmentStatusCoreStoredSampleTime': None,
+        'physicalMeasurementsStatus': PhysicalMeasurementsStatus.UNSET,
+        'physicalMeasurementsTime': None,
+        'physicalMeasurementsFinalizedTime': None,
+        'physicalMeasurementsCreatedSiteId': None,
+        'physicalMeasurementsFinalizedSiteId': None,
+    })
+    for key in QUESTIONNAIRE_MODULE_FIELDS.values():
+        fields[key] = QuestionnaireStatus.UNSET
+        fields[key + 'Time'] = None
+
+    dna_order_time = _compute_order_fields(fields, sources.ordered_samples, summary_config)
+    _compute_stored_sample_fields(fields, sources.stored_samples, summary_config)
+    _compute_measurements_fields(fields, sources.measurements)
+    _compute_questionnaire_fields(fields, sources.responses, summary_config)
+    _compute_enrollment_fields(fields, dna_order_time, summary_config)
+
+    return fields
+
+
+# Every participant summary field written by the recompute, the fields don't depend on the settings.
+SUMMARY_FIELDS = tuple(sorted(compute_summary_fields(
+    ParticipantSources(ParticipantInfo(*[None] * len(_PARTICIPANT_FIELDS)), [], [], [], []),
+    SummaryConfig(frozenset(), frozenset(), (), ()))))
+
+
+class ParticipantSummaryRecomputer(object):
+    """
+    Recomputes the derived fields of existing participant summaries in batches. Only summaries whose
+    fields changed are written, and their lastModified time is updated.
+    """
+
+    def __init__(self, batch_size: int = BULK_BATCH_SIZE, summary_config: SummaryConfig = None):
+        """
+        :param batch_size: number of participants to recompute at a time
+        :param summary_config: SummaryConfig, read from the project config if not given
+        """
+        self.batch_size = batch_size
+        self.summary_config = summary_config or get_summary_config()
+        self.dao = ParticipantSummaryDao()
+
+    def _group(self, query, key):
+        groups = dict()
+        for row in query:
+            groups.setdefault(getattr(row, key), list()).append(row)
+        return groups
+
+    def load_sources(self, session, participant_ids: list):
+        """
+        Read the source rows for a batch of participants, with one query per source table
+        :param session: Session object
+        :param participant_ids: list of participant ids
+        :return: dict of participant id to ParticipantSources
+        """
+        query = self.dao.get_query(session, [getattr(Participant, key) for key in _PARTICIPANT_FIELDS])
+        participants = [ParticipantInfo(*row) for row in
+                        query.filter(Participant.participantId.in_(participant_ids))]
+        if not participants:
+            return dict()
+
+        query = self.dao.get_query(
+            session, [BiobankOrder.biobankOrderId, BiobankOrder.participantId, BiobankOrder.orderStatus,
+                      BiobankOrder.created, BiobankOrder.sourceSiteId, BiobankOrder.collectedSiteId,
+                      BiobankOrder.processedSiteId, BiobankOrder.finalizedSiteId, BiobankOrderedSample.test,
+                      BiobankOrderedSample.collected, BiobankOrderedSample.processed,
+                      BiobankOrderedSample.finalized])
+        query = query.outerjoin(BiobankOrderedSample,
+                                BiobankOrderedSample.biobankOrderId == BiobankOrder.biobankOrderId)
+        orders = self._group(query.filter(BiobankOrder.participantId.in_(participant_ids)), 'participantId')
+
+        query = self.dao.get_query(session, [BiobankStoredSample.biobankId, BiobankStoredSample.test,
+                                             BiobankStoredSample.confirmed, BiobankStoredSample.status])
+        stored_samples = self._group(query.filter(BiobankStoredSample.biobankId.in_(
+            [participant.biobankId for participant in participants])), 'biobankId')
+
+        query = self.dao.get_query(
+            session, [PhysicalMeasurements.participantId, PhysicalMeasurements.created,
+                      PhysicalMeasurements.finalized, PhysicalMeasurements.status,
+                      PhysicalMeasurements.createdSiteId, PhysicalMeasurements.finalizedSiteId])
+        measurements = self._group(query.filter(PhysicalMeasurements.participantId.in_(participant_ids)),
+                                   'participantId')
+
+        query = self.dao.get_query(session, [QuestionnaireResponse.participantId,
+                                             QuestionnaireResponse.created, Code.value.label('module')])
+        query = query.join(QuestionnaireConcept, (
+            QuestionnaireConcept.questionnaireId == QuestionnaireResponse.questionnaireId) & (
+            QuestionnaireConcept.questionnaireVersion == QuestionnaireResponse.questionnaireVersion))
+        query = query.join(Code, Code.codeId == QuestionnaireConcept.codeId)
+        responses = self._group(query.filter(QuestionnaireResponse.participantId.in_(participant_ids)),
+                                'participantId')
+
+        return {
+            participant.participantId: ParticipantSources(
+                participant,
+                orders.get(participant.participantId, []),
+                stored_samples.get(participant.biobankId, []),
+                measurements.get(participant.participantId, []),
+                responses.get(participant.participantId, []))
+            for participant in participants
+        }
+
+    def recompute_batch(self, session, participant_ids: list):
+        """
+        Recompute and write the summaries for a batch of participants
+        :param session: Session object
+        :param participant_ids: list of participant ids
+        :return: dict with the number of updated, unchanged and missing summaries
+        """
+        sources = self.load_sources(session, participant_ids)
+
+        columns = [ParticipantSummary.participantId] + [getattr(ParticipantSummary, key) for key in SUMMARY_FIELDS]
+        query = self.dao.get_query(session, columns)
+        current = {row[0]: row[1:] for row in
+                   query.filter(ParticipantSummary.participantId.in_(list(sources)))}
+
+        now = datetime.utcnow()
+        serializer = ParticipantSummary.get_serializer()
+        rows = list()
+        for participant_id, participant_sources in sources.items():
+            if participant_id not in current:
+                continue
+            fields = compute_summary_fields(participant_sources, self.summary_config)
+            if tuple(fields[key] for key in SUMMARY_FIELDS) == tuple(current[participant_id]):
+                continue
+            fields['lastModified'] = now
+            row = serializer.to_row(fields)
+            row['_participant_id'] = participant_id
+            rows.append(row)
+
+        if rows:
+            table = ParticipantSummary.__table__
+            session.execute(table.update().where(table.c.participant_id == bindparam('_participant_id')), rows)
+
+        return {
+            'updated': len(rows),
+            'unchanged': len(current) - len(rows),
+            'missing': len(participant_ids) - len(current),
+        }
+
+    def recompute(self, participant_ids):
+        """
+        Recompute the summaries for the given participants, committing after each batch
+        :param participant_ids: iterable of participant ids
+        :return: dict with the number of updated, unchanged and missing summaries
+        """
+        result = {'updated': 0, 'unchanged': 0, 'missing': 0}
+        for batch in batches(participant_ids, self.batch_size):
+            with self.dao.session() as session:
+                counts = self.recompute_batch(session, batch)
+            for key, value in counts.items():
+                result[key] += value
+        return result
+
+    def iter_participant_ids(self, shard: int = 0, shard_count: int = 1):
+        """
+        Generator of the participant ids of every participant summary in the given shard, read in
+        primary key order one batch at a time. Shards are disjoint, so each can be handled by a
+        separate worker.
+        :param shard: shard number, from 0 to shard_count - 1
+        :param shard_count: total number of shards
+        """
+        if not 0 <= shard < shard_count:
+            raise ValueError('invalid shard {0} of {1}'.format(shard, shard_count))
+
+        last_id = 0
+        while True:
+            with self.dao.session() as session:
+                query = self.dao.get_query(session, [ParticipantSummary.pkId, ParticipantSummary.participantId])
+                query = query.filter(ParticipantSummary.pkId > last_id)
+                if shard_count > 1:
+                    query = query.filter(ParticipantSummary.pkId % shard_count == shard)
+                rows = query.order_by(ParticipantSummary.pkId).limit(self.batch_size).all()
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            for row in rows:
+                yield row[1]
+
+    def recompute_all(self, shard: int = 0, shard_count: int = 1):
+        """
+        Recompute every participant summary in the given shard
+        :param shard: shard number, from 0 to shard_count - 1
+        :param shard_count: total number of shards
+        :return: dict with the number of updated, unchanged and missing summaries
+        """
+        result = self.recompute(self.iter_participant_ids(shard, shard_count))
+        logging.info('recomputed participant summaries, shard {0} of {1}: {2}'.format(
+            shard, shard_count, result))
+        return result
@@ -0,0 +1,278 @@
+#
+# This file is subject to the terms and conditions defined in the
+# file 'LICENSE', which is part of this source code package.
+#
+
+#
+# Participant summary search. Only searches that can be answered with a range scan of one of the
+# participant summary indexes are accepted: the equality filters must match the leading columns of an
+# index and the sort field, if any, must be the next and last column of that index. InnoDB indexes
+# end with the primary key, so results are ordered by (sort field, pkId) and pages are keyed on the
+# last (sort field, pkId) of the previous page. Participants with a masked value in a filter or sort
+# field are left out of the results.
+#
+import base64
+import binascii
+import datetime
+import json
+from collections import namedtuple
+
+from sqlalchemy import and_, or_, Date, DateTime, Integer, PrimaryKeyConstraint, UniqueConstraint
+
+from rdr_server.dao.base_dao import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from rdr_server.dao.participant_summary import ParticipantSummaryDao
+from rdr_server.dao.reference_data import get_reference_data
+from rdr_server.model.base_model import ModelEnum
+from rdr_server.model.participant_summary import ParticipantSummary
+
+# Range filter operators, given as a prefix of the filter value, e.g. 'lastModified=ge2019-01-01'.
+RANGE_OPERATORS = {
+    'lt': lambda column, value: column < value,
+    'le': lambda column, value: column <= value,
+    'gt': lambda column, value: column > value,
+    'ge': lambda column, value: column >= value,
+}
+
+SearchFilter = namedtuple('SearchFilter', ['field', 'operator', 'value'])
+
+
+def _get_search_indexes():
+    """
+    Return the attribute keys of the columns of each participant summary index, including unique
+    constraints and the primary key
+    :return: list of tuples
+    """
+    table = ParticipantSummary.__table__
+    attr_keys = {column.key: key for key, column in ParticipantSummary.__mapper__.columns.items()}
+
+    indexes = [index.columns for index in table.indexes]
+    indexes.extend(c.columns for c in table.constraints if isinstance(c, (PrimaryKeyConstraint, UniqueConstraint)))
+    return [tuple(attr_keys[column.key] for column in columns) for columns in indexes]
+
+
+SEARCH_INDEXES = _get_search_indexes()
+SEARCH_FIELDS = frozenset(key for index in SEARCH_INDEXES for key in index)
+
+
+def parse_value(field: str, value: str):
+    """
+    Convert a query string value to the python type of a participant summary column
+    :param field: participant summary attribute key
+    :param value: string value
+    :return: column value
+    """
+    col_type = ParticipantSummary.__mapper__.columns[field].type
+    try:
+        if isinstance(col_type, ModelEnum):
+            return col_type.enum_type[value]
+        if isinstance(col_type, Integer):
+            return int(value)
+        if isinstance(col_type, Date):
+            return datetime.date.fromisoformat(value)
+        if isinstance(col_type, DateTime) or isinstance(getattr(col_type, 'impl', None), DateTime):
+            return datetime.datetime.fromisoformat(value)
+    except (KeyError, ValueError):
+        raise ValueError('invalid value for {0}: {1}'.format(field, value))
+    return value
+
+
+def _has_range_operators(field):
+    col_type = ParticipantSummary.__mapper__.columns[field].type
+    return not isinstance(col_type, ModelEnum) and \
+        isinstance(getattr(col_type, 'impl', col_type), (Integer, Date, DateTime))
+
+
+def parse_filter(field: str, value: str) -> SearchFilter:
+    """
+    Parse a filter query string parameter. Integer, date and datetime fields accept a range operator
+    prefix on the value.
+    :param field: participant summary attribute key
+    :param value: string value
+    :return: SearchFilter
+    """
+    if field not in SEARCH_FIELDS:
+        raise ValueError('{0} is not a searchable field'.format(field))
+    operator = None
+    if value[:2] in RANGE_OPERATORS and _has_range_operators(field):
+        operator = value[:2]
+        value = value[2:]
+    return SearchFilter(field, operator, parse_value(field, value))
+
+
+def parse_awardee_filter(value: str) -> SearchFilter:
+    """
+    Parse an awardee filter, the HPO name is looked up in the shared reference data
+    :param value: HPO name
+    :return: SearchFilter on hpoId
+    """
+    hpo = get_reference_data().get_hpo_by_name(value)
+    if hpo is None:
+        raise ValueError('unknown awardee: {0}'.format(value))
+    return SearchFilter('hpoId', None, hpo.hpoId)
+
+
+def find_search_index(equal_fields: set, sort_field: str = None):
+    """
+    Return the index that can answer a search with equality filters on the given fields, ordered by the
+    sort field and then pkId
+    :param equal_fields: set of attribute keys with equality filters
+    :param sort_field: attribute key of the sort field, or None to order by pkId
+    :return: tuple of index attribute keys, or None if no index supports the search
+    """
+    size = len(equal_fields)
+    # Every index ends with the primary key, so it may also be named.
+    allowed = [(sort_field,), (sort_field, 'pkId')] if sort_field else [(), ('pkId',)]
+    for index in SEARCH_INDEXES:
+        if set(index[:size]) == equal_fields and index[size:] in allowed:
+            return index
+    return None
+
+
+def encode_search_token(pk_id: int, sort_value=None) -> str:
+    """
+    Create an opaque cursor token from the last record returned in a page
+    :param pk_id: primary key id
+    :param sort_value: sort field value, converted to a string for dates and enums
+    :return: url safe token string
+    """
+    data = json.dumps([pk_id, sort_value])
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('utf-8')
+
+
+def decode_search_token(token: str, sort_field: str = None):
+    """
+    Return the primary key id and sort field value stored in a cursor token
+    :param token: token string created by encode_search_token()
+    :param sort_field: attribute key of the sort field
+    :return: tuple of (primary key id, sort field value)
+    """
+    try:
+        pk_id, sort_value = json.loads(base64.urlsafe_b64decode(token.encode('utf-8')).decode('utf-8'))
+        pk_id = int(pk_id)
+    except (binascii.Error, UnicodeError, ValueError, TypeError):
+        raise ValueError('invalid page token.')
+    if sort_field and sort_value is not None:
+        sort_value = parse_value(sort_field, sort_value)
+    return pk_id, sort_value
+
+
+class ParticipantSummarySearch(object):
+    """
+    A validated participant summary search
+    """
+
+    def __init__(self, filters: list, sort: str = None, fields: list = None):
+        """
+        :param filters: list of SearchFilter
+        :param sort: attribute key of the sort field, prefixed with '-' for descending order
+        :param fields: list of attribute keys to return, all fields if not given
+        """
+        self.filters = filters
+        self.descending = bool(sort) and sort.startswith('-')
+        self.sort_field = sort.lstrip('-') if sort and sort.lstrip('-') != 'pkId' else None
+        self.fields = fields
+        self.dao = ParticipantSummaryDao()
+
+        range_fields = {f.field for f in filters if f.operator}
+        if len(range_fields) > 1:
+            raise ValueError('range filters are only supported on a single field')
+        if range_fields:
+            range_field = range_fields.pop()
+            if self.sort_field and self.sort_field != range_field:
+                raise ValueError('range filters are only supported on the sort field')
+            self.sort_field = range_field
+
+        equal_fields = {f.field for f in filters if not f.operator}
+        self.index = find_search_index(equal_fields, self.sort_field)
+        if self.index is None:
+            raise ValueError('unsupported search: filter on {0} sorted by {1}'.format(
+                ', '.join(sorted(equal_fields)) or 'nothing', self.sort_field or 'pkId'))
+
+    @classmethod
+    def from_args(cls, args):
+        """
+        Create a search from request query string arguments. '_sort' sets the sort field, '_fields' is
+        a comma separated list of fields to return, 'awardee' filters on an HPO name and other arguments
+        are filters.
+        :param args: request.args MultiDict
+        :return: ParticipantSummarySearch
+        """
+        filters = list()
+        for field, values in args.lists():
+            if field in ('_sort', '_fields', 'pageToken', 'pageSize'):
+                continue
+            if field == 'awardee':
+                filters.extend(parse_awardee_filter(value) for value in values)
+                continue
+            filters.extend(parse_filter(field, value) for value in values)
+
+        fields = args.get('_fields', None)
+        return cls(filters, sort=args.get('_sort', None), fields=fields.split(',') if fields else None)
+
+    def _page_filter(self, page_token):
+        """ Return the filter selecting the records after the last record of the previous page. """
+        pk = ParticipantSummary.pkId
+        last_pk, last_value = decode_search_token(page_token, self.sort_field)
+        if not self.sort_field:
+            return pk > last_pk
+
+        column = getattr(ParticipantSummary, self.sort_field)
+        # NULL values sort first in ascending order and last in descending order.
+        if self.descending:
+            if last_value is None:
+                return and_(column.is_(None), pk < last_pk)
+            return or_(column < last_value, and_(column == last_value, pk < last_pk), column.is_(None))
+        if last_value is None:
+            return or_(and_(column.is_(None), pk > last_pk), column.isnot(None))
+        return or_(column > last_value, and_(column == last_value, pk > last_pk))
+
+    def execute(self, page_token: str = None, page_size: int = DEFAULT_PAGE_SIZE):
+        """
+        Return a page of search results
+        :param page_token: cursor token returned with the previous page, None for the first page
+        :param page_size: number of records to return
+        :return: tuple of (list of dicts, cursor token for the next page or None)
+        """
+        if not page_size or page_size < 1 or page_size > MAX_PAGE_SIZE:
+            raise ValueError('invalid page size.')
+
+        columns = self.dao.get_projection(self.fields)
+        keys = [column.key for column in columns]
+        serializer = ParticipantSummary.get_serializer()
+
+        pk = ParticipantSummary.pkId
+        sort_column = getattr(ParticipantSummary, self.sort_field) if self.sort_field else None
+        # The masked sort value and pkId are selected after the requested fields for the page token.
+        extra = [pk.label('_pkId')]
+        if sort_column is not None:
+            extra.append(self.dao.get_projection([self.sort_field])[0].label('_sortValue'))
+
+        # Participants with a masked value in a filter or sort field are left out, so searches can't
+        # match or order by values that are not returned. This keeps the filters on the index columns.
+        search_fields = {f.field for f in self.filters} | ({self.sort_field} if self.sort_field else set())
+
+        with self.dao.session() as session:
+            query = self.dao.get_query(session, columns + extra)
+            for f in self.filters:
+                column = getattr(ParticipantSummary, f.field)
+                query = query.filter(RANGE_OPERATORS[f.operator](column, f.value) if f.operator else column == f.value)
+            for condition in self.dao.get_unmasked_filters(search_fields):
+                query = query.filter(condition)
+            if page_token:
+                query = query.filter(self._page_filter(page_token))
+
+            order = [sort_column, pk] if sort_column is not None else [pk]
+            query = query.order_by(*[c.desc() if self.descending else c.asc() for c in order])
+            # Fetch one extra record to find out if there is another page.
+            rows = query.limit(page_size + 1).all()
+
+        next_token = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            last = rows[-1]
+            sort_value = None
+            if sort_column is not None:
+                sort_value = serializer.row_to_dict([self.sort_field], [last._sortValue])[self.sort_field]
+            next_token = encode_search_token(last._pkId, sort_value)
+
+        return [serializer.row_to_dict(keys, row[:len(keys)]) for row in rows], next_token
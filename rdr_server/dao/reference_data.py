@@ -0,0 +1,176 @@
+#
+# This file is subject to the terms and conditions defined in the
+# file 'LICENSE', which is part of this source code package.
+#
+import logging
+import threading
+import time
+from collections import namedtuple
+from datetime import timedelta
+
+from sqlalchemy import func
+
+from rdr_server.dao.hpo import HPODao
+from rdr_server.dao.organization import OrganizationDao
+from rdr_server.dao.site import SiteDao
+
+# Number of seconds between checks for changed reference data.
+REFRESH_INTERVAL = 60
+# Refreshes read again the rows modified this many seconds before the newest loaded row, to pick up
+# transactions that committed after the last refresh with an earlier modified time.
+REFRESH_SETTLE_TIME = 10
+
+HPOInfo = namedtuple('HPOInfo', ['pkId', 'modified', 'hpoId', 'name', 'displayName', 'organizationType',
+                                 'isObsolete'])
+OrganizationInfo = namedtuple('OrganizationInfo', ['pkId', 'modified', 'organizationId', 'externalId',
+                                                   'displayName', 'hpoId', 'isObsolete'])
+SiteInfo = namedtuple('SiteInfo', ['pkId', 'modified', 'siteId', 'siteName', 'googleGroup', 'organizationId',
+                                   'hpoId', 'siteStatus', 'enrollingStatus', 'isObsolete'])
+
+
+class ReferenceDataSnapshot(object):
+    """
+    A read only copy of the HPO, Organization and Site tables, indexed for lookups. Snapshots are
+    never changed after they are created, a refresh builds a new snapshot, so they can be used from
+    any thread without locking.
+    """
+
+    def __init__(self, hpos: dict, organizations: dict, sites: dict):
+        """
+        :param hpos: dict of pkId to HPOInfo
+        :param organizations: dict of pkId to OrganizationInfo
+        :param sites: dict of pkId to SiteInfo
+        """
+        self.hpos = hpos
+        self.organizations = organizations
+        self.sites = sites
+
+        self.hpos_by_id = {rec.hpoId: rec for rec in hpos.values()}
+        self.hpos_by_name = {rec.name: rec for rec in hpos.values()}
+        self.organizations_by_id = {rec.organizationId: rec for rec in organizations.values()}
+        self.organizations_by_external_id = {rec.externalId: rec for rec in organizations.values()}
+        self.sites_by_id = {rec.siteId: rec for rec in sites.values()}
+        self.sites_by_google_group = {rec.googleGroup: rec for rec in sites.values()}
+
+        self.organizations_by_hpo_id = self._group_by(organizations.values(), 'hpoId', 'externalId')
+        self.sites_by_organization_id = self._group_by(sites.values(), 'organizationId', 'googleGroup')
+
+    @staticmethod
+    def _group_by(records, key, sort_key):
+        groups = dict()
+        for rec in records:
+            groups.setdefault(getattr(rec, key), list()).append(rec)
+        return {k: tuple(sorted(v, key=lambda r: getattr(r, sort_key) or '')) for k, v in groups.items()}
+
+    def get_hpo(self, hpo_id):
+        return self.hpos_by_id.get(hpo_id, None)
+
+    def get_hpo_by_name(self, name):
+        return self.hpos_by_name.get(name, None)
+
+    def get_organization(self, organization_id):
+        return self.organizations_by_id.get(organization_id, None)
+
+    def get_organization_by_external_id(self, external_id):
+        return self.organizations_by_external_id.get(external_id, None)
+
+    def get_site(self, site_id):
+        return self.sites_by_id.get(site_id, None)
+
+    def get_site_by_google_group(self, google_group):
+        return self.sites_by_google_group.get(google_group, None)
+
+
+class ReferenceDataService(object):
+    """
+    Keeps a ReferenceDataSnapshot current. Refreshes only load rows whose modified timestamp is at or
+    after the newest timestamp already loaded, less the settle time; deleted rows are detected by
+    comparing row counts, which triggers a full reload of that table.
+    """
+
+    def __init__(self, refresh_interval: int = REFRESH_INTERVAL, settle_time: int = REFRESH_SETTLE_TIME):
+        self.refresh_interval = refresh_interval
+        self.settle_time = settle_time
+        self._tables = (
+            ('hpos', HPODao(), HPOInfo),
+            ('organizations', OrganizationDao(), OrganizationInfo),
+            ('sites', SiteDao(), SiteInfo),
+        )
+        self._snapshot = None
+        self._next_refresh = 0
+        self._lock = threading.Lock()
+
+    def get(self) -> ReferenceDataSnapshot:
+        """
+        Return the current snapshot, refreshing it if the refresh interval has passed. While one thread
+        refreshes, other threads keep using the previous snapshot.
+        :return: ReferenceDataSnapshot
+        """
+        if self._snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    self.refresh()
+        elif self._next_refresh <= time.monotonic() and self._lock.acquire(blocking=False):
+            try:
+                self.refresh()
+            finally:
+                self._lock.release()
+
+        return self._snapshot
+
+    def _load(self, dao, info_class, current: dict):
+        """
+        Return a dict of pkId to info records with the changes since the current records applied
+        :param dao: DAO for the table
+        :param info_class: namedtuple class for the table
+        :param current: dict of pkId to info records currently loaded
+        :return: dict
+        """
+        model = dao.model
+        columns = [getattr(model, field) for field in info_class._fields]
+        since = max((rec.modified for rec in current.values()), default=None)
+
+        with dao.session() as session:
+            query = dao.get_query(session, columns)
+            if since is not None:
+                query = query.filter(model.modified >= since - timedelta(seconds=self.settle_time))
+            changed = [info_class(*row) for row in query.all()]
+            if since is None:
+                return {rec.pkId: rec for rec in changed}
+
+            records = dict(current)
+            records.update((rec.pkId, rec) for rec in changed)
+
+            count = dao.get_query(session, func.count(model.pkId)).scalar()
+            if count == len(records):
+                return records
+
+        logging.info('{0} records were deleted, reloading table.'.format(model.__tablename__))
+        return self._load(dao, info_class, dict())
+
+    def refresh(self, full: bool = False):
+        """
+        Load changed reference data and replace the current snapshot
+        :param full: reload every table
+        """
+        snapshot = self._snapshot
+        tables = dict()
+
+        for name, dao, info_class in self._tables:
+            current = getattr(snapshot, name) if snapshot and not full else dict()
+            tables[name] = self._load(dao, info_class, current)
+
+        self._snapshot = ReferenceDataSnapshot(**tables)
+        self._next_refresh = time.monotonic() + self.refresh_interval
+
+
+# The shared reference data service for the process.
+_service = ReferenceDataService()
+
+
+def get_reference_data() -> ReferenceDataSnapshot:
+    """
+    Return the current HPO, Organization and Site reference data
+    :return: ReferenceDataSnapshot
+    """
+    return _service.get()
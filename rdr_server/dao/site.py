@@ -0,0 +1,19 @@
+#
+# This file is subject to the terms and conditions defined in the
+# file 'LICENSE', which is part of this source code package.
+#
+
+from rdr_server.dao.base_dao import BaseDao
+from rdr_server.dao.cache import LRUCache
+from rdr_server.model.site import Site
+
+# Shared by all DAO instances so writes through any of them invalidate the cached records.
+_cache = LRUCache('site', max_size=5000, ttl=3600)
+
+
+class SiteDao(BaseDao):
+
+    model = None  # type: Site
+
+    def __init__(self):
+        super(SiteDao, self).__init__(Site, cache=_cache)
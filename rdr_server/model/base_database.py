@@ -11,7 +11,7 @@ from rdr_server.model.base_model import BaseModel, BaseMetricsModel
 # All tables in the schema should be imported below here.
 # pylint: disable=unused-import
 from rdr_server.model.participant import Participant, ParticipantHistory
-from rdr_server.model.participant_summary import ParticipantSummary
+from rdr_server.model.participant_summary import ParticipantSummary, ParticipantSummaryQueue
 from rdr_server.model.biobank_stored_sample import BiobankStoredSample
 from rdr_server.model.biobank_order import BiobankOrder, BiobankOrderIdentifier, BiobankOrderedSample
 from rdr_server.model.code import CodeBook, Code, CodeHistory
@@ -20,7 +20,9 @@ from rdr_server.model.hpo import HPO
 from rdr_server.model.log_position import LogPosition
 from rdr_server.model.measurements import PhysicalMeasurements, Measurement
 from rdr_server.model.metric_set import AggregateMetrics, MetricSet
-from rdr_server.model.metrics import MetricsVersion, MetricsBucket
+from rdr_server.model.metrics import MetricsVersion, MetricsBucket, MetricsShard, MetricsShardBucket
+from rdr_server.model.metrics_cache import MetricsEnrollmentStatusCache, MetricsRaceCache, MetricsGenderCache, \
+    MetricsAgeCache
 from rdr_server.model.organization import Organization
 from rdr_server.model.questionnaire import Questionnaire, QuestionnaireHistory, QuestionnaireQuestion
 from rdr_server.model.questionnaire import QuestionnaireConcept
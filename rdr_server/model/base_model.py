@@ -3,8 +3,10 @@ tables. Extend MetricsBase for all metrics tables."""
 
 import json
 from collections import OrderedDict
-from datetime import date, datetime
+from datetime import date, datetime, time
+from enum import Enum
 
+from dateutil.parser import parse
 from dateutil.tz import tzutc
 from flask_restplus import Model, fields
 from marshmallow import Schema
@@ -13,7 +15,7 @@ from sqlalchemy import inspect
 from sqlalchemy.dialects.mysql import DATETIME
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.ext.declarative import declared_attr
-from sqlalchemy.types import TypeDecorator, SmallInteger
+from sqlalchemy.types import TypeDecorator, SmallInteger, Date, DateTime, Time
 
 # Do not use the cls=xxxx parameter, create a mixin class and add them directly
 # to the models.
@@ -36,10 +38,14 @@ class ModelEnum(TypeDecorator):
         return "ModelEnum(%s)" % self.enum_type.__name__
 
     def process_bind_param(self, value, dialect):  # pylint: disable=unused-argument
-        return int(value) if value else None
+        if value is None:
+            return None
+        if isinstance(value, Enum):
+            return value.value
+        return int(value)
 
     def process_result_value(self, value, dialect):  # pylint: disable=unused-argument
-        return self.enum_type(value) if value else None
+        return self.enum_type(value) if value is not None else None
 
 
 class UTCDateTime(TypeDecorator):
@@ -55,6 +61,152 @@ class UTCDateTime(TypeDecorator):
         return value
 
 
+def _isoformat(value):
+    # Values set on a model but not yet loaded from the database may still be strings.
+    return value.isoformat() if isinstance(value, (date, datetime, time)) else value
+
+
+def _parse_date(value):
+    return parse(value).date() if isinstance(value, str) else value
+
+
+def _parse_datetime(value):
+    return parse(value) if isinstance(value, str) else value
+
+
+def _enum_name(value):
+    return value.name if value is not None else None
+
+
+class ModelSerializer(object):
+    """
+    Converts model objects to python dicts. The column keys and the converter for each column are
+    worked out once from the column types when the serializer is created, so converting a row is
+    just a loop over the precompiled field list.
+    """
+
+    def __init__(self, model_class):
+        # List of (attribute key, converter function or None) tuples in mapper order.
+        self.fields = list()
+        # Attribute key to input converter function, populated as keys are seen in request data.
+        self._loaders = dict()
+        # Attribute key to table column key, used when writing rows with Core statements.
+        self.column_keys = dict()
+        self._mapper = inspect(model_class)
+
+        for prop in self._mapper.column_attrs:
+            self.fields.append((prop.key, self._get_converter(prop.columns[0].type)))
+            self.column_keys[prop.key] = prop.columns[0].key
+        self._converters = dict(self.fields)
+
+    @staticmethod
+    def _get_converter(col_type):
+        """
+        Return the function used to convert values of the given column type for output
+        :param col_type: sqlalchemy column type
+        :return: function or None if the value can be used as is
+        """
+        if isinstance(col_type, ModelEnum):
+            return _enum_name
+        if isinstance(col_type, TypeDecorator):
+            col_type = col_type.impl
+        if isinstance(col_type, (Date, DateTime, Time)):
+            return _isoformat
+        return None
+
+    def _get_loader(self, key):
+        """
+        Return the function used to convert request values for the given column
+        :param key: model attribute key
+        :return: function or None if the value can be used as is
+        """
+        try:
+            return self._loaders[key]
+        except KeyError:
+            pass
+
+        # Raises KeyError if the model has no column with this key.
+        col_type = self._mapper.columns[key].type
+        if isinstance(col_type, ModelEnum):
+            loader = col_type.enum_type.__getitem__
+        else:
+            if isinstance(col_type, TypeDecorator):
+                col_type = col_type.impl
+            if isinstance(col_type, DateTime):
+                loader = _parse_datetime
+            elif isinstance(col_type, Date):
+                loader = _parse_date
+            else:
+                loader = None
+        self._loaders[key] = loader
+        return loader
+
+    def from_dict(self, data):
+        """
+        Convert request data to model column values, ModelEnum names are converted to Enum values and
+        Date and DateTime strings are parsed. Raises KeyError for unknown keys or enum names and
+        ValueError for invalid date strings.
+        :param data: dict
+        :return: dict
+        """
+        od = OrderedDict()
+
+        for key, value in data.items():
+            loader = self._get_loader(key)
+            od[key] = loader(value) if loader and value is not None else value
+
+        return od
+
+    def to_row(self, item):
+        """
+        Convert a model object or a dict of model column values to a dict keyed by table column
+        key, suitable for Core insert/update statements. Only attributes set on a model object are
+        included, so column defaults still apply to the rest.
+        :param item: model object or dict keyed by model attribute key
+        :return: dict
+        """
+        if isinstance(item, dict):
+            values = item
+        else:
+            values = {key: value for key, value in item.__dict__.items() if key in self.column_keys}
+
+        # Raises KeyError if the model has no column with this key.
+        return {self.column_keys[key]: value for key, value in values.items()}
+
+    def to_dict(self, obj):
+        """
+        Dump a model object to python dict
+        :param obj: model object
+        :return: dict
+        """
+        data = OrderedDict()
+        # Loaded column values live in the instance __dict__, reading them from there skips the
+        # instrumented attribute descriptor. Unloaded or expired attributes fall back to getattr().
+        loaded = obj.__dict__
+
+        for key, converter in self.fields:
+            value = loaded[key] if key in loaded else getattr(obj, key)
+            data[key] = converter(value) if converter else value
+
+        return data
+
+    def row_to_dict(self, keys, row):
+        """
+        Dump a row selected with a subset of the model columns to python dict
+        :param keys: attribute keys of the selected columns, in select order
+        :param row: result row
+        :return: dict
+        """
+        data = OrderedDict()
+        converters = self._converters
+
+        for key, value in zip(keys, row):
+            converter = converters[key]
+            data[key] = converter(value) if converter else value
+
+        return data
+
+
 BaseApiSchema = Model('BaseSchema', {
     # 'status': fields.String(readonly=True),
     # 'error': fields.String(readonly=True),
@@ -126,27 +278,25 @@ class ModelMixin(object):
 
         return output
 
+    @classmethod
+    def get_serializer(cls) -> ModelSerializer:
+        """
+        Return the serializer for this model class, creating it on first use.
+        :return: ModelSerializer
+        """
+        # Look in the class __dict__ so subclasses don't pick up the parent class serializer.
+        serializer = cls.__dict__.get('__serializer__', None)
+        if serializer is None:
+            serializer = ModelSerializer(cls)
+            setattr(cls, '__serializer__', serializer)
+        return serializer
+
     def to_dict(self):
         """
         Dump class to python dict
         :return: dict
         """
-        data = OrderedDict()
-        mapper = inspect(self)
-
-        for column in mapper.attrs:
-            key = str(column.key)
-            value = getattr(self, key)
-
-            if isinstance(value, (datetime, date)):
-                data[key] = value.isoformat()
-            # Check for ModelEnum and return name
-            elif hasattr(value, 'name') and hasattr(value, 'value'):
-                data[key] = value.name
-            else:
-                data[key] = value
-
-        return data
+        return self.get_serializer().to_dict(self)
 
     def dict_to_obj_array(self, cls, data):
         """
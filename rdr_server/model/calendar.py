@@ -1,6 +1,6 @@
 
 from flask_restplus import fields
-from sqlalchemy import Date, Column
+from sqlalchemy import Date, Column, Index
 from rdr_server.model.base_model import ModelEnum
 
 from rdr_server.model.base_model import BaseModel, ModelMixin, BaseApiSchema
@@ -14,6 +14,10 @@ class Calendar(ModelMixin, BaseModel):
     SampleStatus = Column('sample_status', ModelEnum(SampleStatus))
 
 
+# Used by the 'since' watermark mode of the sync API.
+Index('calendar_modified', Calendar.modified)
+
+
 CalendarApiSchema = BaseApiSchema.clone('Calendar', {
     'day': fields.Date(required=True, description='Date value'),
     'enrollmentStatus': fields.String(description='Participant Enrollment Status'),
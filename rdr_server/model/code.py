@@ -27,6 +27,9 @@ class CodeBook(ModelMixin, BaseModel):
     name = Column('name', String(80), nullable=False)
     system = Column('system', String(255), nullable=False)
     version = Column('version', String(80), nullable=False)
+    # Fingerprint of the code book source content (ETag or content hash) this code book was imported
+    # from, used to skip importing an unchanged code book.
+    contentHash = Column('content_hash', String(128))
 
     __table_args__ = (
         UniqueConstraint('system', 'version'),
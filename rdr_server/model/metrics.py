@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, BLOB, Boolean, Date, String, ForeignKey, UniqueConstraint
+from sqlalchemy import Column, Integer, BLOB, Boolean, Date, String, ForeignKey, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 
 from rdr_server.model.base_model import BaseModel, ModelMixin, UTCDateTime
@@ -37,3 +37,45 @@ class MetricsBucket(ModelMixin, BaseModel):
     __table_args__ = (
         UniqueConstraint('metrics_version_id', 'date', 'hpo_id', name='uidx_version_date_hpoid'),
     )
+
+
+class MetricsShard(ModelMixin, BaseModel):
+    """A shard of the participants of a MetricsVersion being computed. A shard is complete once its
+    partial buckets have been written.
+    """
+    __tablename__ = 'metrics_shard'
+
+    metricsVersionId = Column('metrics_version_id', Integer,
+                              ForeignKey('metrics_version.metrics_version_id', ondelete='CASCADE'),
+                              nullable=False)
+    shard = Column('shard', Integer, nullable=False)
+    complete = Column('complete', Boolean, default=False, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint('metrics_version_id', 'shard', name='uidx_version_shard'),
+    )
+
+
+class MetricsShardBucket(ModelMixin, BaseModel):
+    """The changes to the metrics of a particular HPO ID on a date, computed from one shard of the
+    participants. addedMetrics counts the participants that entered each metric on the date and
+    removedMetrics the participants that left it.
+    """
+    __tablename__ = 'metrics_shard_bucket'
+
+    metricsVersionId = Column('metrics_version_id', Integer,
+                              ForeignKey('metrics_version.metrics_version_id', ondelete='CASCADE'),
+                              nullable=False)
+    shard = Column('shard', Integer, nullable=False)
+    date = Column('date', Date, nullable=False)
+    hpoId = Column('hpo_id', String(20), nullable=False)
+    addedMetrics = Column('added_metrics', BLOB, nullable=False)
+    removedMetrics = Column('removed_metrics', BLOB, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint('metrics_version_id', 'shard', 'date', 'hpo_id', name='uidx_version_shard_date_hpoid'),
+    )
+
+
+Index('metrics_shard_bucket_version_hpo_date', MetricsShardBucket.metricsVersionId, MetricsShardBucket.hpoId,
+      MetricsShardBucket.date)
@@ -54,12 +54,12 @@ class MetricsGenderCache(ModelMixin, BaseModel):
     """Contains gender metrics data grouped by HPO ID and date.
     """
     __tablename__ = 'metrics_gender_cache'
-    dateInserted = Column('date_inserted', UTCDateTime, default=datetime.utcnow(),
-                          nullable=False, primary_key=True)
-    hpoId = Column('hpo_id', String(20), primary_key=True)
-    hpoName = Column('hpo_name', String(255), primary_key=True)
-    date = Column('date', Date, nullable=False, primary_key=True)
-    genderName = Column('gender_name', String(255), primary_key=True)
+
+    dateInserted = Column('date_inserted', UTCDateTime, default=datetime.utcnow(), nullable=False)
+    hpoId = Column('hpo_id', String(20), nullable=False)
+    hpoName = Column('hpo_name', String(255), nullable=False)
+    date = Column('date', Date, nullable=False)
+    genderName = Column('gender_name', String(255), nullable=False)
     genderCount = Column('gender_count', Integer, nullable=False)
 
     __table_args__ = (
@@ -1,7 +1,7 @@
 import datetime
 
 from sqlalchemy import Column, Integer, String, Date, ForeignKey, SmallInteger, \
-    UnicodeText
+    UnicodeText, Index
 from sqlalchemy.ext.declarative import declared_attr
 from sqlalchemy.orm import relationship
 
@@ -272,28 +272,40 @@ class ParticipantSummary(ModelMixin, BaseModel):
         return Column('site_id', Integer, ForeignKey('site.site_id'))
 
 
-# Index('participant_summary_biobank_id', ParticipantSummary.biobankId)
-# Index('participant_summary_ln_dob', ParticipantSummary.lastName,
-#       ParticipantSummary.dateOfBirth)
-# Index('participant_summary_ln_dob_zip', ParticipantSummary.lastName,
-#       ParticipantSummary.dateOfBirth, ParticipantSummary.zipCode)
-# Index('participant_summary_ln_dob_fn', ParticipantSummary.lastName,
-#       ParticipantSummary.dateOfBirth, ParticipantSummary.firstName)
-# Index('participant_summary_hpo', ParticipantSummary.hpoId)
-# Index('participant_summary_hpo_fn', ParticipantSummary.hpoId, ParticipantSummary.firstName)
-# Index('participant_summary_hpo_ln', ParticipantSummary.hpoId, ParticipantSummary.lastName)
-# Index('participant_summary_hpo_dob', ParticipantSummary.hpoId, ParticipantSummary.dateOfBirth)
-# Index('participant_summary_hpo_race', ParticipantSummary.hpoId, ParticipantSummary.race)
-# Index('participant_summary_hpo_zip', ParticipantSummary.hpoId, ParticipantSummary.zipCode)
-# Index('participant_summary_hpo_status', ParticipantSummary.hpoId,
-#       ParticipantSummary.enrollmentStatus)
-# Index('participant_summary_hpo_consent', ParticipantSummary.hpoId,
-#       ParticipantSummary.consentForStudyEnrollment)
-# Index('participant_summary_hpo_num_baseline_ppi', ParticipantSummary.hpoId,
-#       ParticipantSummary.numCompletedBaselinePPIModules)
-# Index('participant_summary_hpo_num_baseline_samples', ParticipantSummary.hpoId,
-#       ParticipantSummary.numBaselineSamplesArrived)
-# Index('participant_summary_hpo_withdrawal_status_time', ParticipantSummary.hpoId,
-#       ParticipantSummary.withdrawalStatus, ParticipantSummary.withdrawalTime)
-# Index('participant_summary_last_modified', ParticipantSummary.hpoId,
-#       ParticipantSummary.lastModified)
+Index('participant_summary_biobank_id', ParticipantSummary.biobankId)
+Index('participant_summary_ln_dob', ParticipantSummary.lastName,
+      ParticipantSummary.dateOfBirth)
+Index('participant_summary_ln_dob_zip', ParticipantSummary.lastName,
+      ParticipantSummary.dateOfBirth, ParticipantSummary.zipCode)
+Index('participant_summary_ln_dob_fn', ParticipantSummary.lastName,
+      ParticipantSummary.dateOfBirth, ParticipantSummary.firstName)
+Index('participant_summary_hpo', ParticipantSummary.hpoId)
+Index('participant_summary_hpo_fn', ParticipantSummary.hpoId, ParticipantSummary.firstName)
+Index('participant_summary_hpo_ln', ParticipantSummary.hpoId, ParticipantSummary.lastName)
+Index('participant_summary_hpo_dob', ParticipantSummary.hpoId, ParticipantSummary.dateOfBirth)
+Index('participant_summary_hpo_race', ParticipantSummary.hpoId, ParticipantSummary.race)
+Index('participant_summary_hpo_zip', ParticipantSummary.hpoId, ParticipantSummary.zipCode)
+Index('participant_summary_hpo_status', ParticipantSummary.hpoId,
+      ParticipantSummary.enrollmentStatus)
+Index('participant_summary_hpo_consent', ParticipantSummary.hpoId,
+      ParticipantSummary.consentForStudyEnrollment)
+Index('participant_summary_hpo_num_baseline_ppi', ParticipantSummary.hpoId,
+      ParticipantSummary.numCompletedBaselinePPIModules)
+Index('participant_summary_hpo_num_baseline_samples', ParticipantSummary.hpoId,
+      ParticipantSummary.numBaselineSamplesArrived)
+Index('participant_summary_hpo_withdrawal_status_time', ParticipantSummary.hpoId,
+      ParticipantSummary.withdrawalStatus, ParticipantSummary.withdrawalTime)
+Index('participant_summary_last_modified', ParticipantSummary.hpoId,
+      ParticipantSummary.lastModified)
+
+
+class ParticipantSummaryQueue(ModelMixin, BaseModel):
+    """Participants whose summary needs to be recomputed. A row is added whenever a source table of the
+    summary is written for the participant and removed once the summary has been recomputed, so a
+    participant can be in the queue more than once."""
+    __tablename__ = 'participant_summary_queue'
+
+    participantId = Column('participant_id', String(20), nullable=False)
+
+
+Index('participant_summary_queue_participant_id', ParticipantSummaryQueue.participantId)
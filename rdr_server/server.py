@@ -15,6 +15,8 @@ from flask_restplus import Api, Resource
 from rdr_server.api.hello_world import api as ns1
 from rdr_server.api.internal import api as ns2
 from rdr_server.api.calendar import api as ns3
+from rdr_server.api.participant_summary import api as ns4
+from rdr_server.api.metrics import api as ns5
 
 # If `entrypoint` is not defined in app.yaml, App Engine will look for an app
 # called `app` in `main.py`.
@@ -26,6 +28,8 @@ api = Api(app, version='0.1', title='A good test', description='A simple API tes
 api.add_namespace(ns1)
 api.add_namespace(ns2)
 api.add_namespace(ns3)
+api.add_namespace(ns4)
+api.add_namespace(ns5)
 
 
 
@@ -0,0 +1,141 @@
+#
+# This file is subject to the terms and conditions defined in the
+# file 'LICENSE', which is part of this source code package.
+#
+
+from datetime import date, datetime
+from unittest import mock
+
+from rdr_server.common.enums import EnrollmentStatus
+from rdr_server.dao import base_dao
+from rdr_server.dao.base_dao import BaseDao, decode_watermark, encode_watermark
+from rdr_server.dao.exceptions import RecordNotFoundError
+from rdr_server.model.calendar import Calendar
+from rdr_server.tests.database_test_case import DatabaseTestCase
+
+
+class BulkWriteTest(DatabaseTestCase):
+
+    def setUp(self):
+        super(BulkWriteTest, self).setUp()
+        self.dao = BaseDao(Calendar)
+
+    def _get_days(self):
+        with self.session() as session:
+            return [(row.pkId, row.day, row.enrollmentStatus) for row in
+                    self.dao.get_query(session).order_by(Calendar.pkId)]
+
+    def test_bulk_insert_id_order(self):
+        # Records with a pkId are written in a separate statement from the records without one. Only
+        # the ids set by the caller are returned, in item order.
+        items = [Calendar(day=date(2019, 1, 1)), {'pkId': 10, 'day': date(2019, 1, 2)},
+                 {'day': date(2019, 1, 3)}, Calendar(pkId=20, day=date(2019, 1, 4))]
+        pk_ids = self.dao.bulk_insert(items, batch_size=2)
+        self.assertEqual([None, 10, None, 20], pk_ids)
+        self.assertEqual([(1, date(2019, 1, 1)), (10, date(2019, 1, 2)), (11, date(2019, 1, 3)),
+                          (20, date(2019, 1, 4))], [row[:2] for row in self._get_days()])
+
+    def test_bulk_upsert_update(self):
+        self.dao.bulk_insert([{'day': date(2019, 1, 1), 'enrollmentStatus': EnrollmentStatus.INTERESTED}])
+        # The first record matches the unique day of the existing record.
+        self.dao.bulk_upsert([{'day': date(2019, 1, 1), 'enrollmentStatus': EnrollmentStatus.MEMBER},
+                              {'day': date(2019, 1, 2), 'enrollmentStatus': EnrollmentStatus.INTERESTED}])
+        self.assertEqual([(1, date(2019, 1, 1), EnrollmentStatus.MEMBER),
+                          (2, date(2019, 1, 2), EnrollmentStatus.INTERESTED)], self._get_days())
+
+    def test_bulk_upsert_ignore(self):
+        self.dao.bulk_insert([{'day': date(2019, 1, 1), 'enrollmentStatus': EnrollmentStatus.INTERESTED}])
+        # Records with only a primary key have nothing to update, existing records are left as is.
+        self.dao.bulk_upsert([{'pkId': 1}, {'pkId': 2}])
+        self.assertEqual([(1, date(2019, 1, 1), EnrollmentStatus.INTERESTED), (2, None, None)],
+                         self._get_days())
+
+
+class CountTest(DatabaseTestCase):
+
+    def setUp(self):
+        super(CountTest, self).setUp()
+        patcher = mock.patch.dict(base_dao._count_cache, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.dao = BaseDao(Calendar)
+        self.dao.bulk_insert([{'day': date(2019, 1, 1)}, {'day': date(2019, 1, 2)}])
+
+    def test_cached_count(self):
+        with mock.patch.object(base_dao.time, 'monotonic', return_value=1000.0) as monotonic:
+            self.assertEqual(2, self.dao.cached_count(ttl=60))
+            self.dao.bulk_insert([{'day': date(2019, 1, 3)}])
+            self.assertEqual(3, self.dao.count())
+
+            # The stale count is returned until the ttl has passed.
+            monotonic.return_value = 1059.0
+            self.assertEqual(2, self.dao.cached_count(ttl=60))
+            monotonic.return_value = 1060.0
+            self.assertEqual(3, self.dao.cached_count(ttl=60))
+
+
+class DeleteByIdTest(DatabaseTestCase):
+
+    def test_delete_by_id(self):
+        dao = BaseDao(Calendar)
+        dao.bulk_insert([{'day': date(2019, 1, 1)}, {'day': date(2019, 1, 2)}])
+        self.assertEqual(1, dao.delete_by_id(1))
+        self.assertIsNone(dao.get_by_id(1))
+        self.assertEqual(date(2019, 1, 2), dao.get_by_id(2).day)
+
+        with self.assertRaises(RecordNotFoundError):
+            dao.delete_by_id(1)
+        with self.assertRaises(ValueError):
+            dao.delete_by_id(None)
+        self.assertEqual(1, dao.count())
+
+
+class ChangesSinceTest(DatabaseTestCase):
+
+    def setUp(self):
+        super(ChangesSinceTest, self).setUp()
+        self.dao = BaseDao(Calendar)
+        with self.session() as session:
+            for day, modified in ((1, datetime(2019, 1, 1, 12)), (2, datetime(2019, 1, 1, 12)),
+                                  (3, datetime(2019, 1, 2, 12))):
+                session.add(Calendar(pkId=day, day=date(2019, 1, day), modified=modified))
+            # Modified now, inside the settle time.
+            session.add(Calendar(pkId=4, day=date(2019, 1, 4)))
+
+    def _changes(self, since=None, limit=100):
+        data, watermark, more = self.dao.changes_since(since, limit)
+        return [row.pkId for row in data], watermark, more
+
+    def test_watermark(self):
+        watermark = encode_watermark(datetime(2019, 1, 1, 12, 0, 0, 500), 2)
+        self.assertEqual((datetime(2019, 1, 1, 12, 0, 0, 500), 2), decode_watermark(watermark))
+        self.assertEqual((datetime(2019, 1, 1, 12), 0), decode_watermark('2019-01-01T12:00:00'))
+        for watermark in ('not a watermark', encode_watermark(datetime(2019, 1, 1), 1)[:-4], 'YXw='):
+            with self.assertRaises(ValueError):
+                decode_watermark(watermark)
+
+    def test_changes_since(self):
+        # Records modified within the settle time are left for a later call.
+        pk_ids, watermark, more = self._changes()
+        self.assertEqual([1, 2, 3], pk_ids)
+        self.assertFalse(more)
+        self.assertEqual((datetime(2019, 1, 2, 12), 3), decode_watermark(watermark))
+        # The watermark is returned unchanged when there are no new records.
+        self.assertEqual(([], watermark, False), self._changes(watermark))
+
+    def test_limit(self):
+        # Records with the same modified time are split between calls by primary key id.
+        pk_ids, watermark, more = self._changes(limit=1)
+        self.assertEqual(([1], True), (pk_ids, more))
+        pk_ids, watermark, more = self._changes(watermark, limit=1)
+        self.assertEqual(([2], True), (pk_ids, more))
+        pk_ids, watermark, more = self._changes(watermark, limit=1)
+        self.assertEqual(([3], False), (pk_ids, more))
+
+        with self.assertRaises(ValueError):
+            self._changes(limit=0)
+
+    def test_timestamp_since(self):
+        # A timestamp includes the records modified at that time.
+        self.assertEqual([1, 2, 3], self._changes('2019-01-01T12:00:00')[0])
+        self.assertEqual([3], self._changes('2019-01-01T12:00:00.000001')[0])
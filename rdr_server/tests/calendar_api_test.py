@@ -0,0 +1,170 @@
+#
+# This file is subject to the terms and conditions defined in the
+# file 'LICENSE', which is part of this source code package.
+#
+
+import json
+from datetime import date, datetime
+from unittest import mock
+
+from rdr_server.api.calendar import CalendarApiBatchPost
+from rdr_server.dao import base_dao
+from rdr_server.dao.base_dao import BaseDao
+from rdr_server.model.calendar import Calendar
+from rdr_server.server import app
+from rdr_server.tests.database_test_case import DatabaseTestCase
+
+
+class CalendarApiTest(DatabaseTestCase):
+
+    def setUp(self):
+        super(CalendarApiTest, self).setUp()
+        self.client = app.test_client()
+
+    def _add_days(self, days):
+        BaseDao(Calendar).bulk_insert([{'day': date(2019, 1, day)} for day in range(1, days + 1)])
+
+    def test_list_pages(self):
+        self._add_days(5)
+        pk_ids = list()
+        tokens = list()
+        query_string = {'pageSize': 2}
+        while True:
+            response = self.client.get('/calendars/', query_string=query_string)
+            self.assertEqual(200, response.status_code)
+            pk_ids.extend(item['pkId'] for item in response.json['items'])
+            tokens.append(response.json['nextPageToken'])
+            if not tokens[-1]:
+                break
+            query_string['pageToken'] = tokens[-1]
+        self.assertEqual([1, 2, 3, 4, 5], pk_ids)
+        self.assertEqual(3, len(tokens))
+        self.assertIsNone(tokens[-1])
+
+        # A page ending on the last record has no next page.
+        response = self.client.get('/calendars/', query_string={'pageSize': 5})
+        self.assertEqual(5, len(response.json['items']))
+        self.assertIsNone(response.json['nextPageToken'])
+
+    def test_list_empty(self):
+        response = self.client.get('/calendars/')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual({'items': [], 'nextPageToken': None}, response.json)
+
+    def test_list_invalid_args(self):
+        for args in ({'pageSize': 'a'}, {'pageSize': 0}, {'pageSize': 1001}, {'pageToken': 'not a token'},
+                     {'pageToken': 'YQ=='}):
+            response = self.client.get('/calendars/', query_string=args)
+            self.assertEqual(400, response.status_code, args)
+
+    def test_stream(self):
+        self._add_days(3)
+        response = self.client.get('/calendars/', query_string={'stream': 'json'})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('application/json', response.mimetype)
+        items = json.loads(response.get_data(as_text=True))
+        self.assertEqual([1, 2, 3], [item['pkId'] for item in items])
+        self.assertEqual('2019-01-03', items[-1]['day'])
+
+        response = self.client.get('/calendars/', query_string={'stream': 'ndjson'})
+        self.assertEqual('application/x-ndjson', response.mimetype)
+        lines = response.get_data(as_text=True).splitlines()
+        self.assertEqual(items, [json.loads(line) for line in lines])
+
+        # The sync endpoint streams only the base fields.
+        response = self.client.get('/calendars/sync', query_string={'stream': 'ndjson'})
+        lines = response.get_data(as_text=True).splitlines()
+        self.assertEqual({'pkId', 'created', 'modified'}, set(json.loads(lines[0])))
+        self.assertEqual(3, len(lines))
+
+    def test_stream_empty(self):
+        response = self.client.get('/calendars/', query_string={'stream': 'json'})
+        self.assertEqual([], json.loads(response.get_data(as_text=True)))
+        response = self.client.get('/calendars/', query_string={'stream': 'ndjson'})
+        self.assertEqual('', response.get_data(as_text=True))
+
+    def test_stream_invalid_format(self):
+        response = self.client.get('/calendars/', query_string={'stream': 'xml'})
+        self.assertEqual(400, response.status_code)
+
+    def test_post_and_put_date(self):
+        response = self.client.post('/calendars/insert', json={'day': '2019-01-01', 'enrollmentStatus': 'MEMBER'})
+        self.assertEqual(201, response.status_code)
+        self.assertEqual('2019-01-01', response.json['day'])
+        self.assertEqual('MEMBER', response.json['enrollmentStatus'])
+        self.assertIsNotNone(response.json['created'])
+        pk_id = response.json['pkId']
+
+        response = self.client.put('/calendars/{0}/update'.format(pk_id), json={'day': '2019-01-02'})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(pk_id, response.json['pkId'])
+        self.assertEqual('2019-01-02', response.json['day'])
+        self.assertIsNone(response.json.get('enrollmentStatus'))
+        self.assertEqual(date(2019, 1, 2), BaseDao(Calendar).get_by_id(pk_id).day)
+
+    def test_invalid_date(self):
+        response = self.client.post('/calendars/insert', json={'day': 'not a date'})
+        self.assertEqual(400, response.status_code)
+
+    def test_put_missing_record(self):
+        response = self.client.put('/calendars/1/update', json={'day': '2019-01-02'})
+        self.assertEqual(404, response.status_code)
+
+    def test_count(self):
+        self._add_days(2)
+        response = self.client.get('/calendars/count')
+        self.assertEqual({'count': 2, 'mode': 'exact'}, response.json)
+
+        with mock.patch.dict(base_dao._count_cache, clear=True):
+            self.assertEqual({'count': 2, 'mode': 'cached'},
+                             self.client.get('/calendars/count', query_string={'mode': 'cached'}).json)
+            BaseDao(Calendar).bulk_insert([{'day': date(2019, 2, day)} for day in range(1, 4)])
+            self.assertEqual(2, self.client.get('/calendars/count', query_string={'mode': 'cached'}).json['count'])
+        self.assertEqual(5, self.client.get('/calendars/count', query_string={'mode': 'exact'}).json['count'])
+
+        response = self.client.get('/calendars/count', query_string={'mode': 'estimate'})
+        self.assertEqual(400, response.status_code)
+
+    def test_delete(self):
+        self._add_days(2)
+        response = self.client.delete('/calendars/1/delete')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual({'pkId': 1}, response.json)
+        self.assertIsNone(BaseDao(Calendar).get_by_id(1))
+
+        self.assertEqual(404, self.client.delete('/calendars/1/delete').status_code)
+        self.assertEqual(1, BaseDao(Calendar).count())
+
+    def test_batch_post(self):
+        # A batch size of 1 writes each record with its own statement, which also works on SQLite.
+        with mock.patch.object(CalendarApiBatchPost, 'batch_size', 1):
+            response = self.client.post('/calendars/batch', json=[
+                {'day': '2019-01-01', 'enrollmentStatus': 'MEMBER'},
+                # The server managed fields are ignored.
+                {'pkId': 99, 'created': '2000-01-01T00:00:00', 'day': '2019-01-02'}])
+        self.assertEqual(201, response.status_code)
+        self.assertEqual({'count': 2}, response.json)
+        rec = BaseDao(Calendar).get_by_id(2)
+        self.assertEqual(date(2019, 1, 2), rec.day)
+        self.assertNotEqual(2000, rec.created.year)
+
+    def test_batch_post_invalid(self):
+        for payload in ({'day': '2019-01-01'}, [{'day': '2019-01-01'}, 'a'], [{'day': 'not a date'}],
+                        [{'unknown': 1}]):
+            response = self.client.post('/calendars/batch', json=payload)
+            self.assertEqual(400, response.status_code)
+        self.assertEqual(0, BaseDao(Calendar).count())
+
+    def test_sync(self):
+        BaseDao(Calendar).insert(Calendar(day=date(2019, 1, 1), modified=datetime(2019, 1, 1)))
+        response = self.client.get('/calendars/sync', query_string={'since': '2018-12-31T00:00:00'})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual([1], [item['pkId'] for item in response.json['items']])
+        self.assertFalse(response.json['more'])
+
+        response = self.client.get('/calendars/sync', query_string={'since': response.json['nextWatermark']})
+        self.assertEqual([], response.json['items'])
+
+        for args in ({'since': 'not a watermark'}, {'limit': 'a'}, {'limit': 0}):
+            response = self.client.get('/calendars/sync', query_string=args)
+            self.assertEqual(400, response.status_code)
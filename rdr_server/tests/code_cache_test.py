@@ -0,0 +1,75 @@
+#
+# This file is subject to the terms and conditions defined in the
+# file 'LICENSE', which is part of this source code package.
+#
+
+from rdr_server.common.enums import CodeType
+from rdr_server.dao.code_cache import CodeCacheService, CodeInfo, CodeSnapshot
+from rdr_server.model.code import Code, CodeBook
+from rdr_server.tests.database_test_case import DatabaseTestCase
+
+SYSTEM = 'http://terminology.pmi-ops.org/CodeSystem/ppi'
+
+
+class CodeCacheTest(DatabaseTestCase):
+
+    def setUp(self):
+        super(CodeCacheTest, self).setUp()
+        self._add_code_book(1)
+        with self.session() as session:
+            for code_id, value, code_type, parent_id in ((1, 'TheBasics', CodeType.MODULE, None),
+                                                         (2, 'Race_WhatRaceEthnicity', CodeType.QUESTION, 1),
+                                                         (3, 'WhatRaceEthnicity_White', CodeType.ANSWER, 2),
+                                                         (4, 'WhatRaceEthnicity_Asian', CodeType.ANSWER, 2)):
+                session.add(Code(codeId=code_id, system=SYSTEM, value=value, codeType=code_type, mapped=True,
+                                 codeBookId=1, parentId=parent_id))
+        self.service = CodeCacheService(check_interval=0)
+
+    def _add_code_book(self, code_book_id):
+        with self.session() as session:
+            session.query(CodeBook).update({CodeBook.latest: False})
+            session.add(CodeBook(codeBookId=code_book_id, latest=True, name='ppi', system=SYSTEM,
+                                 version='v{0}'.format(code_book_id)))
+
+    def test_lookups(self):
+        snapshot = self.service.get()
+        self.assertEqual(4, len(snapshot))
+        self.assertEqual(1, snapshot.code_book_id)
+
+        # Values are matched case insensitively.
+        code = snapshot.find(SYSTEM, 'whatraceethnicity_white')
+        self.assertEqual(3, code.codeId)
+        self.assertIsNone(snapshot.find('other', 'WhatRaceEthnicity_White'))
+        self.assertIsNone(snapshot.find(SYSTEM, None))
+
+        self.assertEqual(['Race_WhatRaceEthnicity', 'TheBasics'],
+                         [parent.value for parent in snapshot.get_ancestors(code)])
+        self.assertEqual([3, 4], sorted(child.codeId for child in snapshot.get_children(snapshot.get(2))))
+        self.assertIsNone(snapshot.get_parent(snapshot.get(1)))
+        self.assertEqual((), snapshot.get_children(code))
+
+    def test_ancestors_with_cycle(self):
+        codes = [CodeInfo(1, SYSTEM, 'a', None, None, None, CodeType.QUESTION, True, 1, 2),
+                 CodeInfo(2, SYSTEM, 'b', None, None, None, CodeType.QUESTION, True, 1, 1)]
+        snapshot = CodeSnapshot(1, codes)
+        self.assertEqual([2, 1], [parent.codeId for parent in snapshot.get_ancestors(snapshot.get(1))])
+
+    def test_reload_on_new_code_book(self):
+        snapshot = self.service.get()
+        # The snapshot is kept while the latest code book is the same.
+        self.assertIs(snapshot, self.service.get())
+
+        with self.session() as session:
+            session.add(Code(codeId=5, system=SYSTEM, value='Lifestyle', codeType=CodeType.MODULE, mapped=True,
+                             codeBookId=1))
+        self.assertIsNone(self.service.get().get(5))
+
+        self._add_code_book(2)
+        snapshot = self.service.get()
+        self.assertEqual(2, snapshot.code_book_id)
+        self.assertEqual('Lifestyle', snapshot.get(5).value)
+
+    def test_invalidate(self):
+        snapshot = self.service.get()
+        self.service.invalidate()
+        self.assertIsNot(snapshot, self.service.get())
@@ -0,0 +1,151 @@
+#
+# This file is subject to the terms and conditions defined in the
+# file 'LICENSE', which is part of this source code package.
+#
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from rdr_server.dao import codebook_source
+from rdr_server.dao.codebook_source import CodeBookSourceError, FixtureDirCodeBookSource, \
+    HttpCodeBookSource, get_codebook_source
+from rdr_server.model.code import Code, CodeBook, CodeHistory
+from rdr_server.server import app
+from rdr_server.tests.database_test_case import DatabaseTestCase
+
+SYSTEM = 'http://terminology.pmi-ops.org/CodeSystem/ppi'
+
+
+def _codebook(version, display='The Basics'):
+    def concept(code, concept_type, children=()):
+        return {'code': code, 'display': display if code == 'TheBasics' else code,
+                'property': [{'code': 'concept-type', 'valueCode': concept_type}], 'concept': list(children)}
+
+    return {'url': SYSTEM, 'version': version, 'name': 'ppi', 'concept': [
+        concept('TheBasics', 'Module Name', [
+            concept('Race_WhatRaceEthnicity', 'Question', [concept('WhatRaceEthnicity_White', 'Answer')])])]}
+
+
+class CodeBookImportTest(DatabaseTestCase):
+
+    def setUp(self):
+        super(CodeBookImportTest, self).setUp()
+        self.client = app.test_client()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        patcher = mock.patch.dict(os.environ, {'CODEBOOK_SOURCE': self.directory})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _write_codebook(self, name, codebook):
+        with open(os.path.join(self.directory, name), 'w') as handle:
+            json.dump(codebook, handle)
+
+    def _import(self):
+        response = self.client.post('/internal/ImportCodeBook')
+        self.assertEqual(200, response.status_code)
+        return response.json
+
+    def _count(self, model):
+        with self.session() as session:
+            return session.query(model).count()
+
+    def test_import(self):
+        self._write_codebook('ppi-0.1.json', _codebook('0.1'))
+        result = self._import()
+        self.assertTrue(result['imported'])
+        self.assertEqual('0.1', result['active_version'])
+        self.assertEqual(3, result['inserted'])
+        self.assertEqual(3, self._count(CodeHistory))
+
+        # The last file by name is used, only the changed code is written.
+        self._write_codebook('ppi-0.2.json', _codebook('0.2', display='Basics'))
+        result = self._import()
+        self.assertEqual({'inserted': 0, 'updated': 1, 'unchanged': 2}, {key: result[key] for key in
+                                                                         ('inserted', 'updated', 'unchanged')})
+        self.assertEqual(3, self._count(Code))
+        self.assertEqual(4, self._count(CodeHistory))
+
+    def test_unchanged_source_skips_read(self):
+        self._write_codebook('ppi-0.1.json', _codebook('0.1'))
+        self._import()
+
+        # The stored fingerprint matches, so the code book is not read again.
+        with mock.patch.object(FixtureDirCodeBookSource, 'read', side_effect=AssertionError('read')):
+            result = self._import()
+        self.assertEqual({'published_version': '0.1', 'active_version': '0.1', 'imported': False}, result)
+        self.assertEqual(1, self._count(CodeBook))
+
+    def test_fingerprint_stored_for_imported_version(self):
+        # A version imported without a fingerprint gets one on the next import of the same content.
+        with self.session() as session:
+            session.add(CodeBook(codeBookId=1, latest=True, name='ppi', system=SYSTEM, version='0.1'))
+        self._write_codebook('ppi-0.1.json', _codebook('0.1'))
+        result = self._import()
+        self.assertFalse(result['imported'])
+        self.assertEqual(0, self._count(Code))
+
+        with self.session() as session:
+            content_hash = session.query(CodeBook.contentHash).scalar()
+        self.assertEqual(get_codebook_source().fingerprint(), content_hash)
+        with mock.patch.object(FixtureDirCodeBookSource, 'read', side_effect=AssertionError('read')):
+            self.assertFalse(self._import()['imported'])
+
+    def test_changed_content_same_version(self):
+        self._write_codebook('ppi-0.1.json', _codebook('0.1'))
+        self._import()
+        with self.session() as session:
+            content_hash = session.query(CodeBook.contentHash).scalar()
+
+        # A code book republished with new content under the same version is not imported and keeps the
+        # stored fingerprint, so the conflict is reported again by the next import.
+        self._write_codebook('ppi-0.1.json', _codebook('0.1', display='Basics'))
+        for _ in range(2):
+            response = self.client.post('/internal/ImportCodeBook')
+            self.assertEqual(409, response.status_code)
+        with self.session() as session:
+            self.assertEqual(content_hash, session.query(CodeBook.contentHash).scalar())
+            self.assertEqual('The Basics', session.query(Code.display).filter(Code.value == 'TheBasics').scalar())
+
+    def test_source_errors(self):
+        result = self._import()
+        self.assertIn('no code book files found', result['error_messages'][0]['error'])
+
+        self._write_codebook('ppi-0.1.json', {'url': SYSTEM})
+        response = self.client.post('/internal/ImportCodeBook')
+        self.assertEqual(400, response.status_code)
+
+
+class HttpCodeBookSourceTest(unittest.TestCase):
+
+    def _response(self, status_code=200, headers=None, content=b''):
+        return mock.Mock(status_code=status_code, headers=headers or dict(), content=content)
+
+    def test_etag_fingerprint(self):
+        source = HttpCodeBookSource('https://example.com/ppi.json')
+        with mock.patch.object(codebook_source.requests, 'head', return_value=self._response(
+                headers={'ETag': '"abc"'})), mock.patch.object(codebook_source.requests, 'get') as get:
+            self.assertEqual('etag:abc', source.fingerprint())
+        # The code book is only downloaded when it is read.
+        get.assert_not_called()
+
+    def test_hash_fingerprint(self):
+        # Without an ETag the code book is downloaded once, for both the hash and the read.
+        source = HttpCodeBookSource('https://example.com/ppi.json')
+        content = json.dumps(_codebook('0.1')).encode('utf-8')
+        with mock.patch.object(codebook_source.requests, 'head', return_value=self._response()), \
+                mock.patch.object(codebook_source.requests, 'get', return_value=self._response(
+                    content=content)) as get:
+            self.assertTrue(source.fingerprint().startswith('sha256:'))
+            self.assertEqual('0.1', source.read()['version'])
+        self.assertEqual(1, get.call_count)
+
+    def test_download_error(self):
+        source = HttpCodeBookSource('https://example.com/ppi.json')
+        with mock.patch.object(codebook_source.requests, 'get', return_value=self._response(status_code=404)):
+            with self.assertRaises(CodeBookSourceError):
+                source.read()
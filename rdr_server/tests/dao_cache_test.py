@@ -0,0 +1,122 @@
+#
+# This file is subject to the terms and conditions defined in the
+# file 'LICENSE', which is part of this source code package.
+#
+
+import unittest
+from datetime import datetime
+from unittest import mock
+
+from sqlalchemy import event
+
+from rdr_server.dao import base_dao, cache, hpo
+from rdr_server.dao.cache import LRUCache, cache_stats
+from rdr_server.dao.hpo import HPODao
+from rdr_server.model.hpo import HPO
+from rdr_server.tests.database_test_case import DatabaseTestCase
+
+
+class LRUCacheTest(unittest.TestCase):
+
+    def test_get_set(self):
+        cache = LRUCache('test_get_set', max_size=10, ttl=60)
+        self.assertIsNone(cache.get('a'))
+        cache.set('a', 1)
+        self.assertEqual(1, cache.get('a'))
+        cache.delete('a')
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(1, cache.stats()['hits'])
+        self.assertEqual(2, cache.stats()['misses'])
+
+    def test_lru_eviction(self):
+        cache = LRUCache('test_lru_eviction', max_size=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        # Using 'a' makes 'b' the least recently used value.
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(1, cache.get('a'))
+        self.assertEqual(3, cache.get('c'))
+        self.assertEqual(1, cache.stats()['evictions'])
+
+    def test_expire_and_renew(self):
+        cache = LRUCache('test_expire_and_renew', max_size=10, ttl=0)
+        cache.set('a', 1)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(1, cache.get_expired('a'))
+        cache.ttl = 60
+        cache.renew('a')
+        self.assertEqual(1, cache.get('a'))
+        self.assertEqual(1, cache.stats()['renewals'])
+
+    def test_cache_stats(self):
+        LRUCache('test_cache_stats')
+        self.assertIn('test_cache_stats', cache_stats())
+
+
+class CachedDaoTest(DatabaseTestCase):
+
+    def setUp(self):
+        super(CachedDaoTest, self).setUp()
+        self.now = 1000.0
+        for patcher in (mock.patch.object(hpo, '_cache', LRUCache('hpo_test', max_size=10, ttl=60)),
+                        mock.patch.object(cache.time, 'monotonic', side_effect=lambda: self.now)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        with self.session() as session:
+            session.add(HPO(hpoId=1, name='PITT', modified=datetime(2019, 1, 1)))
+        self.dao = HPODao()
+
+        self.statements = list()
+        engine = base_dao._database.get_engine()
+
+        def listener(conn, cursor, statement, *args):  # pylint: disable=unused-argument
+            self.statements.append(statement)
+
+        event.listen(engine, 'before_cursor_execute', listener)
+        self.addCleanup(event.remove, engine, 'before_cursor_execute', listener)
+
+    def _update(self, **values):
+        with self.session() as session:
+            session.query(HPO).filter(HPO.hpoId == 1).update(values)
+
+    def test_hit(self):
+        rec = self.dao.get_by_id(1)
+        self.assertEqual('PITT', rec.name)
+        self.assertEqual(1, len(self.statements))
+        # Hits don't query the database.
+        self.assertIs(rec, self.dao.get_by_id(1))
+        self.assertEqual(1, len(self.statements))
+
+    def test_renew_unchanged(self):
+        rec = self.dao.get_by_id(1)
+        self._update(name='Pittsburgh')
+        self.now += 60
+        del self.statements[:]
+
+        # The expired record is kept when modified is unchanged, after reading only that column.
+        self.assertIs(rec, self.dao.get_by_id(1))
+        self.assertEqual(1, len(self.statements))
+        self.assertNotIn('hpo.name', self.statements[0])
+        self.now += 59
+        self.assertIs(rec, self.dao.get_by_id(1))
+        self.assertEqual(1, len(self.statements))
+
+    def test_reload_changed(self):
+        rec = self.dao.get_by_id(1)
+        self._update(name='Pittsburgh', modified=datetime(2019, 1, 2))
+        # The changed record is only read once the cached record has expired.
+        self.assertIs(rec, self.dao.get_by_id(1))
+        self.now += 60
+        self.assertEqual('Pittsburgh', self.dao.get_by_id(1).name)
+
+    def test_missing_and_deleted(self):
+        self.assertIsNone(self.dao.get_by_id(2))
+        self.assertIsNone(self.dao.get_by_id(2))
+        self.assertEqual(2, len(self.statements))
+
+        self.dao.get_by_id(1)
+        self.dao.delete_by_id(1)
+        self.assertIsNone(self.dao.get_by_id(1))
@@ -0,0 +1,103 @@
+#
+# This file is subject to the terms and conditions defined in the
+# file 'LICENSE', which is part of this source code package.
+#
+
+import csv
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from rdr_server.common.enums import SuspensionStatus, WithdrawalStatus
+from rdr_server.dao.data_export import CsvPartWriter, DataExporter, ExportChunk
+from rdr_server.model.participant_summary import ParticipantSummary
+from rdr_server.tests.database_test_case import DatabaseTestCase
+
+TABLE = 'participant_summary'
+
+
+class DataExportTest(DatabaseTestCase):
+
+    def setUp(self):
+        super(DataExportTest, self).setUp()
+        self.output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output_dir)
+        self._add_summaries(*range(1, 8))
+        self.exporter = DataExporter(self.output_dir, chunk_size=3)
+
+    def _add_summaries(self, *pk_ids):
+        with self.session() as session:
+            for pk_id in pk_ids:
+                session.add(ParticipantSummary(pkId=pk_id, participantId='P{0}'.format(pk_id), biobankId=pk_id,
+                                               hpoId=2 - pk_id % 2, firstName='a', lastName='b',
+                                               withdrawalStatus=WithdrawalStatus.NOT_WITHDRAWN,
+                                               suspensionStatus=SuspensionStatus.NOT_SUSPENDED))
+
+    def _read_ids(self, partition):
+        directory = os.path.join(self.output_dir, TABLE, 'hpo_id={0}'.format(partition))
+        ids = list()
+        for name in sorted(os.listdir(directory)):
+            with open(os.path.join(directory, name), newline='') as handle:
+                ids.extend(int(row['id']) for row in csv.DictReader(handle))
+        return ids
+
+    def _list_files(self):
+        return sorted(os.path.relpath(os.path.join(path, name), self.output_dir)
+                      for path, _, names in os.walk(self.output_dir) for name in names)
+
+    def test_resume_from_chunk_markers(self):
+        chunks = self.exporter.get_chunks(TABLE)
+        self.assertEqual([ExportChunk(TABLE, 1, 3), ExportChunk(TABLE, 3, 6), ExportChunk(TABLE, 6, 8)], chunks)
+        self.assertEqual(2, self.exporter.export_chunk(chunks[0]))
+
+        # A new run only has the chunks without a marker.
+        chunks = DataExporter(self.output_dir, chunk_size=3).get_chunks(TABLE)
+        self.assertEqual([ExportChunk(TABLE, 3, 6), ExportChunk(TABLE, 6, 8)], chunks)
+        self.assertEqual([3, 2], [self.exporter.export_chunk(chunk) for chunk in chunks])
+        self.assertEqual([], self.exporter.get_chunks(TABLE))
+        self.assertEqual({TABLE: 0}, self.exporter.run([TABLE]))
+
+        self.assertEqual([1, 3, 5, 7], self._read_ids(1))
+        self.assertEqual([2, 4, 6], self._read_ids(2))
+        self.assertEqual([], [name for name in self._list_files() if name.endswith('.tmp')])
+
+        # The last chunk grows with new records and is exported again, replacing its files in every
+        # partition, including the old partition of a participant that moved to another HPO.
+        self._add_summaries(8)
+        with self.session() as session:
+            session.query(ParticipantSummary).filter(ParticipantSummary.pkId == 7).update({'hpoId': 2})
+        chunks = self.exporter.get_chunks(TABLE)
+        self.assertEqual([ExportChunk(TABLE, 6, 9)], chunks)
+        self.assertEqual(3, self.exporter.export_chunk(chunks[0]))
+        self.assertEqual([1, 3, 5], self._read_ids(1))
+        self.assertEqual([2, 4, 6, 7, 8], self._read_ids(2))
+
+    def test_failed_close_aborts_writers(self):
+        chunk = ExportChunk(TABLE, 3, 6)
+        with mock.patch.object(CsvPartWriter, 'close', autospec=True, side_effect=IOError('disk full')):
+            with self.assertRaises(IOError):
+                self.exporter.export_chunk(chunk)
+
+        # Both partitions are removed and the chunk is exported by the next run.
+        self.assertEqual([], self._list_files())
+        self.assertIn(chunk, self.exporter.get_chunks(TABLE))
+        self.assertEqual(3, self.exporter.export_chunk(chunk))
+        self.assertEqual([3, 5], self._read_ids(1))
+
+    def test_failed_abort_aborts_other_writers(self):
+        abort = CsvPartWriter.abort
+        aborted = list()
+
+        def abort_once(writer):
+            aborted.append(writer.path)
+            if len(aborted) == 1:
+                raise IOError('permission denied')
+            abort(writer)
+
+        with mock.patch.object(CsvPartWriter, 'close', autospec=True, side_effect=IOError('disk full')), \
+                mock.patch.object(CsvPartWriter, 'abort', autospec=True, side_effect=abort_once):
+            with self.assertRaises(IOError):
+                self.exporter.export_chunk(ExportChunk(TABLE, 3, 6))
+        self.assertEqual(2, len(aborted))
+        self.assertEqual([os.path.relpath(aborted[0], self.output_dir) + '.tmp'], self._list_files())
@@ -0,0 +1,89 @@
+#
+# This file is subject to the terms and conditions defined in the
+# file 'LICENSE', which is part of this source code package.
+#
+
+import unittest
+
+from sqlalchemy import event, BigInteger
+from sqlalchemy.dialects.mysql.dml import Insert as MySQLInsert, OnDuplicateClause
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.schema import CreateColumn
+from sqlalchemy.types import JSON
+
+from rdr_server.dao import base_dao
+from rdr_server.dao.base_dao import server_time_ago
+from rdr_server.model.base_model import BaseModel, BaseMetricsModel
+
+
+# SQLite has no BIGINT autoincrement, JSON, ON UPDATE CURRENT_TIMESTAMP, TIMESTAMPADD, INSERT IGNORE or
+# ON DUPLICATE KEY UPDATE, these are only used when the tests run against a SQLite database.
+@compiles(BigInteger, 'sqlite')
+def _compile_big_integer(element, compiler, **kw):
+    return 'INTEGER'
+
+
+@compiles(JSON, 'sqlite')
+def _compile_json(element, compiler, **kw):
+    return 'TEXT'
+
+
+@compiles(server_time_ago, 'sqlite')
+def _compile_server_time_ago(element, compiler, **kw):
+    return "DATETIME('now', (-({0})) || ' seconds')".format(compiler.process(element.clauses, **kw))
+
+
+@compiles(MySQLInsert, 'sqlite')
+def _compile_mysql_insert(element, compiler, **kw):
+    return compiler.visit_insert(element, **kw).replace('INSERT IGNORE ', 'INSERT OR IGNORE ', 1)
+
+
+@compiles(OnDuplicateClause, 'sqlite')
+def _compile_on_duplicate_clause(element, compiler, **kw):
+    columns = [column.name for column in compiler.statement.table.c if column.key in element.update]
+    return 'ON CONFLICT DO UPDATE SET ' + ', '.join('{0} = excluded.{0}'.format(name) for name in columns)
+
+
+@compiles(CreateColumn, 'sqlite')
+def _compile_create_column(element, compiler, **kw):
+    return compiler.visit_create_column(element, **kw).replace(' ON UPDATE CURRENT_TIMESTAMP', '')
+
+
+class DatabaseTestCase(unittest.TestCase):
+    """
+    Test case using the DAO database set with DB_CONNECTION_STRING. The tables are created before each
+    test and dropped after it, so the connection string must point to a scratch database. With a
+    'sqlite://' connection string the rdrv2 and metricsv2 schemas are in memory databases.
+    Tests are skipped when the database can't be reached.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        engine = base_dao._database.get_engine()
+        if engine.dialect.name == 'sqlite' and not event.contains(engine, 'connect', _attach_schemas):
+            event.listen(engine, 'connect', _attach_schemas)
+            # Connections opened before the listener was added don't have the schemas.
+            engine.dispose()
+        try:
+            engine.connect().close()
+        except DBAPIError as e:
+            raise unittest.SkipTest('database not available: {0}'.format(e))
+
+    def setUp(self):
+        engine = base_dao._database.get_engine()
+        BaseModel.metadata.create_all(engine)
+        BaseMetricsModel.metadata.create_all(engine)
+
+    def tearDown(self):
+        engine = base_dao._database.get_engine()
+        BaseMetricsModel.metadata.drop_all(engine)
+        BaseModel.metadata.drop_all(engine)
+
+    def session(self):
+        return base_dao._database.session()
+
+
+def _attach_schemas(dbapi_connection, connection_record):
+    for schema in ('rdrv2', 'metricsv2'):
+        dbapi_connection.execute("ATTACH DATABASE ':memory:' AS {0}".format(schema))
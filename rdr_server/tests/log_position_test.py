@@ -0,0 +1,106 @@
+#
+# This file is subject to the terms and conditions defined in the
+# file 'LICENSE', which is part of this source code package.
+#
+
+from datetime import datetime
+from unittest import mock
+
+from rdr_server.dao import log_position
+from rdr_server.dao.log_position import Change, ChangeLogService, LogPositionAllocator, LogPositionDao
+from rdr_server.model.biobank_order import BiobankOrder
+from rdr_server.model.log_position import LogPosition
+from rdr_server.model.measurements import PhysicalMeasurements
+from rdr_server.tests.database_test_case import DatabaseTestCase
+
+
+class LogPositionTest(DatabaseTestCase):
+
+    def setUp(self):
+        super(LogPositionTest, self).setUp()
+        self.dao = LogPositionDao()
+        # The tables are created again for every test, so the hook needs an allocator without a block.
+        patcher = mock.patch.object(log_position, '_allocator', LogPositionAllocator(block_size=3))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _settle(self):
+        """ Make every reserved block old enough for the change feed. """
+        with self.session() as session:
+            self.dao.get_query(session).update({LogPosition.created: datetime(2019, 1, 1)},
+                                               synchronize_session=False)
+
+    def _add_measurements(self, reason=None):
+        with self.session() as session:
+            measurements = PhysicalMeasurements(participantId='P1', resource=b'{}', final=True, reason=reason)
+            session.add(measurements)
+        return measurements
+
+    def test_reserve_block(self):
+        self.assertEqual(1, self.dao.reserve_block(3))
+        self.assertEqual(4, self.dao.reserve_block(2))
+        with self.session() as session:
+            rows = self.dao.get_query(session, [LogPosition.logPositionId, LogPosition.created]) \
+                .order_by(LogPosition.logPositionId).all()
+        self.assertEqual([1, 2, 3, 4, 5], [row[0] for row in rows])
+        # The reservation time is set by the database server.
+        self.assertTrue(all(row[1] for row in rows))
+
+    def test_allocator(self):
+        allocator = LogPositionAllocator(block_size=2, block_ttl=60)
+        self.assertEqual([1, 2, 3], [allocator.allocate() for _ in range(3)])
+
+        # An expired block is not used, the rest of its positions are skipped.
+        allocator = LogPositionAllocator(block_size=2, block_ttl=0)
+        self.assertEqual([5, 7], [allocator.allocate() for _ in range(2)])
+
+    def test_stamp_log_positions(self):
+        measurements = self._add_measurements()
+        with self.session() as session:
+            session.add(BiobankOrder(biobankOrderId='O1', participantId='P1', version=1))
+        self.assertEqual(1, measurements.logPositionId)
+
+        with self.session() as session:
+            measurements = session.query(PhysicalMeasurements).one()
+            measurements.reason = 'amended'
+        self.assertEqual(3, measurements.logPositionId)
+
+        # Setting a value without changing it doesn't use a position.
+        with self.session() as session:
+            measurements = session.query(PhysicalMeasurements).one()
+            measurements.reason = 'amended'
+        self.assertEqual(3, measurements.logPositionId)
+
+    def test_horizon(self):
+        self.dao.reserve_block(3)
+        self.assertEqual(0, self.dao.get_horizon(10))
+        self._settle()
+        self.dao.reserve_block(3)
+        self.assertEqual(3, self.dao.get_horizon(10))
+        # Positions reserved after the cutoff are in the horizon when the settle time is in the future.
+        self.assertEqual(6, self.dao.get_horizon(-60))
+
+    def test_changes_since(self):
+        first = self._add_measurements()
+        with self.session() as session:
+            order = BiobankOrder(biobankOrderId='O1', participantId='P1', version=1)
+            session.add(order)
+        second = self._add_measurements()
+        service = ChangeLogService(settle_time=10)
+        self.assertEqual((list(), 0), service.changes_since(0))
+
+        self._settle()
+        changes, position = service.changes_since(0, limit=2)
+        self.assertEqual([Change(1, 'physical_measurements', first.pkId), Change(2, 'biobank_order', order.pkId)],
+                         changes)
+        self.assertEqual(2, position)
+        changes, position = service.changes_since(position, limit=2)
+        self.assertEqual([Change(3, 'physical_measurements', second.pkId)], changes)
+        self.assertEqual(3, position)
+
+        # An update moves the record to a new position, which is returned once its block has settled.
+        with self.session() as session:
+            session.query(PhysicalMeasurements).filter(PhysicalMeasurements.pkId == first.pkId).one().final = False
+        self.assertEqual((list(), 3), service.changes_since(position))
+        self._settle()
+        self.assertEqual([Change(4, 'physical_measurements', first.pkId)], list(service.stream_changes(position)))
@@ -0,0 +1,62 @@
+#
+# This file is subject to the terms and conditions defined in the
+# file 'LICENSE', which is part of this source code package.
+#
+
+import json
+import unittest
+
+from rdr_server.common.metrics_bucket import aggregate_buckets, decode_bucket, encode_bucket, BucketView, \
+    METRIC_NAMES, FLAG_DENSE, FLAG_ZLIB
+
+
+class MetricsBucketTest(unittest.TestCase):
+
+    def test_sparse_round_trip(self):
+        metrics = {'Participant': 10, 'Participant.race.WHITE': 4, 'Participant.ageRange.18-25': 3}
+        payload = encode_bucket(metrics)
+        self.assertFalse(payload[3] & FLAG_DENSE)
+        self.assertEqual(metrics, decode_bucket(payload))
+
+    def test_dense_round_trip(self):
+        metrics = {name: index + 1 for index, name in enumerate(METRIC_NAMES)}
+        payload = encode_bucket(metrics)
+        self.assertTrue(payload[3] & FLAG_DENSE)
+        self.assertEqual(8 + len(METRIC_NAMES) * 4, len(payload))
+        self.assertEqual(metrics, decode_bucket(payload))
+
+    def test_compressed_round_trip(self):
+        metrics = {name: 1000 for name in METRIC_NAMES}
+        payload = encode_bucket(metrics, compress=True)
+        self.assertTrue(payload[3] & FLAG_ZLIB)
+        self.assertEqual(metrics, decode_bucket(payload))
+
+    def test_zero_counts_are_dropped(self):
+        payload = encode_bucket({'Participant': 0})
+        self.assertEqual(0, BucketView(payload).size)
+        self.assertEqual(dict(), decode_bucket(payload))
+
+    def test_invalid_metrics(self):
+        with self.assertRaises(ValueError):
+            encode_bucket({'Participant.unknown': 1})
+        with self.assertRaises(ValueError):
+            encode_bucket({'Participant': -1})
+        with self.assertRaises(ValueError):
+            BucketView(encode_bucket({'Participant': 1})[:-1])
+
+    def test_json_payload(self):
+        metrics = {'Participant': 2}
+        self.assertEqual(metrics, decode_bucket(json.dumps(metrics).encode('utf-8')))
+
+    def test_aggregate(self):
+        payloads = [
+            encode_bucket({'Participant': 3, 'Participant.race.ASIAN': 1}),
+            encode_bucket({name: 1 for name in METRIC_NAMES}, compress=True),
+            encode_bucket({'Participant': 5, 'Participant.ageRange.UNSET': 2}),
+        ]
+        totals = aggregate_buckets(payloads)
+        self.assertEqual(9, totals['Participant'])
+        self.assertEqual(2, totals['Participant.race.ASIAN'])
+        self.assertEqual(3, totals['Participant.ageRange.UNSET'])
+        self.assertEqual(1, totals['Participant.race.WHITE'])
+        self.assertEqual(len(METRIC_NAMES), len(totals))
@@ -0,0 +1,126 @@
+#
+# This file is subject to the terms and conditions defined in the
+# file 'LICENSE', which is part of this source code package.
+#
+
+import unittest
+from array import array
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+
+from rdr_server.dao.metrics_cache_reader import MetricsCacheReader, MetricSnapshot
+from rdr_server.model.metrics_cache import MetricsEnrollmentStatusCache, MetricsGenderCache
+from rdr_server.tests.database_test_case import DatabaseTestCase
+
+# Monday January 28th to Wednesday February 6th 2019.
+FIRST_DATE = date(2019, 1, 28)
+DAYS = 10
+
+
+class MetricSnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        self.snapshot = MetricSnapshot('test', FIRST_DATE, DAYS, {
+            '1': ('PITT', OrderedDict([('count', array('l', range(DAYS)))])),
+            '2': ('AZ_TUCSON', OrderedDict([('count', array('l', range(100, 100 + DAYS)))])),
+        })
+
+    def _series(self, start_date=None, end_date=None, period='day'):
+        items = self.snapshot.get_series(['1'], start_date, end_date, period)
+        return [(value['date'], value['values']['count']) for value in items[0]['data']]
+
+    def test_day(self):
+        self.assertEqual([((FIRST_DATE + timedelta(days=day)).isoformat(), day) for day in range(DAYS)],
+                         self._series())
+
+    def test_week(self):
+        # The second week is cut short by the end of the generation.
+        self.assertEqual([('2019-02-03', 6), ('2019-02-06', 9)], self._series(period='week'))
+        # A range ending on a Sunday doesn't repeat the last day.
+        self.assertEqual([('2019-02-03', 6)], self._series(end_date=date(2019, 2, 3), period='week'))
+        self.assertEqual([('2019-02-05', 8)],
+                         self._series(date(2019, 2, 4), date(2019, 2, 5), period='week'))
+
+    def test_month(self):
+        self.assertEqual([('2019-01-31', 3), ('2019-02-06', 9)], self._series(period='month'))
+        self.assertEqual([('2019-01-30', 2)], self._series(end_date=date(2019, 1, 30), period='month'))
+        self.assertEqual([('2019-02-02', 5)],
+                         self._series(date(2019, 2, 1), date(2019, 2, 2), period='month'))
+
+    def test_range_clipping(self):
+        self.assertEqual(self._series(), self._series(date(2019, 1, 1), date(2019, 3, 1)))
+        self.assertEqual([('2019-01-28', 0)], self._series(date(2019, 1, 1), date(2019, 1, 28)))
+        # Ranges outside the generation have no days.
+        self.assertEqual([], self._series(date(2019, 3, 1), date(2019, 3, 2)))
+        self.assertEqual([], self._series(date(2019, 1, 1), date(2019, 1, 2)))
+
+    def test_hpo_filter(self):
+        # All HPOs are returned in HPO name order.
+        self.assertEqual(['2', '1'], [item['hpoId'] for item in self.snapshot.get_series()])
+        items = self.snapshot.get_series(['2', '3'], end_date=FIRST_DATE)
+        self.assertEqual([{'hpoId': '2', 'hpoName': 'AZ_TUCSON',
+                           'data': [{'date': '2019-01-28', 'values': {'count': 100}}]}], items)
+
+    def test_invalid_period(self):
+        with self.assertRaises(ValueError):
+            self.snapshot.get_series(period='year')
+
+    def test_empty(self):
+        self.assertEqual([], MetricSnapshot('test', None, 0, dict()).get_series(period='week'))
+
+
+class MetricsCacheReaderTest(DatabaseTestCase):
+
+    def _add_generation(self, date_inserted, registered):
+        with self.session() as session:
+            for day in range(DAYS):
+                for hpo_id, hpo_name in (('1', 'PITT'), ('2', 'AZ_TUCSON')):
+                    session.add(MetricsEnrollmentStatusCache(
+                        dateInserted=date_inserted, hpoId=hpo_id, hpoName=hpo_name,
+                        date=FIRST_DATE + timedelta(days=day), registeredCount=registered + day, consentedCount=0,
+                        coreCount=0))
+                    for name in ('Woman', 'Man'):
+                        session.add(MetricsGenderCache(dateInserted=date_inserted, hpoId=hpo_id, hpoName=hpo_name,
+                                                       date=FIRST_DATE + timedelta(days=day), genderName=name,
+                                                       genderCount=day))
+
+    def test_get_metrics(self):
+        reader = MetricsCacheReader(check_interval=0)
+        self.assertEqual({'metric': 'enrollment', 'generation': None, 'period': 'day', 'items': []},
+                         reader.get_metrics('enrollment'))
+
+        self._add_generation(datetime(2019, 2, 7), 10)
+        response = reader.get_metrics('enrollment', ['1'], period='week')
+        self.assertEqual('2019-02-07T00:00:00', response['generation'])
+        self.assertEqual([{'date': '2019-02-03', 'values': {'registeredCount': 16, 'consentedCount': 0,
+                                                            'coreCount': 0}},
+                          {'date': '2019-02-06', 'values': {'registeredCount': 19, 'consentedCount': 0,
+                                                            'coreCount': 0}}],
+                         response['items'][0]['data'])
+
+        # Named metrics are ordered by name.
+        response = reader.get_metrics('gender', ['2'], end_date=FIRST_DATE)
+        self.assertEqual(['Man', 'Woman'], list(response['items'][0]['data'][0]['values']))
+
+    def test_response_cache(self):
+        reader = MetricsCacheReader(check_interval=0)
+        self._add_generation(datetime(2019, 2, 7), 10)
+        response = reader.get_metrics('enrollment', ['1', '2'], end_date=date(2019, 2, 1))
+        # The HPO ids are part of the key in any order, the other arguments are not interchangeable.
+        self.assertIs(response, reader.get_metrics('enrollment', ['2', '1', '1'], end_date=date(2019, 2, 1)))
+        self.assertIsNot(response, reader.get_metrics('enrollment', ['1', '2'], start_date=date(2019, 2, 1)))
+        self.assertIsNot(response, reader.get_metrics('enrollment', ['1', '2'], end_date=date(2019, 2, 1),
+                                                      period='week'))
+
+        # A new generation is read once it is the latest.
+        self._add_generation(datetime(2019, 2, 8), 20)
+        response = reader.get_metrics('enrollment', ['1', '2'], end_date=date(2019, 2, 1))
+        self.assertEqual('2019-02-08T00:00:00', response['generation'])
+        self.assertEqual(24, response['items'][1]['data'][-1]['values']['registeredCount'])
+
+    def test_invalid_arguments(self):
+        reader = MetricsCacheReader(check_interval=0)
+        for kwargs in ({'metric': 'weight'}, {'metric': 'age', 'period': 'year'},
+                       {'metric': 'age', 'start_date': date(2019, 2, 2), 'end_date': date(2019, 2, 1)}):
+            with self.assertRaises(ValueError):
+                reader.get_metrics(**kwargs)
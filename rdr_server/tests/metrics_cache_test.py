@@ -0,0 +1,159 @@
+#
+# This file is subject to the terms and conditions defined in the
+# file 'LICENSE', which is part of this source code package.
+#
+
+import unittest
+from datetime import date, datetime
+
+from sqlalchemy import select
+
+from rdr_server.common.enums import Race, SuspensionStatus, WithdrawalStatus
+from rdr_server.dao.base_dao import BaseDao
+from rdr_server.dao.metrics_cache import MetricsCacheAccumulator, MetricsCacheBuilder, ParticipantMetrics
+from rdr_server.model.hpo import HPO
+from rdr_server.model.metrics_cache import MetricsEnrollmentStatusCache
+from rdr_server.model.participant_summary import ParticipantSummary
+from rdr_server.tests.database_test_case import DatabaseTestCase
+
+
+def _participant(sign_up, member=None, core=None, race=Race.WHITE, date_of_birth=None, hpo_id=1):
+    return ParticipantMetrics(hpoId=hpo_id, signUpTime=sign_up, enrollmentStatusMemberTime=member,
+                              enrollmentStatusCoreStoredSampleTime=core, race=race, genderIdentityId=None,
+                              dateOfBirth=date_of_birth)
+
+
+class MetricsCacheAccumulatorTest(unittest.TestCase):
+
+    def setUp(self):
+        # Six days, January 1st to 6th.
+        self.accumulator = MetricsCacheAccumulator(date(2019, 1, 1), date(2019, 1, 6))
+
+    def _enrollment(self, counts):
+        return [counts.get(('enrollment', name), [0] * 6)
+                for name in ('registeredCount', 'consentedCount', 'coreCount')]
+
+    def test_enrollment_states(self):
+        self.accumulator.add(_participant(datetime(2019, 1, 2, 10), member=datetime(2019, 1, 3, 23),
+                                          core=datetime(2019, 1, 5)))
+        counts = self.accumulator.get_counts()[1]
+        self.assertEqual([[0, 1, 0, 0, 0, 0], [0, 0, 1, 1, 0, 0], [0, 0, 0, 0, 1, 1]], self._enrollment(counts))
+        self.assertEqual([0, 1, 1, 1, 1, 1], counts[('race', 'white')])
+        self.assertEqual([0, 1, 1, 1, 1, 1], counts[('gender', 'UNSET')])
+        self.assertEqual([0, 1, 1, 1, 1, 1], counts[('age', 'UNSET')])
+
+    def test_enrollment_state_clamping(self):
+        # Member before sign up counts as member from sign up, core before member as core from member.
+        self.accumulator.add(_participant(datetime(2019, 1, 3), member=datetime(2019, 1, 2),
+                                          core=datetime(2019, 1, 1)))
+        counts = self.accumulator.get_counts()[1]
+        self.assertEqual([[0] * 6, [0] * 6, [0, 0, 1, 1, 1, 1]], self._enrollment(counts))
+
+        # Core without a member time moves straight from registered to core.
+        self.accumulator.add(_participant(datetime(2019, 1, 1), core=datetime(2019, 1, 4), hpo_id=2))
+        counts = self.accumulator.get_counts()[2]
+        self.assertEqual([[1, 1, 1, 0, 0, 0], [0] * 6, [0, 0, 0, 1, 1, 1]], self._enrollment(counts))
+
+    def test_sign_up_before_start_and_after_end(self):
+        self.accumulator.add(_participant(datetime(2018, 12, 1), member=datetime(2019, 1, 8)))
+        self.accumulator.add(_participant(datetime(2019, 1, 9)))
+        self.accumulator.add(_participant(None))
+        counts = self.accumulator.get_counts()[1]
+        self.assertEqual([[1] * 6, [0] * 6, [0] * 6], self._enrollment(counts))
+
+    def test_age_bucket_transitions(self):
+        # One participant turns 18 on January 3rd, another turns 26 on January 5th.
+        self.accumulator.add(_participant(datetime(2019, 1, 1), date_of_birth=date(2001, 1, 3)))
+        self.accumulator.add(_participant(datetime(2019, 1, 2), date_of_birth=date(1993, 1, 5)))
+        self.accumulator.add(_participant(datetime(2019, 1, 1), date_of_birth=date(1919, 1, 1)))
+        counts = self.accumulator.get_counts()[1]
+        self.assertEqual([1, 1, 0, 0, 0, 0], counts[('age', '0-17')])
+        self.assertEqual([0, 1, 2, 2, 1, 1], counts[('age', '18-25')])
+        self.assertEqual([0, 0, 0, 0, 1, 1], counts[('age', '26-35')])
+        self.assertEqual([1] * 6, counts[('age', '86-')])
+
+    def test_leap_day_birthday(self):
+        accumulator = MetricsCacheAccumulator(date(2019, 2, 27), date(2019, 3, 2))
+        accumulator.add(_participant(datetime(2019, 2, 27), date_of_birth=date(2000, 2, 29)))
+        counts = accumulator.get_counts()[1]
+        self.assertEqual([1, 1, 1, 1], counts[('age', '18-25')])
+
+        # Birthdays on February 29th fall on March 1st in years without one.
+        accumulator = MetricsCacheAccumulator(date(2018, 2, 27), date(2018, 3, 2))
+        accumulator.add(_participant(datetime(2018, 2, 27), date_of_birth=date(2000, 2, 29)))
+        counts = accumulator.get_counts()[1]
+        self.assertEqual([1, 1, 0, 0], counts[('age', '0-17')])
+        self.assertEqual([0, 0, 1, 1], counts[('age', '18-25')])
+
+
+class MetricsCacheRefreshTest(DatabaseTestCase):
+
+    def setUp(self):
+        super(MetricsCacheRefreshTest, self).setUp()
+        self.dao = BaseDao(ParticipantSummary)
+        with self.session() as session:
+            for hpo_id in range(1, 6):
+                session.add(HPO(hpoId=hpo_id, name='HPO{0}'.format(hpo_id)))
+            for index, (hpo_id, sign_up, date_of_birth) in enumerate([
+                    (1, datetime(2019, 1, 1), date(1980, 5, 1)),
+                    (1, datetime(2019, 1, 3), None),
+                    (2, datetime(2019, 1, 2), date(1990, 1, 1)),
+                    (2, datetime(2019, 1, 4), date(1970, 1, 1)),
+                    (3, datetime(2019, 1, 5), None),
+                    # Turns 18 on January 12th, after the first generation.
+                    (4, datetime(2019, 1, 2), date(2001, 1, 12)),
+                    (5, datetime(2019, 1, 1), date(1960, 3, 1))]):
+                session.add(ParticipantSummary(
+                    participantId='P{0}'.format(index), biobankId=index, hpoId=hpo_id, firstName='a',
+                    lastName='b', signUpTime=sign_up, dateOfBirth=date_of_birth, race=Race.WHITE,
+                    lastModified=datetime(2019, 1, 1), withdrawalStatus=WithdrawalStatus.NOT_WITHDRAWN,
+                    suspensionStatus=SuspensionStatus.NOT_SUSPENDED))
+
+    def _update(self, participant_id, **values):
+        with self.session() as session:
+            self.dao.get_query(session).filter(ParticipantSummary.participantId == participant_id) \
+                .update(values, synchronize_session=False)
+
+    def _get_generation(self, date_inserted):
+        """ Return the records of every cache table in a generation, without the generation columns. """
+        records = dict()
+        with self.session() as session:
+            for model in MetricsCacheBuilder.CACHE_MODELS:
+                columns = [column for column in model.__table__.columns
+                           if column.name not in ('id', 'created', 'modified', 'date_inserted')]
+                rows = session.execute(select(columns).where(model.__table__.c.date_inserted == date_inserted))
+                records[model.__tablename__] = sorted(tuple(row) for row in rows)
+        return records
+
+    def _get_generations(self):
+        cache = MetricsEnrollmentStatusCache
+        with self.session() as session:
+            return [row[0] for row in session.query(cache.dateInserted).distinct().order_by(cache.dateInserted)]
+
+    def test_refresh_matches_build(self):
+        builder = MetricsCacheBuilder()
+        builder.build(end_date=date(2019, 1, 10))
+
+        # A modified participant, and a participant moved to another HPO without a lastModified change,
+        # which is found by the participant count check.
+        self._update('P1', enrollmentStatusMemberTime=datetime(2019, 1, 6), lastModified=datetime.utcnow())
+        self._update('P3', hpoId=3)
+
+        refreshed = builder.refresh(end_date=date(2019, 1, 14))
+        built = builder.build(end_date=date(2019, 1, 14))
+        self.assertEqual(built, refreshed)
+
+        first, refresh_generation, build_generation = self._get_generations()
+        expected = self._get_generation(build_generation)
+        self.assertEqual(expected, self._get_generation(refresh_generation))
+
+        # The birthday moved the HPO 4 participant to the next age bucket.
+        ages = [row for row in expected['metrics_age_cache'] if row[0] == '4' and row[2] == date(2019, 1, 12)]
+        self.assertEqual(['18-25'], [row[3] for row in ages if row[4]])
+
+    def test_refresh_without_changes(self):
+        builder = MetricsCacheBuilder()
+        builder.build(end_date=date(2019, 1, 10))
+        builder.refresh(end_date=date(2019, 1, 10))
+        first, refresh_generation = self._get_generations()
+        self.assertEqual(self._get_generation(first), self._get_generation(refresh_generation))
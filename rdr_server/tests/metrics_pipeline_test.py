@@ -0,0 +1,152 @@
+#
+# This file is subject to the terms and conditions defined in the
+# file 'LICENSE', which is part of this source code package.
+#
+
+import unittest
+from datetime import date, datetime
+
+from rdr_server.common.enums import Race, SuspensionStatus, WithdrawalStatus
+from rdr_server.common.metrics_bucket import decode_bucket
+from rdr_server.dao.base_dao import BaseDao
+from rdr_server.dao.metrics_pipeline import MetricsChangeAccumulator, MetricsPipeline, ParticipantMetrics, \
+    METRICS_FIELDS
+from rdr_server.model.metrics import MetricsBucket, MetricsShardBucket, MetricsVersion
+from rdr_server.model.participant_summary import ParticipantSummary
+from rdr_server.tests.database_test_case import DatabaseTestCase
+
+INTERESTED = 'Participant.enrollmentStatus.INTERESTED'
+MEMBER = 'Participant.enrollmentStatus.MEMBER'
+FULL_PARTICIPANT = 'Participant.enrollmentStatus.FULL_PARTICIPANT'
+
+
+def _participant(sign_up, member=None, core=None, hpo_id=1, date_of_birth=None):
+    values = dict.fromkeys(METRICS_FIELDS)
+    values.update(hpoId=hpo_id, signUpTime=sign_up, enrollmentStatusMemberTime=member,
+                  enrollmentStatusCoreStoredSampleTime=core, race=Race.WHITE, dateOfBirth=date_of_birth)
+    return ParticipantMetrics(**values)
+
+
+class MetricsChangeAccumulatorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.accumulator = MetricsChangeAccumulator(date(2019, 1, 10))
+
+    def _changes(self, changes, prefix='Participant.enrollmentStatus.'):
+        """ Return the changes of the metrics starting with a prefix, as (date, metric name) tuples. """
+        return sorted((day, name) for (hpo_id, day), counts in changes.items()
+                      for name in counts if name.startswith(prefix))
+
+    def test_added_and_removed_spans(self):
+        self.accumulator.add(_participant(datetime(2019, 1, 2, 10), member=datetime(2019, 1, 4, 23),
+                                          core=datetime(2019, 1, 6)))
+        self.assertEqual([(date(2019, 1, 2), INTERESTED), (date(2019, 1, 4), MEMBER),
+                          (date(2019, 1, 6), FULL_PARTICIPANT)], self._changes(self.accumulator.added))
+        # The last state is never removed.
+        self.assertEqual([(date(2019, 1, 4), INTERESTED), (date(2019, 1, 6), MEMBER)],
+                         self._changes(self.accumulator.removed))
+        self.assertEqual({'Participant': 1, INTERESTED: 1, 'Participant.race.WHITE': 1,
+                          'Participant.genderIdentity.UNSET': 1, 'Participant.ageRange.UNSET': 1,
+                          'Participant.physicalMeasurementsStatus.UNSET': 1,
+                          'Participant.samplesToIsolateDNA.UNSET': 1,
+                          'Participant.numCompletedBaselinePPIModules.0': 1,
+                          'Participant.consentForElectronicHealthRecords.UNSET': 1},
+                         self.accumulator.added[('1', date(2019, 1, 2))])
+
+    def test_same_day_states_collapse(self):
+        # Member and core on the sign up day only count the participant as core.
+        self.accumulator.add(_participant(datetime(2019, 1, 2, 8), member=datetime(2019, 1, 2, 9),
+                                          core=datetime(2019, 1, 2, 10)))
+        self.assertEqual([(date(2019, 1, 2), FULL_PARTICIPANT)], self._changes(self.accumulator.added))
+        self.assertEqual([], self._changes(self.accumulator.removed))
+
+        # A member time before sign up counts from the sign up day.
+        self.accumulator.add(_participant(datetime(2019, 1, 3), member=datetime(2019, 1, 1), hpo_id=2))
+        self.assertEqual({MEMBER: 1}, {name: count for name, count in self.accumulator.added[('2', date(2019, 1, 3))]
+                                       .items() if name.startswith('Participant.enrollmentStatus.')})
+
+    def test_end_date_clipping(self):
+        # The member time is after the end date, so the participant stays interested.
+        self.accumulator.add(_participant(datetime(2019, 1, 2), member=datetime(2019, 1, 11),
+                                          date_of_birth=date(2001, 1, 12)))
+        self.assertEqual([(date(2019, 1, 2), INTERESTED)], self._changes(self.accumulator.added))
+        self.assertEqual([], self._changes(self.accumulator.removed))
+        # Turns 18 after the end date.
+        self.assertEqual([(date(2019, 1, 2), 'Participant.ageRange.0-17')],
+                         self._changes(self.accumulator.added, 'Participant.ageRange.'))
+
+        # Participants signing up after the end date aren't counted.
+        self.accumulator.add(_participant(datetime(2019, 1, 11), hpo_id=2))
+        self.accumulator.add(_participant(None, hpo_id=2))
+        self.assertNotIn('2', [hpo_id for hpo_id, day in self.accumulator.added])
+
+    def test_unknown_value_counted_as_unset(self):
+        self.accumulator.add(_participant(datetime(2019, 1, 2)), gender='GenderIdentity_Unknown')
+        self.accumulator.add(_participant(datetime(2019, 1, 2)), gender='GenderIdentity_Woman')
+        self.assertEqual([(date(2019, 1, 2), 'Participant.genderIdentity.GenderIdentity_Woman'),
+                          (date(2019, 1, 2), 'Participant.genderIdentity.UNSET')],
+                         self._changes(self.accumulator.added, 'Participant.genderIdentity.'))
+        self.assertEqual({'Participant.genderIdentity.GenderIdentity_Unknown': 1}, dict(self.accumulator.unknown))
+
+        added = self.accumulator.added[('1', date(2019, 1, 2))]
+        genders = sum(count for name, count in added.items() if name.startswith('Participant.genderIdentity.'))
+        self.assertEqual(added['Participant'], genders)
+
+
+class MetricsPipelineTest(DatabaseTestCase):
+
+    def setUp(self):
+        super(MetricsPipelineTest, self).setUp()
+        self.dao = BaseDao(MetricsVersion)
+        with self.session() as session:
+            for index, (hpo_id, sign_up, member, core, withdrawal) in enumerate([
+                    (1, datetime(2019, 1, 1), datetime(2019, 1, 3), None, WithdrawalStatus.NOT_WITHDRAWN),
+                    (1, datetime(2019, 1, 2), None, None, WithdrawalStatus.NOT_WITHDRAWN),
+                    (2, datetime(2019, 1, 2), None, datetime(2019, 1, 4), WithdrawalStatus.NOT_WITHDRAWN),
+                    (2, datetime(2019, 1, 1), None, None, WithdrawalStatus.NO_USE)]):
+                session.add(ParticipantSummary(
+                    participantId='P{0}'.format(index), biobankId=index, hpoId=hpo_id, firstName='a',
+                    lastName='b', signUpTime=sign_up, enrollmentStatusMemberTime=member,
+                    enrollmentStatusCoreStoredSampleTime=core, race=Race.WHITE,
+                    withdrawalStatus=withdrawal, suspensionStatus=SuspensionStatus.NOT_SUSPENDED))
+
+    def _get_buckets(self, version_id):
+        with self.session() as session:
+            rows = self.dao.get_query(session, [MetricsBucket.hpoId, MetricsBucket.date, MetricsBucket.metrics]) \
+                .filter(MetricsBucket.metricsVersionId == version_id).all()
+        return {(hpo_id, day): decode_bucket(metrics) for hpo_id, day, metrics in rows}
+
+    def test_resume_and_merge(self):
+        end_date = date(2019, 1, 5)
+        pipeline = MetricsPipeline(shard_count=2)
+        version_id = pipeline.start_version().metricsVersionId
+        pipeline.compute_shard(version_id, 0, 2, end_date)
+
+        # A stopped pipeline resumes its version with the shards that are not complete.
+        self.assertEqual(version_id, pipeline.start_version().metricsVersionId)
+        self.assertEqual(([1], 2), pipeline.get_unfinished_shards(version_id))
+        pipeline.compute_shard(version_id, 1, 2, end_date)
+        self.assertEqual(([], 2), pipeline.get_unfinished_shards(version_id))
+
+        # Three HPO ids, including all HPOs, with a bucket for each of the five days.
+        self.assertEqual(15, pipeline.merge(version_id, end_date))
+        buckets = self._get_buckets(version_id)
+        self.assertEqual(15, len(buckets))
+
+        def enrollment(hpo_id, day):
+            counts = buckets[(hpo_id, date(2019, 1, day))]
+            return [counts.get(name, 0) for name in ('Participant', INTERESTED, MEMBER, FULL_PARTICIPANT)]
+
+        self.assertEqual([[1, 1, 0, 0], [2, 2, 0, 0], [2, 1, 1, 0], [2, 1, 1, 0], [2, 1, 1, 0]],
+                         [enrollment('1', day) for day in range(1, 6)])
+        # The withdrawn participant isn't counted.
+        self.assertEqual([[0, 0, 0, 0], [1, 1, 0, 0], [1, 1, 0, 0], [1, 0, 0, 1], [1, 0, 0, 1]],
+                         [enrollment('2', day) for day in range(1, 6)])
+        self.assertEqual([[1, 1, 0, 0], [3, 3, 0, 0], [3, 2, 1, 0], [3, 1, 1, 1], [3, 1, 1, 1]],
+                         [enrollment('', day) for day in range(1, 6)])
+
+        with self.session() as session:
+            version = self.dao.get_query(session).filter(MetricsVersion.metricsVersionId == version_id).one()
+            self.assertTrue(version.complete)
+            self.assertFalse(version.inProgress)
+            self.assertEqual(0, self.dao.get_query(session, MetricsShardBucket).count())
@@ -0,0 +1,99 @@
+#
+# This file is subject to the terms and conditions defined in the
+# file 'LICENSE', which is part of this source code package.
+#
+
+from datetime import datetime
+from unittest import mock
+
+from sqlalchemy.dialects import mysql
+
+from rdr_server.common.enums import PhysicalMeasurementsStatus, SuspensionStatus, WithdrawalStatus
+from rdr_server.dao import log_position
+from rdr_server.dao.log_position import LogPositionAllocator
+from rdr_server.dao.participant_summary_queue import enqueue_participants, ParticipantSummaryQueueWorker
+from rdr_server.model.biobank_order import BiobankOrder, BiobankOrderedSample
+from rdr_server.model.biobank_stored_sample import BiobankStoredSample
+from rdr_server.model.measurements import PhysicalMeasurements
+from rdr_server.model.participant import Participant
+from rdr_server.model.participant_summary import ParticipantSummary, ParticipantSummaryQueue
+from rdr_server.tests.database_test_case import DatabaseTestCase
+
+
+class ParticipantSummaryQueueTest(DatabaseTestCase):
+
+    def setUp(self):
+        super(ParticipantSummaryQueueTest, self).setUp()
+        patcher = mock.patch.object(log_position, '_allocator', LogPositionAllocator())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        with self.session() as session:
+            for participant_id, biobank_id in (('P1', 11), ('P2', 22)):
+                session.add(Participant(participantId=participant_id, biobankId=biobank_id, version=1, hpoId=1,
+                                        lastModified=datetime(2019, 1, 1), signUpTime=datetime(2019, 1, 1),
+                                        withdrawalStatus=WithdrawalStatus.NOT_WITHDRAWN,
+                                        suspensionStatus=SuspensionStatus.NOT_SUSPENDED))
+                session.add(ParticipantSummary(participantId=participant_id, biobankId=biobank_id, hpoId=1,
+                                               firstName='a', lastName='b',
+                                               withdrawalStatus=WithdrawalStatus.NOT_WITHDRAWN,
+                                               suspensionStatus=SuspensionStatus.NOT_SUSPENDED))
+
+    def _get_queue(self):
+        with self.session() as session:
+            return [row[0] for row in session.query(ParticipantSummaryQueue.participantId)
+                    .order_by(ParticipantSummaryQueue.pkId)]
+
+    def _enqueue(self, *participant_ids):
+        for participant_id in participant_ids:
+            with self.session() as session:
+                enqueue_participants(session, [participant_id])
+
+    def test_enqueue_on_flush(self):
+        with self.session() as session:
+            session.add(PhysicalMeasurements(participantId='P1', resource=b'{}', final=True))
+        # Stored samples are queued by biobank id.
+        with self.session() as session:
+            session.add(BiobankStoredSample(biobankStoredSampleId='S1', biobankId=22, biobankOrderIdentifier='I1',
+                                            test='1ED10'))
+        # Ordered samples are queued by the participant of their order.
+        with self.session() as session:
+            session.add(BiobankOrder(biobankOrderId='O1', participantId='P2', version=1))
+        with self.session() as session:
+            session.add(BiobankOrderedSample(biobankOrderId='O1', test='1ED10', description='a',
+                                             processingRequired=False))
+        self.assertEqual(['P1', 'P2', 'P2', 'P2'], self._get_queue())
+
+    def test_drain_coalesces_participants(self):
+        with self.session() as session:
+            session.add(PhysicalMeasurements(participantId='P1', resource=b'{}', final=True))
+        self._enqueue('P1', 'P2', 'P1')
+
+        result = ParticipantSummaryQueueWorker(batch_size=10).drain()
+        self.assertEqual(4, result['queued'])
+        # Each participant is recomputed once.
+        self.assertEqual(2, result['updated'] + result['unchanged'])
+        self.assertEqual(0, result['missing'])
+        self.assertEqual([], self._get_queue())
+
+        with self.session() as session:
+            status = session.query(ParticipantSummary.physicalMeasurementsStatus) \
+                .filter(ParticipantSummary.participantId == 'P1').scalar()
+        self.assertEqual(PhysicalMeasurementsStatus.COMPLETED, status)
+
+    def test_drain_max_batches(self):
+        self._enqueue('P1', 'P2', 'P3')
+        result = ParticipantSummaryQueueWorker(batch_size=1).drain(max_batches=2)
+        self.assertEqual(2, result['queued'])
+        self.assertEqual(['P3'], self._get_queue())
+
+        # Participants without a summary are removed from the queue.
+        result = ParticipantSummaryQueueWorker(batch_size=1).drain(max_batches=2)
+        self.assertEqual({'queued': 1, 'updated': 0, 'unchanged': 0, 'missing': 1}, result)
+        self.assertEqual([], self._get_queue())
+
+    def test_claim_skips_locked_rows(self):
+        statement = ParticipantSummaryQueueWorker(batch_size=5).claim_statement()
+        sql = ' '.join(str(statement.compile(dialect=mysql.dialect())).split())
+        self.assertTrue(sql.endswith('ORDER BY rdrv2.participant_summary_queue.id LIMIT %s FOR UPDATE SKIP LOCKED'),
+                        sql)
@@ -0,0 +1,160 @@
+#
+# This file is subject to the terms and conditions defined in the
+# file 'LICENSE', which is part of this source code package.
+#
+
+import unittest
+from collections import namedtuple
+from datetime import datetime
+from unittest import mock
+
+from rdr_server.common.code_constants import CONSENT_FOR_STUDY_ENROLLMENT_MODULE, \
+    CONSENT_FOR_ELECTRONIC_HEALTH_RECORDS_MODULE, OVERALL_HEALTH_PPI_MODULE, LIFESTYLE_PPI_MODULE, \
+    THE_BASICS_PPI_MODULE, FAMILY_HISTORY_MODULE
+from rdr_server.common.enums import BiobankOrderStatus, EnrollmentStatus, OrderStatus, \
+    PhysicalMeasurementsStatus, QuestionnaireStatus, SampleStatus
+from rdr_server.config import config
+from rdr_server.dao.participant_summary_recompute import compute_summary_fields, get_summary_config, \
+    ParticipantInfo, ParticipantSources, ParticipantSummaryRecomputer
+
+# The columns read from each source table by ParticipantSummaryRecomputer.load_sources().
+OrderedSample = namedtuple('OrderedSample', ['biobankOrderId', 'participantId', 'orderStatus', 'created',
+                                             'sourceSiteId', 'collectedSiteId', 'processedSiteId',
+                                             'finalizedSiteId', 'test', 'collected', 'processed', 'finalized'])
+StoredSample = namedtuple('StoredSample', ['biobankId', 'test', 'confirmed', 'status'])
+Measurements = namedtuple('Measurements', ['participantId', 'created', 'finalized', 'status', 'createdSiteId',
+                                           'finalizedSiteId'])
+Response = namedtuple('Response', ['participantId', 'created', 'module'])
+
+PARTICIPANT = ParticipantInfo(participantId=1, biobankId=11, hpoId=1, organizationId=None, siteId=None,
+                              signUpTime=datetime(2019, 1, 1), withdrawalStatus=None, withdrawalReason=None,
+                              withdrawalTime=None, withdrawalReasonJustification=None, suspensionStatus=None,
+                              suspensionTime=None)
+
+CONSENTS = [Response(1, datetime(2019, 1, 2), CONSENT_FOR_STUDY_ENROLLMENT_MODULE),
+            Response(1, datetime(2019, 1, 3), CONSENT_FOR_ELECTRONIC_HEALTH_RECORDS_MODULE)]
+BASELINE_PPI = [Response(1, datetime(2019, 1, 4), THE_BASICS_PPI_MODULE),
+                Response(1, datetime(2019, 1, 5), OVERALL_HEALTH_PPI_MODULE),
+                Response(1, datetime(2019, 1, 6), LIFESTYLE_PPI_MODULE)]
+MEASUREMENTS = [Measurements(1, datetime(2019, 1, 7), datetime(2019, 1, 7), PhysicalMeasurementsStatus.UNSET,
+                             None, None)]
+DNA_SAMPLE = [StoredSample(11, '1ED10', datetime(2019, 1, 8), None)]
+
+
+def _order(test, created, collected=None, processed=None, finalized=None, order_id='o1',
+           status=BiobankOrderStatus.UNSET):
+    return OrderedSample(order_id, 1, status, created, 1, 2, 3, 4, test, collected, processed, finalized)
+
+
+def _compute(ordered_samples=(), stored_samples=(), measurements=(), responses=(), summary_config=None):
+    return compute_summary_fields(ParticipantSources(PARTICIPANT, list(ordered_samples), list(stored_samples),
+                                                     list(measurements), list(responses)),
+                                  summary_config or get_summary_config())
+
+
+class ParticipantSummaryRecomputeTest(unittest.TestCase):
+
+    def test_config_override(self):
+        # Project config overrides are read when the recomputer is created.
+        with mock.patch.object(config.biobank, 'DNA_SAMPLE_TEST_CODES', ['1SAL']), \
+                mock.patch.object(config.survey, 'BASELINE_PPI_QUESTIONNAIRE_FIELDS', ['questionnaireOnTheBasics']):
+            summary_config = ParticipantSummaryRecomputer().summary_config
+        self.assertEqual(frozenset(['1SAL']), summary_config.dnaSampleTestCodes)
+        self.assertEqual(frozenset(config.biobank.BASELINE_SAMPLE_TEST_CODES), summary_config.baselineSampleTestCodes)
+
+        # 1ED10 is no longer a DNA sample, and only The Basics is needed for a full participant.
+        fields = _compute(stored_samples=DNA_SAMPLE, measurements=MEASUREMENTS, responses=CONSENTS + BASELINE_PPI[:1],
+                          summary_config=summary_config)
+        self.assertEqual(SampleStatus.UNSET, fields['samplesToIsolateDNA'])
+        self.assertEqual(EnrollmentStatus.MEMBER, fields['enrollmentStatus'])
+        fields = _compute(stored_samples=[StoredSample(11, '1SAL', datetime(2019, 1, 8), None)],
+                          measurements=MEASUREMENTS, responses=CONSENTS + BASELINE_PPI[:1],
+                          summary_config=summary_config)
+        self.assertEqual(EnrollmentStatus.FULL_PARTICIPANT, fields['enrollmentStatus'])
+        self.assertEqual(1, fields['numCompletedBaselinePPIModules'])
+
+    def test_interested(self):
+        fields = _compute()
+        self.assertEqual(EnrollmentStatus.INTERESTED, fields['enrollmentStatus'])
+        self.assertIsNone(fields['enrollmentStatusMemberTime'])
+        self.assertEqual(QuestionnaireStatus.UNSET, fields['consentForStudyEnrollment'])
+        self.assertEqual(SampleStatus.UNSET, fields['samplesToIsolateDNA'])
+        self.assertEqual(0, fields['numCompletedPPIModules'])
+        self.assertEqual(1, fields['hpoId'])
+        self.assertNotIn('participantId', fields)
+
+    def test_member_needs_both_consents(self):
+        fields = _compute(responses=CONSENTS[:1])
+        self.assertEqual(EnrollmentStatus.INTERESTED, fields['enrollmentStatus'])
+
+        fields = _compute(responses=CONSENTS)
+        self.assertEqual(EnrollmentStatus.MEMBER, fields['enrollmentStatus'])
+        self.assertEqual(datetime(2019, 1, 3), fields['enrollmentStatusMemberTime'])
+
+    def test_full_participant(self):
+        fields = _compute(stored_samples=DNA_SAMPLE, measurements=MEASUREMENTS, responses=CONSENTS + BASELINE_PPI,
+                          ordered_samples=[_order('1ED10', datetime(2019, 1, 1))])
+        self.assertEqual(EnrollmentStatus.FULL_PARTICIPANT, fields['enrollmentStatus'])
+        self.assertEqual(datetime(2019, 1, 3), fields['enrollmentStatusMemberTime'])
+        # The latest of the member, measurements, baseline questionnaire and sample times.
+        self.assertEqual(datetime(2019, 1, 8), fields['enrollmentStatusCoreStoredSampleTime'])
+        self.assertEqual(datetime(2019, 1, 7), fields['enrollmentStatusCoreOrderedSampleTime'])
+        self.assertEqual(SampleStatus.RECEIVED, fields['samplesToIsolateDNA'])
+
+    def test_full_participant_requirements(self):
+        # Each source missing in turn leaves the participant a member.
+        for sources in ({'measurements': MEASUREMENTS, 'responses': CONSENTS + BASELINE_PPI},
+                        {'stored_samples': DNA_SAMPLE, 'responses': CONSENTS + BASELINE_PPI},
+                        {'stored_samples': DNA_SAMPLE, 'measurements': MEASUREMENTS,
+                         'responses': CONSENTS + BASELINE_PPI[:2]}):
+            fields = _compute(**sources)
+            self.assertEqual(EnrollmentStatus.MEMBER, fields['enrollmentStatus'])
+            self.assertIsNone(fields['enrollmentStatusCoreStoredSampleTime'])
+
+        cancelled = [MEASUREMENTS[0]._replace(status=PhysicalMeasurementsStatus.CANCELLED)]
+        fields = _compute(stored_samples=DNA_SAMPLE, measurements=cancelled, responses=CONSENTS + BASELINE_PPI)
+        self.assertEqual(PhysicalMeasurementsStatus.CANCELLED, fields['physicalMeasurementsStatus'])
+        self.assertEqual(EnrollmentStatus.MEMBER, fields['enrollmentStatus'])
+
+    def test_stored_samples(self):
+        fields = _compute(stored_samples=[
+            StoredSample(11, '1SST8', datetime(2019, 1, 2), None),
+            StoredSample(11, '1SST8', datetime(2019, 1, 4), SampleStatus.DISPOSED),
+            StoredSample(11, '1SST8', datetime(2019, 1, 3), None),
+            StoredSample(11, '1PST8', None, None),
+            StoredSample(11, '1SAL', datetime(2019, 1, 5), None),
+        ])
+        # The status of the most recently confirmed sample, unconfirmed samples are ignored.
+        self.assertEqual(SampleStatus.DISPOSED, fields['sampleStatus1SST8'])
+        self.assertEqual(datetime(2019, 1, 4), fields['sampleStatus1SST8Time'])
+        self.assertEqual(SampleStatus.UNSET, fields['sampleStatus1PST8'])
+        # 1SAL is a DNA sample but not a baseline sample.
+        self.assertEqual(1, fields['numBaselineSamplesArrived'])
+        self.assertEqual(SampleStatus.RECEIVED, fields['samplesToIsolateDNA'])
+
+    def test_ordered_samples(self):
+        fields = _compute(ordered_samples=[
+            _order('1ED10', datetime(2019, 1, 1), collected=datetime(2019, 1, 2), processed=datetime(2019, 1, 3)),
+            _order('1SST8', datetime(2019, 1, 1)),
+            _order('1PST8', datetime(2019, 2, 1), finalized=datetime(2019, 2, 2), order_id='o2',
+                   status=BiobankOrderStatus.CANCELLED),
+        ])
+        self.assertEqual(OrderStatus.PROCESSED, fields['sampleOrderStatus1ED10'])
+        self.assertEqual(datetime(2019, 1, 3), fields['sampleOrderStatus1ED10Time'])
+        self.assertEqual(OrderStatus.CREATED, fields['sampleOrderStatus1SST8'])
+        # Cancelled orders are ignored.
+        self.assertEqual(OrderStatus.UNSET, fields['sampleOrderStatus1PST8'])
+        self.assertEqual(OrderStatus.PROCESSED, fields['biospecimenStatus'])
+        self.assertEqual(datetime(2019, 1, 1), fields['biospecimenOrderTime'])
+
+    def test_questionnaires(self):
+        fields = _compute(responses=BASELINE_PPI + [
+            Response(1, datetime(2019, 1, 2), THE_BASICS_PPI_MODULE),
+            Response(1, datetime(2019, 1, 9), FAMILY_HISTORY_MODULE),
+            Response(1, datetime(2019, 1, 9), 'UnknownModule'),
+        ])
+        self.assertEqual(QuestionnaireStatus.SUBMITTED, fields['questionnaireOnTheBasics'])
+        # The first response to a module sets its time.
+        self.assertEqual(datetime(2019, 1, 2), fields['questionnaireOnTheBasicsTime'])
+        self.assertEqual(3, fields['numCompletedBaselinePPIModules'])
+        self.assertEqual(4, fields['numCompletedPPIModules'])
@@ -0,0 +1,80 @@
+#
+# This file is subject to the terms and conditions defined in the
+# file 'LICENSE', which is part of this source code package.
+#
+
+import base64
+from unittest import mock
+
+from werkzeug.datastructures import MultiDict
+
+from rdr_server.common.enums import Race, SuspensionStatus, WithdrawalStatus
+from rdr_server.dao import reference_data
+from rdr_server.dao.participant_summary_search import ParticipantSummarySearch, parse_filter
+from rdr_server.dao.reference_data import ReferenceDataService
+from rdr_server.model.hpo import HPO
+from rdr_server.model.participant_summary import ParticipantSummary
+from rdr_server.tests.database_test_case import DatabaseTestCase
+
+
+class ParticipantSummarySearchTest(DatabaseTestCase):
+
+    def setUp(self):
+        super(ParticipantSummarySearchTest, self).setUp()
+        participants = [
+            ('P1', '11111', Race.WHITE, WithdrawalStatus.NOT_WITHDRAWN, SuspensionStatus.NOT_SUSPENDED),
+            ('P2', '22222', Race.ASIAN, WithdrawalStatus.NO_USE, SuspensionStatus.NOT_SUSPENDED),
+            ('P3', '33333', Race.ASIAN, WithdrawalStatus.NOT_WITHDRAWN, SuspensionStatus.NO_CONTACT),
+            ('P4', '44444', Race.WHITE, WithdrawalStatus.NOT_WITHDRAWN, SuspensionStatus.NOT_SUSPENDED),
+        ]
+        with self.session() as session:
+            for index, (participant_id, zip_code, race, withdrawal, suspension) in enumerate(participants):
+                session.add(ParticipantSummary(participantId=participant_id, biobankId=index, hpoId=1,
+                                               firstName='a', lastName='b', zipCode=zip_code, race=race,
+                                               withdrawalStatus=withdrawal, suspensionStatus=suspension))
+
+    def _search(self, filters, sort=None, fields=None):
+        search = ParticipantSummarySearch([parse_filter(field, value) for field, value in filters], sort=sort,
+                                          fields=fields)
+        items, tokens, token = list(), list(), None
+        while True:
+            page, token = search.execute(token, page_size=1)
+            items.extend(page)
+            if not token:
+                return items, tokens
+            tokens.append(base64.urlsafe_b64decode(token).decode('utf-8'))
+
+    def test_masked_fields_returned_as_null(self):
+        items, _ = self._search([('hpoId', '1')], fields=['participantId', 'race', 'zipCode'])
+        self.assertEqual([('P1', 'WHITE', '11111'), ('P2', None, None), ('P3', 'ASIAN', None),
+                          ('P4', 'WHITE', '44444')],
+                         [(item['participantId'], item['race'], item['zipCode']) for item in items])
+
+    def test_filter_on_masked_field(self):
+        items, _ = self._search([('hpoId', '1'), ('race', 'ASIAN')], fields=['participantId'])
+        # P2 is withdrawn, so its race can't be matched.
+        self.assertEqual(['P3'], [item['participantId'] for item in items])
+
+        items, _ = self._search([('hpoId', '1'), ('zipCode', '22222')], fields=['participantId'])
+        self.assertEqual([], items)
+        items, _ = self._search([('hpoId', '1'), ('zipCode', '33333')], fields=['participantId'])
+        self.assertEqual([], items)
+
+    def test_sort_on_masked_field(self):
+        items, tokens = self._search([('hpoId', '1')], sort='-zipCode', fields=['participantId', 'zipCode'])
+        self.assertEqual([('P4', '44444'), ('P1', '11111')],
+                         [(item['participantId'], item['zipCode']) for item in items])
+        # The page tokens only hold returned values.
+        self.assertEqual(1, len(tokens))
+        for value in ('22222', '33333'):
+            self.assertNotIn(value, tokens[0])
+
+    def test_awardee_filter(self):
+        with self.session() as session:
+            session.add(HPO(hpoId=1, name='PITT'))
+        with mock.patch.object(reference_data, '_service', ReferenceDataService()):
+            search = ParticipantSummarySearch.from_args(MultiDict([('awardee', 'PITT'), ('race', 'WHITE')]))
+            items, _ = search.execute()
+            self.assertEqual(['P1', 'P4'], [item['participantId'] for item in items])
+            with self.assertRaises(ValueError):
+                ParticipantSummarySearch.from_args(MultiDict([('awardee', 'AZ_TUCSON')]))
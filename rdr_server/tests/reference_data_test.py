@@ -0,0 +1,67 @@
+#
+# This file is subject to the terms and conditions defined in the
+# file 'LICENSE', which is part of this source code package.
+#
+
+from datetime import datetime
+
+from rdr_server.dao.reference_data import ReferenceDataService
+from rdr_server.model.hpo import HPO
+from rdr_server.model.organization import Organization
+from rdr_server.model.site import Site
+from rdr_server.tests.database_test_case import DatabaseTestCase
+
+
+class ReferenceDataTest(DatabaseTestCase):
+
+    def setUp(self):
+        super(ReferenceDataTest, self).setUp()
+        with self.session() as session:
+            session.add(HPO(hpoId=1, name='PITT', modified=datetime(2019, 1, 1, 12)))
+            session.add(HPO(hpoId=2, name='AZ_TUCSON', modified=datetime(2019, 1, 1, 12)))
+            for organization_id, external_id in ((1, 'PITT_UPMC'), (2, 'PITT_BANNER')):
+                session.add(Organization(organizationId=organization_id, externalId=external_id,
+                                         displayName=external_id, hpoId=1, modified=datetime(2019, 1, 1, 12)))
+            session.add(Site(siteId=1, siteName='Site 1', googleGroup='hpo-site-1', organizationId=1, hpoId=1,
+                             modified=datetime(2019, 1, 1, 12)))
+        self.service = ReferenceDataService(refresh_interval=60, settle_time=10)
+
+    def test_snapshot_lookups(self):
+        snapshot = self.service.get()
+        self.assertEqual(1, snapshot.get_hpo_by_name('PITT').hpoId)
+        self.assertIsNone(snapshot.get_hpo(3))
+        self.assertEqual(2, snapshot.get_organization_by_external_id('PITT_BANNER').organizationId)
+        self.assertEqual(1, snapshot.get_site_by_google_group('hpo-site-1').siteId)
+        self.assertEqual(['PITT_BANNER', 'PITT_UPMC'],
+                         [rec.externalId for rec in snapshot.organizations_by_hpo_id[1]])
+        self.assertEqual(['hpo-site-1'], [rec.googleGroup for rec in snapshot.sites_by_organization_id[1]])
+        # The snapshot is reused until the refresh interval has passed.
+        self.assertIs(snapshot, self.service.get())
+
+    def test_incremental_refresh(self):
+        snapshot = self.service.get()
+        with self.session() as session:
+            session.query(HPO).filter(HPO.hpoId == 2).update({HPO.displayName: 'Arizona',
+                                                              HPO.modified: datetime(2019, 1, 2)})
+            # An update committed after the refresh with a modified time before the newest loaded row.
+            session.query(HPO).filter(HPO.hpoId == 1).update({HPO.displayName: 'Pittsburgh',
+                                                              HPO.modified: datetime(2019, 1, 1, 11, 59, 55)})
+        self.service.refresh()
+
+        refreshed = self.service.get()
+        self.assertIsNot(snapshot, refreshed)
+        self.assertEqual('Arizona', refreshed.get_hpo(2).displayName)
+        self.assertEqual('Pittsburgh', refreshed.get_hpo(1).displayName)
+        self.assertEqual(snapshot.get_site(1), refreshed.get_site(1))
+
+    def test_deleted_rows_reload_table(self):
+        self.service.get()
+        with self.session() as session:
+            session.query(Site).delete()
+            session.query(Organization).filter(Organization.organizationId == 2).delete()
+        self.service.refresh()
+
+        snapshot = self.service.get()
+        self.assertIsNone(snapshot.get_site(1))
+        self.assertIsNone(snapshot.get_organization(2))
+        self.assertEqual(['PITT_UPMC'], [rec.externalId for rec in snapshot.organizations_by_hpo_id[1]])